@@ -1,29 +1,134 @@
-from flask import Flask
+from flask import Flask, g, jsonify, request
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager
 from app.routes.auth_routes import auth_bp
 from app.routes.project_routes import projects_bp
+from app.routes.job_routes import jobs_bp
+from app.compression import init_compression
+from app.config import MAX_CONTENT_LENGTH, RATE_LIMIT_AUTH, READ_YOUR_WRITES_SECONDS, WARMUP_ON_START
+from app.rate_limit import init_rate_limiting
+from app.postgresql_utils import minerva_last_write, UnitOfWork
+from app.deadlines import init_deadlines
+from app.lifecycle import warmup
+import math
 import os
 
+# Where the client carries the time of its last write, read from the header
+# first so clients that do not keep cookies can echo it back
+LAST_WRITE_COOKIE = "last_write"
+LAST_WRITE_HEADER = "X-Last-Write"
+
 
 def create_app():
     app = Flask(__name__)
 
     # Enable CORS
-    CORS(app, resources={r"/*": {"origins": "http://localhost:3000"}})
+    CORS(app, resources={r"/*": {"origins": "http://localhost:3000", "expose_headers": [LAST_WRITE_HEADER]}})
 
     app.config["JWT_SECRET_KEY"] = os.getenv("SECRET_KEY")
     JWTManager(app)
 
+    # Negotiate gzip/brotli compression on responses
+    init_compression(app)
+
+    # Refuse oversized request bodies; routes taking larger bodies raise
+    # their own limit with app.request_body.json_body
+    app.config["MAX_CONTENT_LENGTH"] = MAX_CONTENT_LENGTH
+
+    @app.errorhandler(413)
+    def request_too_large(e):
+        return jsonify({"error": "Request body too large"}), 413
+
+    # Token bucket budgets per IP and per user. Every auth endpoint shares
+    # the stricter auth budget since login and registration run bcrypt.
+    init_rate_limiting(app, blueprints={"auth": RATE_LIMIT_AUTH})
+
+    # Keep the client's reads on the primary right after it writes. The time
+    # of its last write travels with the client rather than staying in this
+    # process, so the pin holds whichever worker serves its next request.
+    @app.before_request
+    def bind_minerva_session():
+        try:
+            last_write = float(request.headers.get(LAST_WRITE_HEADER) or request.cookies.get(LAST_WRITE_COOKIE))
+        except (TypeError, ValueError):
+            last_write = None
+        g.last_write = last_write
+        g.minerva_session_token = minerva_last_write.set(last_write)
+
+    # Registered before the unit of work's hook so it runs after the commit
+    @app.after_request
+    def remember_last_write(response):
+        last_write = minerva_last_write.get()
+        if last_write is not None and last_write != g.get("last_write"):
+            response.headers[LAST_WRITE_HEADER] = f"{last_write:.3f}"
+            response.set_cookie(
+                LAST_WRITE_COOKIE,
+                f"{last_write:.3f}",
+                max_age=math.ceil(READ_YOUR_WRITES_SECONDS),
+                httponly=True,
+                samesite="Lax",
+            )
+        return response
+
+    @app.teardown_request
+    def unbind_minerva_session(error=None):
+        token = g.pop("minerva_session_token", None)
+        if token is not None:
+            try:
+                minerva_last_write.reset(token)
+            except ValueError:
+                # Streamed responses finish in a different context
+                minerva_last_write.set(None)
+
+    # Every Minerva cursor in a request shares one connection and
+    # transaction, committed once the response is known to be a success
+    @app.before_request
+    def begin_unit_of_work():
+        g.unit_of_work = UnitOfWork().begin()
+
+    @app.after_request
+    def commit_unit_of_work(response):
+        unit = g.get("unit_of_work")
+        if unit is not None:
+            try:
+                unit.finish(commit=response.status_code < 400)
+            except Exception as e:
+                print(f"Error committing the unit of work: {e}")
+                return jsonify({"error": "The changes could not be saved"}), 500
+        return response
+
+    @app.teardown_request
+    def end_unit_of_work(error=None):
+        unit = g.pop("unit_of_work", None)
+        if unit is not None:
+            try:
+                # Rolls back a request that failed before its response
+                unit.finish(commit=False)
+            except Exception as e:
+                print(f"Error rolling back the unit of work: {e}")
+            unit.end()
+
+    # Give each request a deadline that bounds its Minerva queries; the
+    # blueprints set their own request_timeout
+    init_deadlines(app)
+
     # Register the auth blueprint
     app.register_blueprint(auth_bp, url_prefix="/auth")
 
     # Register the projects blueprint
     app.register_blueprint(projects_bp, url_prefix="/projects")
 
+    # Register the background jobs blueprint
+    app.register_blueprint(jobs_bp, url_prefix="/jobs")
+
     # Example route for testing
     @app.route("/")
     def home():
         return "Welcome to PraetorAI!"
 
+    # Nothing connects to Minerva until a request needs it, unless asked to
+    # warm up front
+    if WARMUP_ON_START:
+        warmup(app)
+
     return app
@@ -0,0 +1,73 @@
+from app.config import (
+    ACCOUNT_DELETION_BATCH_SIZE,
+    ACCOUNT_DELETION_BATCH_PAUSE_MS,
+    ACCOUNT_DELETION_WORKERS,
+    ACCOUNT_DELETION_MAX_ATTEMPTS,
+    ACCOUNT_DELETION_RETRY_BACKOFF_SECONDS,
+    ACCOUNT_DELETION_QUEUE_SIZE,
+)
+from app.db_table_specs.minerva_account_specs import AccountDeletions
+from app.jobs import JobQueue
+import time
+
+
+def run_account_deletion(email: str, attempt: int) -> None:
+    """
+    Purges one account: claims it, deletes the user's projects a batch at a
+    time, pausing between batches so the purge does not crowd out other
+    writes, then deletes the user's row.
+
+    A failed attempt keeps the batches already deleted, so a retry picks up
+    where it left off.
+
+    :param email: the email of the user being deleted
+    :param attempt: which attempt this is, starting at 1
+    """
+    if AccountDeletions.claim(email) is None:
+        # Another worker already has it, or it finished
+        return
+
+    try:
+        if AccountDeletions.count_projects(email) > 0:
+            # A short batch means there was nothing left to delete
+            while AccountDeletions.purge_batch(email, ACCOUNT_DELETION_BATCH_SIZE) == ACCOUNT_DELETION_BATCH_SIZE:
+                time.sleep(ACCOUNT_DELETION_BATCH_PAUSE_MS / 1000)
+
+        AccountDeletions.delete_user(email)
+    except Exception as e:
+        # Put the purge back so the retry can claim it again
+        AccountDeletions.finish(email, AccountDeletions.PENDING, error=f"Attempt {attempt}: {e}")
+        raise
+
+
+def fail_account_deletion(email: str, error: Exception) -> None:
+    """
+    Marks a purge failed once it has used up its attempts. The user stays
+    pending deletion, so their account remains unusable.
+    """
+    AccountDeletions.finish(email, AccountDeletions.FAILED, error=str(error))
+
+
+# The per-process pool of account deletion workers
+account_deletion_queue = JobQueue(
+    "account_deletion",
+    run_account_deletion,
+    workers=ACCOUNT_DELETION_WORKERS,
+    max_attempts=ACCOUNT_DELETION_MAX_ATTEMPTS,
+    backoff_seconds=ACCOUNT_DELETION_RETRY_BACKOFF_SECONDS,
+    max_size=ACCOUNT_DELETION_QUEUE_SIZE,
+    on_failure=fail_account_deletion,
+)
+
+
+def resume_account_deletions() -> int:
+    """
+    Queues the purges left pending by a previous process or a full queue,
+    and the running purges of workers that died. Called on every sweep (see
+    app.lifecycle).
+    :return: the number of purges resumed
+    """
+    emails = AccountDeletions.select_unfinished()
+    for email in emails:
+        account_deletion_queue.submit(email)
+    return len(emails)
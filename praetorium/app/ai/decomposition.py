@@ -0,0 +1,90 @@
+from app.ai.providers import get_provider
+from app.config import (
+    DECOMPOSITION_WORKERS,
+    DECOMPOSITION_MAX_ATTEMPTS,
+    DECOMPOSITION_RETRY_BACKOFF_SECONDS,
+    DECOMPOSITION_QUEUE_SIZE,
+)
+from app.db_table_specs.minerva_jobs_specs import DecompositionJobs
+from app.db_table_specs.minerva_projects_specs import SavedProjects
+from app.project_storage import project_storage, project_writes
+from app.jobs import JobQueue
+import json
+
+
+def run_decomposition(job_id: int, attempt: int) -> None:
+    """
+    Runs one decomposition job: claims it, asks the provider for a new task
+    tree, writes the tree back into the project and records the result.
+
+    :param job_id: the job to run
+    :param attempt: which attempt this is, starting at 1
+    """
+    job = DecompositionJobs.claim(job_id)
+    if job is None:
+        # Another worker already has it, or it finished
+        return
+
+    try:
+        email = job[DecompositionJobs.EMAIL.raw]
+        project_id = job[DecompositionJobs.PROJECT_ID.raw]
+
+        # Coalesced edits waiting for the project are written first, so the
+        # provider sees them and none lands later on top of the new tree
+        project_writes.flush((email, project_id))
+        project = project_storage.select_many([project_id], email, read_only=False)[project_id]
+        if project is None:
+            raise DecompositionFailedException(f"Project {project_id} no longer exists")
+
+        tasks = get_provider().decompose(
+            project[SavedProjects.PROJECT_NAME.raw],
+            project[SavedProjects.PROJECT_DESCRIPTION.raw],
+            SavedProjects.load_tasks(project),
+        )
+
+        project_writes.flush((email, project_id))
+        project_storage.update(project_id, tasks=json.dumps(tasks), email=email)
+        DecompositionJobs.finish(job_id, DecompositionJobs.SUCCEEDED, result=tasks)
+    except Exception as e:
+        # Put the job back so the retry can claim it again
+        DecompositionJobs.finish(job_id, DecompositionJobs.QUEUED, error=f"Attempt {attempt}: {e}")
+        raise
+
+
+def fail_decomposition(job_id: int, error: Exception) -> None:
+    """
+    Marks a job failed once it has used up its attempts.
+    """
+    DecompositionJobs.finish(job_id, DecompositionJobs.FAILED, error=str(error))
+
+
+# The per-process pool of decomposition workers
+decomposition_queue = JobQueue(
+    "decomposition",
+    run_decomposition,
+    workers=DECOMPOSITION_WORKERS,
+    max_attempts=DECOMPOSITION_MAX_ATTEMPTS,
+    backoff_seconds=DECOMPOSITION_RETRY_BACKOFF_SECONDS,
+    max_size=DECOMPOSITION_QUEUE_SIZE,
+    on_failure=fail_decomposition,
+)
+
+
+def resume_queued_jobs() -> int:
+    """
+    Queues the jobs left waiting by a previous process or a full queue, and
+    the running jobs of workers that died.
+    :return: the number of jobs resumed
+    """
+    job_ids = DecompositionJobs.select_resumable()
+    for job_id in job_ids:
+        decomposition_queue.submit(job_id)
+    return len(job_ids)
+
+
+class DecompositionFailedException(Exception):
+    """
+    An exception for a decomposition job that cannot complete
+    """
+
+    pass
@@ -0,0 +1,246 @@
+from collections import OrderedDict
+from typing import Dict, Iterator, List, Optional, Tuple
+from app.ai.providers import TaskDecompositionProvider, get_provider
+from app.config import (
+    AI_CACHE_ENABLED,
+    AI_CACHE_MAX_ENTRIES,
+    AI_CACHE_TTL_SECONDS,
+    AI_CACHE_PERSIST,
+    AI_CACHE_SIMILARITY_THRESHOLD,
+)
+from app.db_table_specs.minerva_ai_specs import AIExpansionCache
+import copy
+import hashlib
+import math
+import re
+import threading
+import time
+import unicodedata
+
+# Dimensions of the hashed bag-of-words vectors used for similarity lookups
+EMBEDDING_DIMENSIONS = 512
+
+WORD = re.compile(r"[^\W_]+")
+
+
+def normalize_text(text: Optional[str]) -> str:
+    """
+    Folds case, accents, punctuation and whitespace so trivially different
+    phrasings of a task map to the same text.
+    """
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return " ".join(WORD.findall(text.casefold()))
+
+
+def task_text(task: dict, context: List[str]) -> Tuple[str, str, str]:
+    """
+    The normalized (name, description, parent) triple that identifies an
+    expansion. Only the immediate parent is used as context so the same task
+    under differently named projects still matches.
+    """
+    description = task.get("description") or task.get("task_description")
+    return (
+        normalize_text(task.get("name")),
+        normalize_text(description),
+        normalize_text(context[-1] if context else ""),
+    )
+
+
+def expansion_key(task: dict, context: List[str]) -> str:
+    """
+    The exact-match cache key for expanding task under context.
+    """
+    return hashlib.sha256("\x1f".join(task_text(task, context)).encode("utf-8")).hexdigest()
+
+
+def embed(text: str) -> Dict[int, float]:
+    """
+    A cheap local embedding: hashed word and word-bigram counts, L2
+    normalized. Good enough to match reworded or reordered task names
+    without a model.
+    """
+    words = text.split()
+    features = words + [f"{first} {second}" for first, second in zip(words, words[1:])]
+
+    vector = {}
+    for feature in features:
+        bucket = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=4).digest(), "big")
+        bucket %= EMBEDDING_DIMENSIONS
+        vector[bucket] = vector.get(bucket, 0.0) + 1.0
+
+    norm = math.sqrt(sum(value * value for value in vector.values())) or 1.0
+    return {bucket: value / norm for bucket, value in vector.items()}
+
+
+def cosine(first: Dict[int, float], second: Dict[int, float]) -> float:
+    """
+    Cosine similarity of two normalized sparse vectors.
+    """
+    if len(first) > len(second):
+        first, second = second, first
+    return sum(value * second.get(bucket, 0.0) for bucket, value in first.items())
+
+
+class CacheEntry:
+    def __init__(self, subtasks: List[dict], embedding: Optional[Dict[int, float]], expires_at: float):
+        self.subtasks = subtasks
+        self.embedding = embedding
+        self.expires_at = expires_at
+
+
+class ExpansionCache:
+    """
+    An LRU cache of AI expansions with a TTL, an optional similarity lookup
+    and optional persistence in Minerva.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = AI_CACHE_MAX_ENTRIES,
+        ttl_seconds: float = AI_CACHE_TTL_SECONDS,
+        similarity_threshold: float = AI_CACHE_SIMILARITY_THRESHOLD,
+        persist: bool = AI_CACHE_PERSIST,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.persist = persist
+        self.entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "similar_hits": 0, "persistent_hits": 0, "misses": 0, "evictions": 0}
+
+    def get(self, task: dict, context: List[str]) -> Optional[List[dict]]:
+        """
+        Looks up a cached expansion, trying the exact key, then similar
+        tasks, then Minerva.
+        :return: a copy of the cached subtasks, or None on a miss
+        """
+        key = expansion_key(task, context)
+        now = time.monotonic()
+
+        with self.lock:
+            entry = self._live_entry(key, now)
+            if entry is not None:
+                self.stats["hits"] += 1
+                return copy.deepcopy(entry.subtasks)
+
+            if self.similarity_threshold > 0:
+                entry = self._similar_entry(embed(" ".join(task_text(task, context))), now)
+                if entry is not None:
+                    self.stats["similar_hits"] += 1
+                    return copy.deepcopy(entry.subtasks)
+
+        if self.persist:
+            try:
+                subtasks = AIExpansionCache.select_one(key, self.ttl_seconds)
+            except Exception as e:
+                print(f"AI expansion cache lookup failed: {e}")
+                subtasks = None
+            if subtasks is not None:
+                self._remember(key, task, context, subtasks)
+                with self.lock:
+                    self.stats["persistent_hits"] += 1
+                return copy.deepcopy(subtasks)
+
+        with self.lock:
+            self.stats["misses"] += 1
+        return None
+
+    def put(self, task: dict, context: List[str], subtasks: List[dict]) -> None:
+        """
+        Caches the subtasks generated for task.
+        """
+        key = expansion_key(task, context)
+        self._remember(key, task, context, copy.deepcopy(subtasks))
+
+        if self.persist:
+            try:
+                AIExpansionCache.upsert_record(key, subtasks)
+            except Exception as e:
+                print(f"AI expansion cache write failed: {e}")
+
+    def report(self) -> dict:
+        """
+        Hit and miss counters plus the overall hit rate.
+        """
+        with self.lock:
+            hits = self.stats["hits"] + self.stats["similar_hits"] + self.stats["persistent_hits"]
+            lookups = hits + self.stats["misses"]
+            return {
+                **self.stats,
+                "entries": len(self.entries),
+                "hit_rate": hits / lookups if lookups else 0.0,
+            }
+
+    def _remember(self, key: str, task: dict, context: List[str], subtasks: List[dict]) -> None:
+        embedding = embed(" ".join(task_text(task, context))) if self.similarity_threshold > 0 else None
+        with self.lock:
+            self.entries[key] = CacheEntry(subtasks, embedding, time.monotonic() + self.ttl_seconds)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def _live_entry(self, key: str, now: float) -> Optional[CacheEntry]:
+        # Must be called with the lock held
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at <= now:
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return entry
+
+    def _similar_entry(self, embedding: Dict[int, float], now: float) -> Optional[CacheEntry]:
+        # Must be called with the lock held. A linear scan is fine at the
+        # few thousand entries an in-process cache holds.
+        best_key, best_score = None, self.similarity_threshold
+        for key, entry in self.entries.items():
+            if entry.embedding is None or entry.expires_at <= now:
+                continue
+            score = cosine(embedding, entry.embedding)
+            if score >= best_score:
+                best_key, best_score = key, score
+        return self._live_entry(best_key, now) if best_key is not None else None
+
+
+class CachingProvider(TaskDecompositionProvider):
+    """
+    Wraps a provider so repeated expansions are served from an
+    ExpansionCache. Whole-project decompositions pass straight through.
+    """
+
+    def __init__(self, provider: TaskDecompositionProvider, cache: ExpansionCache):
+        self.provider = provider
+        self.cache = cache
+
+    def decompose(self, project_name: str, project_description: str, tasks: List[dict]) -> List[dict]:
+        return self.provider.decompose(project_name, project_description, tasks)
+
+    def expand_task(self, task: dict, context: List[str]) -> Iterator[dict]:
+        cached = self.cache.get(task, context)
+        if cached is not None:
+            yield from cached
+            return
+
+        generated = []
+        for node in self.provider.expand_task(task, context):
+            generated.append(copy.deepcopy(node))
+            yield node
+
+        # Only a stream that ran to completion is worth caching
+        self.cache.put(task, context, generated)
+
+
+# The per-process expansion cache
+expansion_cache = ExpansionCache()
+
+
+def get_expansion_provider() -> TaskDecompositionProvider:
+    """
+    The configured provider, behind the expansion cache when it is enabled.
+    """
+    provider = get_provider()
+    return CachingProvider(provider, expansion_cache) if AI_CACHE_ENABLED else provider
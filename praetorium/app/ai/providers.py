@@ -0,0 +1,118 @@
+from abc import ABCMeta, abstractmethod
+from typing import Dict, Iterator, List, Optional, Type
+from app.config import AI_PROVIDER, AI_STUB_LATENCY_MS
+import copy
+import time
+
+
+class TaskDecompositionProvider(object, metaclass=ABCMeta):
+    """
+    The interface every AI backend implements. Providers receive and return
+    task trees in the shape the frontend stores: a list of nodes with name,
+    description, completed and nested tasks.
+    """
+
+    @abstractmethod
+    def decompose(self, project_name: str, project_description: str, tasks: List[dict]) -> List[dict]:
+        """
+        Breaks a project down into a more detailed task tree.
+
+        :param project_name: the name of the project
+        :param project_description: the description of the project
+        :param tasks: the project's current task tree
+        :return: the new task tree
+        """
+        pass
+
+    def expand_task(self, task: dict, context: List[str]) -> Iterator[dict]:
+        """
+        Generates subtasks for a single task, yielding each node as soon as
+        it is complete. Providers that can stream should override this; the
+        default waits for decompose() and yields its result.
+
+        :param task: the task node to expand
+        :param context: the names of the task's ancestors, outermost first
+        :return: an iterator of new child task nodes
+        """
+        leaf = {key: value for key, value in task.items() if key != "tasks"}
+        expanded = self.decompose(" / ".join(context) or task.get("name") or "", "", [leaf])
+        yield from expanded[0].get("tasks", [])
+
+
+class StubDecompositionProvider(TaskDecompositionProvider):
+    """
+    A deterministic, offline provider. The same input always produces the
+    same tree, so the whole pipeline can be tested and load-tested without a
+    model. An optional latency simulates a remote call.
+    """
+
+    PHASES = ("Plan", "Build", "Test", "Launch")
+    STEPS = ("Scope", "Implement", "Verify")
+
+    def __init__(self, latency_ms: int = AI_STUB_LATENCY_MS):
+        self.latency_ms = latency_ms
+
+    @classmethod
+    def node(cls, name: str, description: str) -> dict:
+        """
+        Builds a new, incomplete task node.
+        """
+        return {"name": name, "description": description, "completed": False, "tasks": []}
+
+    def decompose(self, project_name: str, project_description: str, tasks: List[dict]) -> List[dict]:
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+
+        # An empty project gets a top level plan
+        if not tasks:
+            return [
+                self.node(f"{phase} {project_name}", f"{phase} phase of: {project_description}")
+                for phase in self.PHASES
+            ]
+
+        # Otherwise every leaf task is broken into steps
+        tree = copy.deepcopy(tasks)
+        self._expand_leaves(tree)
+        return tree
+
+    def expand_task(self, task: dict, context: List[str]) -> Iterator[dict]:
+        name = task.get("name") or "Task"
+        for step in self.STEPS:
+            # Spread the latency across the nodes, as a streaming model would
+            if self.latency_ms:
+                time.sleep(self.latency_ms / 1000 / len(self.STEPS))
+            yield self.node(f"{step} {name}", f"{step} step of {name}")
+
+    def _expand_leaves(self, nodes: List[dict]) -> None:
+        for node in nodes:
+            if node.get("tasks"):
+                self._expand_leaves(node["tasks"])
+            else:
+                name = node.get("name") or "Task"
+                node["tasks"] = [self.node(f"{step} {name}", f"{step} step of {name}") for step in self.STEPS]
+
+
+# Providers selectable through the AI_PROVIDER setting
+PROVIDERS: Dict[str, Type[TaskDecompositionProvider]] = {
+    "stub": StubDecompositionProvider,
+}
+
+
+def get_provider(name: Optional[str] = None) -> TaskDecompositionProvider:
+    """
+    Instantiates the configured provider.
+    :param name: the provider to use, defaults to AI_PROVIDER
+    :raises UnknownProviderException: if no provider is registered under name
+    """
+    name = name or AI_PROVIDER
+    if name not in PROVIDERS:
+        raise UnknownProviderException(f"Unknown AI provider {name}")
+    return PROVIDERS[name]()
+
+
+class UnknownProviderException(Exception):
+    """
+    An exception for an AI provider name that is not registered
+    """
+
+    pass
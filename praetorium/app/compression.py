@@ -0,0 +1,166 @@
+from flask import Flask, Response, request
+from app.config import (
+    COMPRESSION_MIN_SIZE,
+    COMPRESSION_GZIP_LEVEL,
+    COMPRESSION_BROTLI_QUALITY,
+    COMPRESSION_MIMETYPES,
+    MAX_DECOMPRESSED_BODY_SIZE,
+)
+import gzip
+import zlib
+
+# Brotli is optional. Without it we only negotiate gzip.
+try:
+    import brotli
+except ImportError:  # pragma: no cover - depends on the environment
+    brotli = None
+
+# Whether brotli request bodies can be inflated a bounded amount at a time.
+# The output limit and can_accept_more_data arrived in brotli 1.2; an older
+# brotli still compresses responses, but br uploads are refused rather than
+# inflated in one unbounded call.
+BROTLI_BOUNDED = brotli is not None and hasattr(brotli.Decompressor, "can_accept_more_data")
+
+GZIP = "gzip"
+BROTLI = "br"
+IDENTITY = "identity"
+
+
+def supported_encodings() -> list:
+    """
+    Returns the content codings this process can produce, most preferred first.
+    """
+    return [BROTLI, GZIP] if brotli is not None else [GZIP]
+
+
+def choose_encoding(accept_encodings) -> str:
+    """
+    Picks the best content coding the client accepts.
+
+    :param accept_encodings: the werkzeug Accept object for Accept-Encoding
+    :return: "br", "gzip" or "identity"
+    """
+    best, best_quality = IDENTITY, 0
+    for encoding in supported_encodings():
+        quality = accept_encodings.quality(encoding)
+        # Strictly greater keeps our own preference order on ties
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    """
+    Compresses a payload with the given content coding.
+    """
+    if encoding == BROTLI:
+        return brotli.compress(data, quality=COMPRESSION_BROTLI_QUALITY)
+    if encoding == GZIP:
+        return gzip.compress(data, compresslevel=COMPRESSION_GZIP_LEVEL, mtime=0)
+    raise UnsupportedEncodingException(f"Cannot compress with {encoding}")
+
+
+def decompress(data: bytes, encoding: str, max_size: int = MAX_DECOMPRESSED_BODY_SIZE) -> bytes:
+    """
+    Decompresses a request body, refusing to inflate past max_size bytes.
+
+    :param data: the compressed bytes
+    :param encoding: the Content-Encoding of the body
+    :param max_size: the largest decompressed size accepted
+    :raises UnsupportedEncodingException: if the coding is unknown
+    :raises DecompressedBodyTooLargeException: if the body inflates past max_size
+    """
+    if encoding == GZIP:
+        # wbits=31 selects the gzip container
+        decompressor = zlib.decompressobj(wbits=31)
+        body = decompressor.decompress(data, max_size + 1)
+        if len(body) > max_size or decompressor.unconsumed_tail:
+            raise DecompressedBodyTooLargeException(f"Request body inflates past {max_size} bytes")
+        if not decompressor.eof:
+            raise MalformedCompressedBodyException("Request body is a truncated gzip stream")
+        return body
+
+    if encoding == BROTLI and BROTLI_BOUNDED:
+        decompressor = brotli.Decompressor()
+        chunks, size = [], 0
+        # The output limit keeps a small input from inflating far in one
+        # call, and whatever is left over is drained a limit at a time. The
+        # limit is only a hint, a call may return a little more, so max_size
+        # is enforced on the output actually collected.
+        chunk = decompressor.process(data, output_buffer_limit=max_size + 1)
+        while True:
+            chunks.append(chunk)
+            size += len(chunk)
+            if size > max_size:
+                raise DecompressedBodyTooLargeException(f"Request body inflates past {max_size} bytes")
+            if decompressor.is_finished() or decompressor.can_accept_more_data():
+                break
+            chunk = decompressor.process(b"", output_buffer_limit=max_size + 1 - size)
+        if not decompressor.is_finished():
+            raise MalformedCompressedBodyException("Request body is a truncated brotli stream")
+        return b"".join(chunks)
+
+    raise UnsupportedEncodingException(f"Unsupported Content-Encoding {encoding}")
+
+
+def compress_response(response: Response) -> Response:
+    """
+    An after_request hook that compresses eligible responses according to the
+    request's Accept-Encoding header.
+    """
+    if (
+        response.status_code < 200
+        or response.status_code in (204, 304)
+        or response.direct_passthrough
+        or response.is_streamed
+        or "Content-Encoding" in response.headers
+        or response.mimetype not in COMPRESSION_MIMETYPES
+    ):
+        return response
+
+    # Caches must key on Accept-Encoding whether or not this response is compressed
+    response.vary.add("Accept-Encoding")
+
+    data = response.get_data()
+    if len(data) < COMPRESSION_MIN_SIZE:
+        return response
+
+    encoding = choose_encoding(request.accept_encodings)
+    if encoding == IDENTITY:
+        return response
+
+    response.set_data(compress(data, encoding))
+    response.headers["Content-Encoding"] = encoding
+    return response
+
+
+def init_compression(app: Flask) -> None:
+    """
+    Enables negotiated response compression on the app.
+    """
+    app.after_request(compress_response)
+
+
+class UnsupportedEncodingException(Exception):
+    """
+    An exception for a content coding we cannot handle
+    """
+
+    pass
+
+
+class MalformedCompressedBodyException(Exception):
+    """
+    An exception for a compressed request body that ends before its stream
+    does
+    """
+
+    pass
+
+
+class DecompressedBodyTooLargeException(Exception):
+    """
+    An exception for a request body that inflates past the allowed size
+    """
+
+    pass
@@ -0,0 +1,287 @@
+from dotenv import load_dotenv
+import os
+
+load_dotenv()
+
+#############################
+# Response/request compression
+#############################
+
+# Responses smaller than this many bytes are sent uncompressed. Below roughly
+# one MTU the CPU cost outweighs the bytes saved.
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", 1024))
+
+# Levels are tuned for latency rather than ratio. Task trees are repetitive
+# enough that low levels already capture most of the gain.
+COMPRESSION_GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", 5))
+COMPRESSION_BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", 4))
+
+# Only these mimetypes are worth compressing
+COMPRESSION_MIMETYPES = {"application/json", "text/html", "text/plain", "text/css", "application/javascript"}
+
+# Upper bound on the size of a decompressed request body, guarding against
+# decompression bombs on the upload endpoints.
+MAX_DECOMPRESSED_BODY_SIZE = int(os.getenv("MAX_DECOMPRESSED_BODY_SIZE", 16 * 1024 * 1024))
+
+#############################
+# Request bodies
+#############################
+
+# The default limit on request bodies, applied to every route. Bodies over
+# the limit are refused with a 413 as soon as it is crossed.
+MAX_CONTENT_LENGTH = int(os.getenv("MAX_CONTENT_LENGTH", 1024 * 1024))
+
+# Per-endpoint limits. Login and registration take a handful of fields, small
+# commands such as expand_task an id and a path, and project writes a whole
+# tree, with room for indentation around a tree at TASK_TREE_MAX_BYTES.
+MAX_AUTH_BODY_SIZE = int(os.getenv("MAX_AUTH_BODY_SIZE", 16 * 1024))
+MAX_COMMAND_BODY_SIZE = int(os.getenv("MAX_COMMAND_BODY_SIZE", 64 * 1024))
+MAX_PROJECT_BODY_SIZE = int(os.getenv("MAX_PROJECT_BODY_SIZE", 4 * 1024 * 1024))
+
+# Request bodies are read in chunks of this size
+REQUEST_BODY_CHUNK_SIZE = int(os.getenv("REQUEST_BODY_CHUNK_SIZE", 64 * 1024))
+
+#############################
+# Project endpoints
+#############################
+
+# The most project IDs a single /projects/get_many call may ask for
+MAX_BATCH_PROJECT_IDS = int(os.getenv("MAX_BATCH_PROJECT_IDS", 100))
+
+# The most projects a single /projects/instantiate_template call may create
+MAX_TEMPLATE_INSTANCES = int(os.getenv("MAX_TEMPLATE_INSTANCES", 500))
+
+# The most tasks a single /projects/search call returns
+MAX_SEARCH_RESULTS = int(os.getenv("MAX_SEARCH_RESULTS", 100))
+
+# Page size and safety lag for the /projects/changes incremental sync
+SYNC_PAGE_SIZE = int(os.getenv("SYNC_PAGE_SIZE", 200))
+SYNC_WATERMARK_LAG_SECONDS = float(os.getenv("SYNC_WATERMARK_LAG_SECONDS", 5))
+
+# Server-Sent Events stream of project changes
+SSE_HEARTBEAT_SECONDS = float(os.getenv("SSE_HEARTBEAT_SECONDS", 15))
+SSE_QUEUE_SIZE = int(os.getenv("SSE_QUEUE_SIZE", 100))
+
+# Each open stream holds one of its worker's threads for as long as the tab
+# stays open, so a worker refuses streams past this many and keeps the rest
+# of its threads (GUNICORN_THREADS) for ordinary requests
+SSE_MAX_STREAMS_PER_WORKER = int(os.getenv("SSE_MAX_STREAMS_PER_WORKER", 2))
+
+# Edits to the same project within this window are merged into one UPDATE.
+# 0 disables coalescing and every update is written synchronously. Pending
+# edits live in one process, where only that process's reads flush them, so
+# under gunicorn with several workers coalescing is turned off (see
+# app.lifecycle.after_fork) and only single-process servers coalesce.
+WRITE_COALESCE_WINDOW_MS = int(os.getenv("WRITE_COALESCE_WINDOW_MS", 250))
+
+# Limits on the task trees saved with a project. Trees are validated and
+# normalized before they are stored, and request bodies that cannot hold a
+# tree within the byte limit are refused before they are parsed.
+TASK_TREE_MAX_DEPTH = int(os.getenv("TASK_TREE_MAX_DEPTH", 32))
+TASK_TREE_MAX_NODES = int(os.getenv("TASK_TREE_MAX_NODES", 5000))
+TASK_TREE_MAX_BYTES = int(os.getenv("TASK_TREE_MAX_BYTES", 2 * 1024 * 1024))
+TASK_NAME_MAX_LENGTH = int(os.getenv("TASK_NAME_MAX_LENGTH", 500))
+TASK_DESCRIPTION_MAX_LENGTH = int(os.getenv("TASK_DESCRIPTION_MAX_LENGTH", 10000))
+
+#############################
+# AI task decomposition
+#############################
+
+# Which provider from app.ai.providers.PROVIDERS backs AI features
+AI_PROVIDER = os.getenv("AI_PROVIDER", "stub")
+
+# Artificial latency for the stub provider, for offline load tests
+AI_STUB_LATENCY_MS = int(os.getenv("AI_STUB_LATENCY_MS", 0))
+
+# Background decomposition workers
+DECOMPOSITION_WORKERS = int(os.getenv("DECOMPOSITION_WORKERS", 2))
+DECOMPOSITION_MAX_ATTEMPTS = int(os.getenv("DECOMPOSITION_MAX_ATTEMPTS", 3))
+DECOMPOSITION_RETRY_BACKOFF_SECONDS = float(os.getenv("DECOMPOSITION_RETRY_BACKOFF_SECONDS", 1.0))
+DECOMPOSITION_QUEUE_SIZE = int(os.getenv("DECOMPOSITION_QUEUE_SIZE", 1000))
+
+# How often each worker re-queues background jobs left unfinished in Minerva:
+# ones a full queue refused, or that a restarted or crashed worker left
+# queued or running. The first sweep runs as the worker starts.
+JOB_SWEEP_INTERVAL_SECONDS = float(os.getenv("JOB_SWEEP_INTERVAL_SECONDS", 60))
+
+# Cache in front of AI task expansion
+AI_CACHE_ENABLED = os.getenv("AI_CACHE_ENABLED", "true").lower() == "true"
+AI_CACHE_MAX_ENTRIES = int(os.getenv("AI_CACHE_MAX_ENTRIES", 1024))
+AI_CACHE_TTL_SECONDS = float(os.getenv("AI_CACHE_TTL_SECONDS", 24 * 60 * 60))
+
+# Also keep expansions in Minerva so they survive restarts and are shared
+AI_CACHE_PERSIST = os.getenv("AI_CACHE_PERSIST", "false").lower() == "true"
+
+# Cosine similarity above which a near-identical task reuses a cached
+# expansion. 0 disables the similarity lookup and only exact keys hit.
+AI_CACHE_SIMILARITY_THRESHOLD = float(os.getenv("AI_CACHE_SIMILARITY_THRESHOLD", 0))
+
+#############################
+# Rate limiting
+#############################
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+
+# Where token buckets live: "memory://" for a per-process store, or a
+# redis:// URL so every worker and host shares the same budgets. Each
+# worker would enforce its own copy of a per-process budget, so with
+# memory:// the server runs one worker by default and refuses to start with
+# more
+RATE_LIMIT_STORAGE_URL = os.getenv("RATE_LIMIT_STORAGE_URL", "memory://")
+
+# The most buckets the in-memory store keeps before evicting the oldest
+RATE_LIMIT_MEMORY_MAX_KEYS = int(os.getenv("RATE_LIMIT_MEMORY_MAX_KEYS", 100000))
+
+# Budgets as "<requests>/<second|minute|hour>", each enforced per IP and per
+# JWT identity. Login and registration hash passwords with bcrypt, so they get
+# a far smaller budget than everything else.
+RATE_LIMIT_DEFAULT = os.getenv("RATE_LIMIT_DEFAULT", "300/minute")
+RATE_LIMIT_AUTH = os.getenv("RATE_LIMIT_AUTH", "10/minute")
+RATE_LIMIT_PROJECT_WRITES = os.getenv("RATE_LIMIT_PROJECT_WRITES", "60/minute")
+
+# The most requests one user (or anonymous IP) may have in flight in a
+# process at once. 0 disables the quota.
+MAX_CONCURRENT_REQUESTS_PER_USER = int(os.getenv("MAX_CONCURRENT_REQUESTS_PER_USER", 8))
+
+#############################
+# User cache
+#############################
+
+# How long a user's profile is cached in each process. Changes made through
+# Users invalidate the local copy at once; other processes catch up within
+# the TTL.
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", 30))
+
+# How long an unknown email is remembered as unknown. Kept short since a
+# registration on another process cannot invalidate it.
+USER_CACHE_NEGATIVE_TTL_SECONDS = float(os.getenv("USER_CACHE_NEGATIVE_TTL_SECONDS", 5))
+USER_CACHE_MAX_ENTRIES = int(os.getenv("USER_CACHE_MAX_ENTRIES", 10000))
+
+#############################
+# Login guard
+#############################
+
+# After this many failed logins an account must wait before trying again:
+# LOGIN_BACKOFF_BASE_SECONDS, doubled after each further failure up to
+# LOGIN_BACKOFF_MAX_SECONDS. Failures are forgotten after a successful login
+# or LOGIN_FAILURE_WINDOW_SECONDS without one. Counted in each process.
+LOGIN_FAILURES_BEFORE_BACKOFF = int(os.getenv("LOGIN_FAILURES_BEFORE_BACKOFF", 5))
+LOGIN_BACKOFF_BASE_SECONDS = float(os.getenv("LOGIN_BACKOFF_BASE_SECONDS", 1))
+LOGIN_BACKOFF_MAX_SECONDS = float(os.getenv("LOGIN_BACKOFF_MAX_SECONDS", 15 * 60))
+LOGIN_FAILURE_WINDOW_SECONDS = float(os.getenv("LOGIN_FAILURE_WINDOW_SECONDS", 60 * 60))
+LOGIN_GUARD_MAX_ACCOUNTS = int(os.getenv("LOGIN_GUARD_MAX_ACCOUNTS", 100000))
+
+#############################
+# Account deletion
+#############################
+
+# Deleting an account marks the user pending deletion at once; a background
+# worker then purges their projects ACCOUNT_DELETION_BATCH_SIZE at a time,
+# each batch in its own short transaction with a pause after it, before
+# deleting the user's row
+ACCOUNT_DELETION_BATCH_SIZE = int(os.getenv("ACCOUNT_DELETION_BATCH_SIZE", 50))
+ACCOUNT_DELETION_BATCH_PAUSE_MS = int(os.getenv("ACCOUNT_DELETION_BATCH_PAUSE_MS", 100))
+ACCOUNT_DELETION_WORKERS = int(os.getenv("ACCOUNT_DELETION_WORKERS", 1))
+ACCOUNT_DELETION_MAX_ATTEMPTS = int(os.getenv("ACCOUNT_DELETION_MAX_ATTEMPTS", 5))
+ACCOUNT_DELETION_RETRY_BACKOFF_SECONDS = float(os.getenv("ACCOUNT_DELETION_RETRY_BACKOFF_SECONDS", 5))
+
+# The most purges a worker queues; a deletion made while the queue is full
+# is left pending for the next sweep to resume
+ACCOUNT_DELETION_QUEUE_SIZE = int(os.getenv("ACCOUNT_DELETION_QUEUE_SIZE", 1000))
+
+#############################
+# Minerva connections
+#############################
+
+# Connections kept open per database, in each process. Checkouts beyond the
+# maximum get a one-off connection instead of waiting.
+MINERVA_POOL_MIN_CONNECTIONS = int(os.getenv("MINERVA_POOL_MIN_CONNECTIONS", 1))
+MINERVA_POOL_MAX_CONNECTIONS = int(os.getenv("MINERVA_POOL_MAX_CONNECTIONS", 10))
+
+# Comma separated libpq URIs of read replicas, e.g.
+# postgresql://reader@replica-1/minerva,postgresql://reader@replica-2/minerva.
+# Read-only cursors are spread across them; empty sends everything to
+# MINERVA_HOST.
+MINERVA_REPLICA_DSNS = [dsn.strip() for dsn in os.getenv("MINERVA_REPLICA_DSNS", "").split(",") if dsn.strip()]
+
+# After a user writes, their reads stay on the primary this long so they
+# never see replica lag hide their own changes
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", 5))
+
+# A replica's pooled connection is checked with SELECT 1 when it has not been
+# used for this long, and an unreachable replica is skipped for
+# REPLICA_RETRY_SECONDS before it is tried again
+REPLICA_HEALTH_CHECK_SECONDS = float(os.getenv("REPLICA_HEALTH_CHECK_SECONDS", 10))
+REPLICA_RETRY_SECONDS = float(os.getenv("REPLICA_RETRY_SECONDS", 30))
+
+# Whether create_app opens the pools up front (see app.lifecycle). Off by
+# default so short-lived processes only connect when a request needs to.
+# Under gunicorn.conf.py each worker warms itself after forking instead.
+WARMUP_ON_START = os.getenv("WARMUP_ON_START", "false").lower() == "true"
+
+#############################
+# Project storage
+#############################
+
+# Where saved projects are kept: minerva:// for the Postgres database, or an
+# embedded SQLite file for single-node deployments and CI, e.g.
+# sqlite:///projects.db (relative) or sqlite:////var/lib/praetorium/projects.db
+# minerva+dedup:// also uses Postgres, but stores task trees as
+# content-addressed subtrees so subtrees shared between projects are kept once
+PROJECT_STORAGE_URL = os.getenv("PROJECT_STORAGE_URL", "minerva://")
+
+# How long a stored subtree no project references is kept before it may be
+# collected
+SUBTREE_GC_GRACE_SECONDS = int(os.getenv("SUBTREE_GC_GRACE_SECONDS", 3600))
+
+# How often each worker's sweep collects those subtrees, with minerva+dedup
+# storage. Only one worker collects at a time.
+SUBTREE_GC_INTERVAL_SECONDS = float(os.getenv("SUBTREE_GC_INTERVAL_SECONDS", 3600))
+
+# How long a SQLite writer waits for another writer before giving up
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", 5000))
+
+#############################
+# Project history
+#############################
+
+# Every write to a Minerva project records a version: a diff against the
+# previous version, or a full keyframe every HISTORY_KEYFRAME_INTERVAL
+# versions (and whenever the diff would be larger than the project), so any
+# version is rebuilt from at most that many rows.
+PROJECT_HISTORY_ENABLED = os.getenv("PROJECT_HISTORY_ENABLED", "true").lower() == "true"
+HISTORY_KEYFRAME_INTERVAL = int(os.getenv("HISTORY_KEYFRAME_INTERVAL", 20))
+
+# Retention: each project keeps its last HISTORY_MAX_VERSIONS versions and
+# any from the last HISTORY_RETENTION_DAYS days. Older versions are dropped a
+# keyframe at a time, when a keyframe is written and by compaction.
+HISTORY_MAX_VERSIONS = int(os.getenv("HISTORY_MAX_VERSIONS", 200))
+HISTORY_RETENTION_DAYS = int(os.getenv("HISTORY_RETENTION_DAYS", 90))
+
+# Compaction keeps only the last version of each day for versions older than
+# this
+HISTORY_DAILY_AFTER_DAYS = int(os.getenv("HISTORY_DAILY_AFTER_DAYS", 7))
+
+# How often each worker's sweep applies retention and compaction to every
+# project's history. Only one worker compacts at a time.
+HISTORY_COMPACT_INTERVAL_SECONDS = float(os.getenv("HISTORY_COMPACT_INTERVAL_SECONDS", 86400))
+
+#############################
+# Timeouts and deadlines
+#############################
+
+# Every request gets a deadline, which each Minerva cursor turns into a
+# statement timeout, so a slow query is cancelled server-side instead of
+# holding a worker. Blueprints set their own defaults; clients may ask for a
+# shorter one with a Request-Timeout header in seconds.
+REQUEST_TIMEOUT_SECONDS = float(os.getenv("REQUEST_TIMEOUT_SECONDS", 10))
+AUTH_REQUEST_TIMEOUT_SECONDS = float(os.getenv("AUTH_REQUEST_TIMEOUT_SECONDS", 5))
+PROJECTS_REQUEST_TIMEOUT_SECONDS = float(os.getenv("PROJECTS_REQUEST_TIMEOUT_SECONDS", 10))
+JOBS_REQUEST_TIMEOUT_SECONDS = float(os.getenv("JOBS_REQUEST_TIMEOUT_SECONDS", 5))
+
+# Applied to cursors outside a request, e.g. background jobs, and as an upper
+# bound inside one. 0 disables it.
+MINERVA_STATEMENT_TIMEOUT_MS = int(os.getenv("MINERVA_STATEMENT_TIMEOUT_MS", 30000))
+
+# How long a statement may wait for a row or table lock before giving up
+MINERVA_LOCK_TIMEOUT_MS = int(os.getenv("MINERVA_LOCK_TIMEOUT_MS", 2000))
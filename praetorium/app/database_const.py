@@ -3,3 +3,6 @@
 # Our database's name is Minerva. Named after the Roman goddess of wisdom and
 # battle strategy. This database will contain all data required for PraetorAI.
 MINERVA = "minerva"
+
+# The Postgres NOTIFY channel that SavedProjects writes publish changes on
+PROJECT_CHANGES_CHANNEL = "project_changes"
@@ -0,0 +1,331 @@
+from psycopg2.sql import SQL, Composed
+from app.postgresql_utils import SchemaTable, Field, MinervaCursor
+from app.db_table_specs.minerva_auth_specs import Users
+from app.db_table_specs.minerva_projects_specs import SavedProjects
+from typing import List, Optional
+
+#########################################
+# Table Specs for Account Deletion tables
+#########################################
+
+
+class AccountDeletions(SchemaTable):
+    """
+    The specification for the Account Deletions table in the Auth schema.
+    Each row tracks the background purge of one deleted account, from the
+    request to the removal of the user's row. Rows outlive the user they
+    describe, so admins can see when an account was purged.
+    """
+
+    SCHEMA = "auth"
+    TABLE = "account_deletions"
+
+    # Field constants
+    EMAIL = Field("email")
+    STATUS = Field("status")
+    ATTEMPTS = Field("attempts")
+    PROJECTS_TOTAL = Field("projects_total")
+    PROJECTS_DELETED = Field("projects_deleted")
+    BATCHES = Field("batches")
+    ERROR = Field("error")
+    REQUESTED_AT = Field("requested_at")
+    UPDATED_AT = Field("updated_at")
+    FINISHED_AT = Field("finished_at")
+
+    # Status constants
+    PENDING = "pending"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+    # A running purge that has not finished a batch for this long is assumed
+    # to belong to a process that died, and may be claimed again
+    STALE_SECONDS = 300
+
+    @classmethod
+    def create_sql(cls) -> Composed:
+        """
+        Generates the SQL to create the account deletions table.
+        :return: A Composed object with the CREATE TABLE statement
+        """
+        return SQL(
+            """
+            CREATE TABLE IF NOT EXISTS {st} (
+                {email} VARCHAR(100) PRIMARY KEY,
+                {status} VARCHAR(20) NOT NULL DEFAULT 'pending',
+                {attempts} INTEGER NOT NULL DEFAULT 0,
+                {projects_total} INTEGER,
+                {projects_deleted} INTEGER NOT NULL DEFAULT 0,
+                {batches} INTEGER NOT NULL DEFAULT 0,
+                {error} TEXT,
+                {requested_at} TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                {updated_at} TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                {finished_at} TIMESTAMP
+            );
+            CREATE INDEX IF NOT EXISTS account_deletions_status_idx ON {st} ({status})
+                WHERE {status} IN ('pending', 'running');
+        """
+        ).format(
+            st=cls.string(),
+            email=cls.EMAIL.string(),
+            status=cls.STATUS.string(),
+            attempts=cls.ATTEMPTS.string(),
+            projects_total=cls.PROJECTS_TOTAL.string(),
+            projects_deleted=cls.PROJECTS_DELETED.string(),
+            batches=cls.BATCHES.string(),
+            error=cls.ERROR.string(),
+            requested_at=cls.REQUESTED_AT.string(),
+            updated_at=cls.UPDATED_AT.string(),
+            finished_at=cls.FINISHED_AT.string(),
+        )
+
+    @classmethod
+    def request(cls, email: str) -> bool:
+        """
+        Marks a user pending deletion and records the purge to run. Only the
+        user's own row is touched, so this is quick however many projects
+        they have.
+        :param email: the email of the user to delete
+        :return: False if the user does not exist or is already being deleted
+        """
+        mark_query = SQL(
+            """
+            UPDATE {users}
+            SET {user_status} = %s, {deleted_at} = CURRENT_TIMESTAMP, {user_updated_at} = CURRENT_TIMESTAMP
+            WHERE {user_email} = %s AND {user_status} IS DISTINCT FROM %s;
+            """
+        ).format(
+            users=Users.string(),
+            user_status=Users.STATUS.string(),
+            deleted_at=Users.DELETED_AT.string(),
+            user_updated_at=Users.UPDATED_AT.string(),
+            user_email=Users.EMAIL.string(),
+        )
+
+        # An email deleted before, then registered again, reuses its row
+        insert_query = SQL(
+            """
+            INSERT INTO {st} ({email}) VALUES (%s)
+            ON CONFLICT ({email}) DO UPDATE
+            SET {status} = EXCLUDED.{status}, {attempts} = 0, {projects_total} = NULL, {projects_deleted} = 0,
+                {batches} = 0, {error} = NULL, {requested_at} = CURRENT_TIMESTAMP,
+                {updated_at} = CURRENT_TIMESTAMP, {finished_at} = NULL;
+            """
+        ).format(
+            st=cls.string(),
+            email=cls.EMAIL.string(),
+            status=cls.STATUS.string(),
+            attempts=cls.ATTEMPTS.string(),
+            projects_total=cls.PROJECTS_TOTAL.string(),
+            projects_deleted=cls.PROJECTS_DELETED.string(),
+            batches=cls.BATCHES.string(),
+            error=cls.ERROR.string(),
+            requested_at=cls.REQUESTED_AT.string(),
+            updated_at=cls.UPDATED_AT.string(),
+            finished_at=cls.FINISHED_AT.string(),
+        )
+
+        with MinervaCursor() as cur:
+            cur.execute(mark_query, (Users.PENDING_DELETION, email, Users.PENDING_DELETION))
+            if cur.rowcount == 0:
+                return False
+            cur.execute(insert_query, (email,))
+
+        Users.changed(email)
+        return True
+
+    @classmethod
+    def claim(cls, email: str) -> Optional[dict]:
+        """
+        Atomically moves a pending purge to running and counts the attempt.
+        A running purge whose process stopped reporting progress can be
+        claimed again.
+        :return: the claimed purge, or None if another worker has it or it
+        finished
+        """
+        claim_query = SQL(
+            """
+            UPDATE {st}
+            SET {status} = %s, {attempts} = {attempts} + 1, {updated_at} = CURRENT_TIMESTAMP
+            WHERE {email} = %s
+                AND ({status} = %s OR ({status} = %s AND {updated_at} < CURRENT_TIMESTAMP - %s * INTERVAL '1 second'))
+            RETURNING *;
+            """
+        ).format(
+            st=cls.string(),
+            status=cls.STATUS.string(),
+            attempts=cls.ATTEMPTS.string(),
+            updated_at=cls.UPDATED_AT.string(),
+            email=cls.EMAIL.string(),
+        )
+
+        with MinervaCursor() as cur:
+            cur.execute(claim_query, (cls.RUNNING, email, cls.PENDING, cls.RUNNING, cls.STALE_SECONDS))
+            return cur.fetchone()
+
+    @classmethod
+    def count_projects(cls, email: str) -> int:
+        """
+        Records how many projects are left to purge, for the progress shown
+        to admins.
+        :return: the number of projects left
+        """
+        count_query = SQL(
+            """
+            UPDATE {st}
+            SET {projects_total} = {projects_deleted} + (SELECT count(*) FROM {projects} WHERE {project_email} = %s)
+            WHERE {email} = %s
+            RETURNING {projects_total} - {projects_deleted} AS remaining;
+            """
+        ).format(
+            st=cls.string(),
+            projects_total=cls.PROJECTS_TOTAL.string(),
+            projects_deleted=cls.PROJECTS_DELETED.string(),
+            projects=SavedProjects.string(),
+            project_email=SavedProjects.EMAIL.string(),
+            email=cls.EMAIL.string(),
+        )
+
+        with MinervaCursor() as cur:
+            cur.execute(count_query, (email, email))
+            return cur.fetchone()["remaining"]
+
+    @classmethod
+    def purge_batch(cls, email: str, batch_size: int) -> int:
+        """
+        Deletes up to batch_size of a user's projects, and the rows that
+        cascade from them, in a transaction of its own so locks are held for
+        one small batch at a time. Nothing is deleted unless the user is
+        still pending deletion.
+        :return: the number of projects deleted
+        """
+        delete_query = SQL(
+            """
+            DELETE FROM {projects}
+            WHERE {project_email} = %s AND {project_id} IN (
+                SELECT {project_id} FROM {projects}
+                WHERE {project_email} = %s
+                    AND EXISTS (SELECT 1 FROM {users} WHERE {user_email} = %s AND {user_status} = %s)
+                LIMIT %s
+            );
+            """
+        ).format(
+            projects=SavedProjects.string(),
+            project_email=SavedProjects.EMAIL.string(),
+            project_id=SavedProjects.PROJECT_ID.string(),
+            users=Users.string(),
+            user_email=Users.EMAIL.string(),
+            user_status=Users.STATUS.string(),
+        )
+
+        progress_query = SQL(
+            """
+            UPDATE {st}
+            SET {projects_deleted} = {projects_deleted} + %s, {batches} = {batches} + 1,
+                {updated_at} = CURRENT_TIMESTAMP
+            WHERE {email} = %s;
+            """
+        ).format(
+            st=cls.string(),
+            projects_deleted=cls.PROJECTS_DELETED.string(),
+            batches=cls.BATCHES.string(),
+            updated_at=cls.UPDATED_AT.string(),
+            email=cls.EMAIL.string(),
+        )
+
+        with MinervaCursor() as cur:
+            cur.execute(delete_query, (email, email, email, Users.PENDING_DELETION, batch_size))
+            deleted = cur.rowcount
+            if deleted:
+                cur.execute(progress_query, (deleted, email))
+            return deleted
+
+    @classmethod
+    def delete_user(cls, email: str) -> None:
+        """
+        Deletes the user's row once their projects are gone, cascading into
+        the few rows left, and records the purge as completed.
+        """
+        delete_query = SQL("DELETE FROM {users} WHERE {user_email} = %s AND {user_status} = %s;").format(
+            users=Users.string(), user_email=Users.EMAIL.string(), user_status=Users.STATUS.string()
+        )
+
+        with MinervaCursor() as cur:
+            cur.execute(delete_query, (email, Users.PENDING_DELETION))
+            cur.execute(cls.finish_sql(), (cls.COMPLETED, None, True, email))
+
+        Users.changed(email)
+
+    @classmethod
+    def finish_sql(cls) -> Composed:
+        """
+        The SQL recording the outcome of a purge attempt, taking the status,
+        the error and whether the purge is over.
+        """
+        return SQL(
+            """
+            UPDATE {st}
+            SET {status} = %s, {error} = %s, {updated_at} = CURRENT_TIMESTAMP,
+                {finished_at} = CASE WHEN %s THEN CURRENT_TIMESTAMP END
+            WHERE {email} = %s;
+            """
+        ).format(
+            st=cls.string(),
+            status=cls.STATUS.string(),
+            error=cls.ERROR.string(),
+            updated_at=cls.UPDATED_AT.string(),
+            finished_at=cls.FINISHED_AT.string(),
+            email=cls.EMAIL.string(),
+        )
+
+    @classmethod
+    def finish(cls, email: str, status: str, error: Optional[str] = None) -> None:
+        """
+        Records the outcome of a purge attempt. A PENDING status puts the
+        purge back for a retry.
+        :param email: the user being deleted
+        :param status: the purge's new status
+        :param error: the error message, if the attempt failed
+        """
+        with MinervaCursor() as cur:
+            cur.execute(cls.finish_sql(), (status, error, status in (cls.COMPLETED, cls.FAILED), email))
+
+    @classmethod
+    def select_all(cls, status: Optional[str] = None, limit: int = 100) -> List[dict]:
+        """
+        The most recently requested purges and their progress, for admins.
+        :param status: only purges with this status, or None for all of them
+        :param limit: the most purges returned
+        """
+        select_query = SQL(
+            "SELECT * FROM {st} WHERE %s IS NULL OR {status} = %s ORDER BY {requested_at} DESC LIMIT %s;"
+        ).format(st=cls.string(), status=cls.STATUS.string(), requested_at=cls.REQUESTED_AT.string())
+
+        with MinervaCursor(read_only=True) as cur:
+            cur.execute(select_query, (status, status, limit))
+            return cur.fetchall()
+
+    @classmethod
+    def select_unfinished(cls) -> List[str]:
+        """
+        The emails of every purge still pending, or running but gone stale,
+        oldest first. Used to pick up purges left behind by a restarted
+        process or refused by a full queue.
+        """
+        select_query = SQL(
+            """
+            SELECT {email} FROM {st}
+            WHERE {status} = %s OR ({status} = %s AND {updated_at} < CURRENT_TIMESTAMP - %s * INTERVAL '1 second')
+            ORDER BY {requested_at};
+            """
+        ).format(
+            st=cls.string(),
+            email=cls.EMAIL.string(),
+            status=cls.STATUS.string(),
+            updated_at=cls.UPDATED_AT.string(),
+            requested_at=cls.REQUESTED_AT.string(),
+        )
+
+        with MinervaCursor() as cur:
+            cur.execute(select_query, (cls.PENDING, cls.RUNNING, cls.STALE_SECONDS))
+            return [row[cls.EMAIL.raw] for row in cur.fetchall()]
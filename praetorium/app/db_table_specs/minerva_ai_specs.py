@@ -0,0 +1,98 @@
+from psycopg2.sql import SQL, Composed
+from psycopg2.extras import Json
+from app.postgresql_utils import SchemaTable, Field, MinervaCursor
+from typing import List, Optional
+
+###########################
+# Table Specs for AI tables
+###########################
+
+
+class AIExpansionCache(SchemaTable):
+    """
+    The specification for the AI Expansion Cache table in the Projects
+    schema. Each row holds the subtasks the AI produced for one normalized
+    task, shared by every user and process.
+    """
+
+    SCHEMA = "projects"
+    TABLE = "ai_expansion_cache"
+
+    # Field constants
+    CACHE_KEY = Field("cache_key")
+    SUBTASKS = Field("subtasks")
+    HITS = Field("hits")
+    CREATED_AT = Field("created_at")
+
+    @classmethod
+    def create_sql(cls) -> Composed:
+        """
+        Generates the SQL to create the AI expansion cache table.
+        :return: A Composed object with the CREATE TABLE statement
+        """
+        return SQL(
+            """
+            CREATE TABLE IF NOT EXISTS {st} (
+                {cache_key} CHAR(64) PRIMARY KEY,
+                {subtasks} JSONB NOT NULL,
+                {hits} INTEGER NOT NULL DEFAULT 0,
+                {created_at} TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+        """
+        ).format(
+            st=cls.string(),
+            cache_key=cls.CACHE_KEY.string(),
+            subtasks=cls.SUBTASKS.string(),
+            hits=cls.HITS.string(),
+            created_at=cls.CREATED_AT.string(),
+        )
+
+    @classmethod
+    def select_one(cls, cache_key: str, ttl_seconds: float) -> Optional[List[dict]]:
+        """
+        Looks up a cached expansion younger than ttl_seconds and counts the hit.
+        :return: the cached subtasks, or None on a miss
+        """
+        select_query = SQL(
+            """
+            UPDATE {st}
+            SET {hits} = {hits} + 1
+            WHERE {cache_key} = %s AND {created_at} > LOCALTIMESTAMP - make_interval(secs => %s)
+            RETURNING {subtasks};
+            """
+        ).format(
+            st=cls.string(),
+            hits=cls.HITS.string(),
+            cache_key=cls.CACHE_KEY.string(),
+            created_at=cls.CREATED_AT.string(),
+            subtasks=cls.SUBTASKS.string(),
+        )
+
+        with MinervaCursor() as cur:
+            cur.execute(select_query, (cache_key, ttl_seconds))
+            row = cur.fetchone()
+
+        return row[cls.SUBTASKS.raw] if row is not None else None
+
+    @classmethod
+    def upsert_record(cls, cache_key: str, subtasks: List[dict]) -> None:
+        """
+        Stores an expansion, replacing any older one under the same key.
+        """
+        upsert_query = SQL(
+            """
+            INSERT INTO {st} ({cache_key}, {subtasks})
+            VALUES (%s, %s)
+            ON CONFLICT ({cache_key}) DO UPDATE
+            SET {subtasks} = EXCLUDED.{subtasks}, {hits} = 0, {created_at} = CURRENT_TIMESTAMP;
+            """
+        ).format(
+            st=cls.string(),
+            cache_key=cls.CACHE_KEY.string(),
+            subtasks=cls.SUBTASKS.string(),
+            hits=cls.HITS.string(),
+            created_at=cls.CREATED_AT.string(),
+        )
+
+        with MinervaCursor() as cur:
+            cur.execute(upsert_query, (cache_key, Json(subtasks)))
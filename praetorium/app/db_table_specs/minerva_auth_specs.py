@@ -1,5 +1,6 @@
 from psycopg2.sql import SQL, Composed
-from app.postgresql_utils import SchemaTable, Field, MinervaCursor
+from app.postgresql_utils import SchemaTable, Field, MinervaCursor, UnitOfWork
+from typing import Callable, List, Optional
 
 #############################
 # Table Specs for Auth tables
@@ -32,8 +33,35 @@ class Users(SchemaTable):
     DELETED_AT = Field("deleted_at")
     PLAN = Field("plan")
 
+    # The fields safe to cache and hand to request handlers, i.e. everything
+    # but the password hash
+    PROFILE_FIELDS = (
+        ID,
+        EMAIL,
+        FIRST_NAME,
+        LAST_NAME,
+        PROFILE_PICTURE,
+        ROLE,
+        STATUS,
+        CREATED_AT,
+        UPDATED_AT,
+        LAST_LOGIN,
+        IS_VERIFIED,
+        DELETED_AT,
+        PLAN,
+    )
+
     # Other constants
     PASSWORD = "password"
+    ADMIN_ROLE = "admin"
+
+    # The status of a user whose account is being purged in the background.
+    # They are treated as unregistered from the moment it is set.
+    PENDING_DELETION = "pending_deletion"
+
+    # Callbacks run with a user's email whenever their record changes, so
+    # caches of it can be invalidated
+    change_listeners: List[Callable[[str], None]] = []
 
     @classmethod
     def create_sql(cls) -> Composed:
@@ -99,6 +127,66 @@ class Users(SchemaTable):
 
         return True
 
+    @classmethod
+    def on_change(cls, callback: Callable[[str], None]) -> None:
+        """
+        Registers a callback to run with a user's email whenever their
+        record is created, changed or deleted.
+        """
+        cls.change_listeners.append(callback)
+
+    @classmethod
+    def changed(cls, email: str) -> None:
+        """
+        Announces that a user's record was created, changed or deleted.
+        Inside a unit of work it is announced again once the change commits,
+        in case the old record was read back in the meantime.
+        """
+
+        def announce():
+            for callback in cls.change_listeners:
+                callback(email)
+
+        announce()
+        unit = UnitOfWork.current()
+        if unit is not None:
+            unit.after_commit(announce)
+
+    @classmethod
+    def select_profile(cls, email: str) -> Optional[dict]:
+        """
+        Retrieves a user's PROFILE_FIELDS.
+        :return: the user's profile, or None if the email is not registered
+        or the account is pending deletion
+        """
+        select_query = SQL("SELECT {fields} FROM {st} WHERE {email} = %s AND {status} IS DISTINCT FROM %s;").format(
+            fields=SQL(", ").join(field.string() for field in cls.PROFILE_FIELDS),
+            st=cls.string(),
+            email=cls.EMAIL.string(),
+            status=cls.STATUS.string(),
+        )
+
+        with MinervaCursor() as cur:
+            cur.execute(select_query, (email, cls.PENDING_DELETION))
+            return cur.fetchone()
+
+    @classmethod
+    def update_plan(cls, email: str, plan: str) -> None:
+        """
+        Moves a user to a new plan.
+        :raises EmailDoesNotExistException: if the email is not registered
+        """
+        update_query = SQL("UPDATE {st} SET {plan} = %s, {updated_at} = CURRENT_TIMESTAMP WHERE {email} = %s;").format(
+            st=cls.string(), plan=cls.PLAN.string(), updated_at=cls.UPDATED_AT.string(), email=cls.EMAIL.string()
+        )
+
+        with MinervaCursor() as cur:
+            cur.execute(update_query, (plan, email))
+            if cur.rowcount == 0:
+                raise EmailDoesNotExistException(f"{email} is not registered!")
+
+        cls.changed(email)
+
 
 class EmailDoesNotExistException(Exception):
     """
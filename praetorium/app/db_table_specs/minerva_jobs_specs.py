@@ -0,0 +1,220 @@
+from psycopg2.sql import SQL, Composed
+from psycopg2.extras import Json
+from app.postgresql_utils import SchemaTable, Field, MinervaCursor
+from typing import List, Optional
+
+#########################################
+# Table Specs for Decomposition Job tables
+#########################################
+
+
+class DecompositionJobs(SchemaTable):
+    """
+    The specification for the Decomposition Jobs table in the Projects
+    schema. Each row tracks one background AI decomposition of a saved
+    project, from submission to its result.
+    """
+
+    SCHEMA = "projects"
+    TABLE = "decomposition_jobs"
+
+    # Field constants
+    JOB_ID = Field("job_id")
+    EMAIL = Field("email")
+    PROJECT_ID = Field("project_id")
+    STATUS = Field("status")
+    ATTEMPTS = Field("attempts")
+    RESULT = Field("result")
+    ERROR = Field("error")
+    CREATED_AT = Field("created_at")
+    UPDATED_AT = Field("updated_at")
+    FINISHED_AT = Field("finished_at")
+
+    # Status constants
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+    # A running job that has not been updated for this long is assumed to
+    # belong to a worker that died, and may be claimed again
+    STALE_SECONDS = 300
+
+    @classmethod
+    def create_sql(cls) -> Composed:
+        """
+        Generates the SQL to create the decomposition jobs table.
+        :return: A Composed object with the CREATE TABLE statement
+        """
+        return SQL(
+            """
+            CREATE TABLE IF NOT EXISTS {st} (
+                {job_id} SERIAL PRIMARY KEY,
+                {email} VARCHAR(100) NOT NULL REFERENCES auth.users(email) ON DELETE CASCADE,
+                {project_id} INTEGER NOT NULL,
+                {status} VARCHAR(20) NOT NULL DEFAULT 'queued',
+                {attempts} INTEGER NOT NULL DEFAULT 0,
+                {result} JSONB,
+                {error} TEXT,
+                {created_at} TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                {updated_at} TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                {finished_at} TIMESTAMP
+            );
+            CREATE INDEX IF NOT EXISTS decomposition_jobs_status_idx ON {st} ({status}) WHERE {status} = 'queued';
+        """
+        ).format(
+            st=cls.string(),
+            job_id=cls.JOB_ID.string(),
+            email=cls.EMAIL.string(),
+            project_id=cls.PROJECT_ID.string(),
+            status=cls.STATUS.string(),
+            attempts=cls.ATTEMPTS.string(),
+            result=cls.RESULT.string(),
+            error=cls.ERROR.string(),
+            created_at=cls.CREATED_AT.string(),
+            updated_at=cls.UPDATED_AT.string(),
+            finished_at=cls.FINISHED_AT.string(),
+        )
+
+    @classmethod
+    def insert_record(cls, email: str, project_id: int) -> int:
+        """
+        Records a newly submitted job.
+        :param email: the email of the user who owns the project
+        :param project_id: the project to decompose
+        :return: the new job_id
+        """
+        if not isinstance(email, str):
+            raise DecompositionJobException(f"Email {email} is not a string!")
+
+        if not isinstance(project_id, int):
+            raise DecompositionJobException(f"Project ID {project_id} is not an integer!")
+
+        insert_query = SQL(
+            """
+            INSERT INTO {st} ({email}, {project_id})
+            VALUES (%s, %s)
+            RETURNING {job_id};
+            """
+        ).format(
+            st=cls.string(), email=cls.EMAIL.string(), project_id=cls.PROJECT_ID.string(), job_id=cls.JOB_ID.string()
+        )
+
+        with MinervaCursor() as cur:
+            cur.execute(insert_query, (email, project_id))
+            return cur.fetchone()[cls.JOB_ID.raw]
+
+    @classmethod
+    def claim(cls, job_id: int) -> Optional[dict]:
+        """
+        Atomically moves a queued job to running and counts the attempt. Only
+        one worker can claim a job, even across processes. A running job whose
+        worker stopped updating it can be claimed again.
+        :return: the claimed job, or None if it was not queued
+        """
+        claim_query = SQL(
+            """
+            UPDATE {st}
+            SET {status} = %s, {attempts} = {attempts} + 1, {updated_at} = CURRENT_TIMESTAMP
+            WHERE {job_id} = %s
+                AND ({status} = %s OR ({status} = %s AND {updated_at} < CURRENT_TIMESTAMP - %s * INTERVAL '1 second'))
+            RETURNING *;
+            """
+        ).format(
+            st=cls.string(),
+            status=cls.STATUS.string(),
+            attempts=cls.ATTEMPTS.string(),
+            updated_at=cls.UPDATED_AT.string(),
+            job_id=cls.JOB_ID.string(),
+        )
+
+        with MinervaCursor() as cur:
+            cur.execute(claim_query, (cls.RUNNING, job_id, cls.QUEUED, cls.RUNNING, cls.STALE_SECONDS))
+            return cur.fetchone()
+
+    @classmethod
+    def finish(cls, job_id: int, status: str, result: Optional[list] = None, error: Optional[str] = None) -> None:
+        """
+        Records the outcome of a job run. A QUEUED status puts the job back
+        for a retry.
+        :param job_id: the job that ran
+        :param status: the job's new status
+        :param result: the produced task tree, if it succeeded
+        :param error: the error message, if it failed
+        """
+        finish_query = SQL(
+            """
+            UPDATE {st}
+            SET {status} = %s, {result} = %s, {error} = %s, {updated_at} = CURRENT_TIMESTAMP,
+                {finished_at} = CASE WHEN %s THEN CURRENT_TIMESTAMP END
+            WHERE {job_id} = %s;
+            """
+        ).format(
+            st=cls.string(),
+            status=cls.STATUS.string(),
+            result=cls.RESULT.string(),
+            error=cls.ERROR.string(),
+            updated_at=cls.UPDATED_AT.string(),
+            finished_at=cls.FINISHED_AT.string(),
+            job_id=cls.JOB_ID.string(),
+        )
+
+        with MinervaCursor() as cur:
+            cur.execute(
+                finish_query,
+                (
+                    status,
+                    Json(result) if result is not None else None,
+                    error,
+                    status in (cls.SUCCEEDED, cls.FAILED),
+                    job_id,
+                ),
+            )
+
+    @classmethod
+    def select_one(cls, job_id: int, email: str) -> dict:
+        """
+        Retrieves a job belonging to a user.
+        :raises DecompositionJobException: if the user has no such job
+        """
+        select_query = SQL("SELECT * FROM {st} WHERE {job_id} = %s AND {email} = %s;").format(
+            st=cls.string(), job_id=cls.JOB_ID.string(), email=cls.EMAIL.string()
+        )
+
+        with MinervaCursor() as cur:
+            cur.execute(select_query, (job_id, email))
+            job = cur.fetchone()
+
+        if job is None:
+            raise DecompositionJobException(f"Job {job_id} does not exist!")
+
+        return job
+
+    @classmethod
+    def select_resumable(cls) -> List[int]:
+        """
+        The ids of every job still waiting to run, and of running jobs gone
+        stale, oldest first. Used to pick up jobs left behind by a restarted
+        or crashed worker, or refused by a full queue.
+        """
+        select_query = SQL(
+            """
+            SELECT {job_id} FROM {st}
+            WHERE {status} = %s OR ({status} = %s AND {updated_at} < CURRENT_TIMESTAMP - %s * INTERVAL '1 second')
+            ORDER BY {job_id};
+            """
+        ).format(
+            st=cls.string(), job_id=cls.JOB_ID.string(), status=cls.STATUS.string(), updated_at=cls.UPDATED_AT.string()
+        )
+
+        with MinervaCursor() as cur:
+            cur.execute(select_query, (cls.QUEUED, cls.RUNNING, cls.STALE_SECONDS))
+            return [row[cls.JOB_ID.raw] for row in cur.fetchall()]
+
+
+class DecompositionJobException(Exception):
+    """
+    An exception for creating or reading decomposition jobs
+    """
+
+    pass
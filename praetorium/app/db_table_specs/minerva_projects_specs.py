@@ -1,7 +1,22 @@
-from psycopg2.sql import SQL
+from psycopg2.sql import SQL, Composed, Identifier, Literal
 from app.postgresql_utils import SchemaTable, Field, MinervaCursor
-from typing import Optional, Tuple
-from app.db_table_specs.minerva_auth_specs import Users
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from datetime import datetime
+from app.config import (
+    SUBTREE_GC_GRACE_SECONDS,
+    PROJECT_HISTORY_ENABLED,
+    HISTORY_KEYFRAME_INTERVAL,
+    HISTORY_MAX_VERSIONS,
+    HISTORY_RETENTION_DAYS,
+    HISTORY_DAILY_AFTER_DAYS,
+    MAX_TEMPLATE_INSTANCES,
+)
+from app.user_cache import user_cache
+from app.database_const import PROJECT_CHANGES_CHANNEL
+from app.task_tree import CHILDREN, children_json_path, find_task
+from app.json_diff import REPLACE, SPLICE, diff, apply_diff
+import copy
+import hashlib
 import json
 
 #######################################
@@ -28,6 +43,27 @@ class SavedProjects(SchemaTable):
     CREATED_AT = Field("created_at")
     UPDATED_AT = Field("updated_at")
     DELETED_AT = Field("deleted_at")
+    SEARCH_VECTOR = Field("search_vector")
+    # Set instead of tasks for projects stored as deduplicated subtrees,
+    # see TaskSubtrees
+    TASK_ROOTS = Field("task_roots")
+
+    # The fields returned to clients. Derived columns such as search_vector
+    # are left out of reads.
+    ROW_FIELDS = (
+        PROJECT_ID,
+        EMAIL,
+        PROJECT_NAME,
+        PROJECT_DESCRIPTION,
+        TASKS,
+        STATUS,
+        CREATED_AT,
+        UPDATED_AT,
+        DELETED_AT,
+    )
+
+    # Postgres text search configuration used for task search
+    SEARCH_CONFIG = "english"
 
     @classmethod
     def create_sql(cls):
@@ -65,7 +101,176 @@ class SavedProjects(SchemaTable):
         )
 
     @classmethod
-    def insert_record(cls, email: str, project_name: str, project_description: str, tasks: Optional[str]) -> None:
+    def create_indexes_sql(cls) -> Composed:
+        """
+        Generates the SQL to create the secondary indexes on the saved
+        projects table. Safe to run against an existing table.
+        :return: A Composed object with the CREATE INDEX statements
+        """
+        return SQL(
+            """
+            CREATE INDEX IF NOT EXISTS saved_projects_email_updated_at_idx
+                ON {st} ({email}, {updated_at}, {project_id});
+
+            -- Older rows hold the tree as a JSON-encoded string; this unwraps
+            -- them so generated columns and searches see a real tree
+            CREATE OR REPLACE FUNCTION {schema}.normalized_tasks(tasks JSONB) RETURNS JSONB
+            LANGUAGE plpgsql IMMUTABLE AS $$
+            BEGIN
+                IF jsonb_typeof(tasks) = 'string' THEN
+                    RETURN (tasks #>> '{{}}')::jsonb;
+                END IF;
+                RETURN tasks;
+            EXCEPTION WHEN others THEN
+                RETURN NULL;
+            END;
+            $$;
+
+            ALTER TABLE {st} ADD COLUMN IF NOT EXISTS {search_vector} TSVECTOR GENERATED ALWAYS AS (
+                setweight(
+                    to_tsvector({config}, COALESCE(
+                        jsonb_path_query_array({schema}.normalized_tasks({tasks}), 'strict $.**.name'), '[]'::jsonb
+                    )),
+                    'A'
+                ) || setweight(
+                    to_tsvector({config}, COALESCE(
+                        jsonb_path_query_array({schema}.normalized_tasks({tasks}), 'strict $.**.description')
+                        || jsonb_path_query_array({schema}.normalized_tasks({tasks}), 'strict $.**.task_description'),
+                        '[]'::jsonb
+                    )),
+                    'B'
+                )
+            ) STORED;
+
+            CREATE INDEX IF NOT EXISTS saved_projects_search_vector_idx ON {st} USING GIN ({search_vector});
+            CREATE INDEX IF NOT EXISTS saved_projects_tasks_path_idx
+                ON {st} USING GIN (({schema}.normalized_tasks({tasks})) jsonb_path_ops);
+        """
+        ).format(
+            st=cls.string(),
+            schema=cls.schema(),
+            email=cls.EMAIL.string(),
+            updated_at=cls.UPDATED_AT.string(),
+            project_id=cls.PROJECT_ID.string(),
+            tasks=cls.TASKS.string(),
+            search_vector=cls.SEARCH_VECTOR.string(),
+            config=Literal(cls.SEARCH_CONFIG),
+        )
+
+    @classmethod
+    def columns(cls) -> Composed:
+        """
+        The comma separated list of ROW_FIELDS, for use in place of SELECT *.
+        """
+        return SQL(", ").join(field.string() for field in cls.ROW_FIELDS)
+
+    @classmethod
+    def task_nodes_cte(cls, source: str) -> Composed:
+        """
+        Generates a recursive CTE named task_nodes that flattens the task
+        trees of the rows in another CTE into one row per task.
+
+        :param source: the name of a CTE with project_id, email and tasks
+        columns
+        :return: A Composed "task_nodes AS (...)" with the columns
+        project_id, email, path (the child indexes as an integer array),
+        depth (1 for top level tasks) and node (the task's JSON)
+        """
+        return SQL(
+            """
+            task_nodes AS (
+                SELECT s.{project_id}, s.{email}, ARRAY[(e.ordinality - 1)::int] AS path, 1 AS depth, e.node
+                FROM {source} s,
+                     jsonb_array_elements(
+                         CASE WHEN jsonb_typeof(s.{tasks}) = 'array' THEN s.{tasks} ELSE '[]'::jsonb END
+                     ) WITH ORDINALITY AS e(node, ordinality)
+                UNION ALL
+                SELECT n.{project_id}, n.{email}, n.path || (e.ordinality - 1)::int, n.depth + 1, e.node
+                FROM task_nodes n,
+                     jsonb_array_elements(
+                         CASE WHEN jsonb_typeof(n.node -> 'tasks') = 'array' THEN n.node -> 'tasks' ELSE '[]'::jsonb END
+                     ) WITH ORDINALITY AS e(node, ordinality)
+            )
+            """
+        ).format(
+            source=Identifier(source),
+            project_id=cls.PROJECT_ID.string(),
+            email=cls.EMAIL.string(),
+            tasks=cls.TASKS.string(),
+        )
+
+    @classmethod
+    def load_tasks(cls, project: dict) -> list:
+        """
+        Returns a project row's task tree as Python objects. Rows written by
+        insert_record hold the tree as a JSON-encoded string inside the JSONB
+        column, rows written by update_record hold it directly.
+        :param project: a saved_projects row
+        :return: the task tree, or an empty list if there is none
+        """
+        tasks = project.get(cls.TASKS.raw)
+        if isinstance(tasks, str):
+            tasks = json.loads(tasks)
+        return tasks or []
+
+    @classmethod
+    def notify_change(cls, cur, email: str, project_id: int, operation: str) -> None:
+        """
+        Publishes a change on the project changes channel. NOTIFY is
+        transactional, so listeners only hear about it once the write
+        on the same cursor commits.
+
+        :param cur: the cursor the write was made on
+        :param email: the email of the user who owns the project
+        :param project_id: the ID of the changed project
+        :param operation: one of "insert", "update" or "delete", or
+        "write_failed" for coalesced edits that could not be saved
+        """
+        # Keep the payload small, NOTIFY payloads are capped at 8000 bytes
+        payload = json.dumps({"email": email, "project_id": project_id, "operation": operation})
+        cur.execute("SELECT pg_notify(%s, %s);", (PROJECT_CHANGES_CHANNEL, payload))
+
+    @classmethod
+    def after_write(
+        cls,
+        cur,
+        email: str,
+        project_id: int,
+        operation: str,
+        tasks_changed: bool = True,
+        delta: Optional[list] = None,
+    ) -> None:
+        """
+        Runs the bookkeeping every write to a project needs, on the same
+        cursor so it commits or rolls back with the write: refreshes the
+        project's stats rollup, records a version in its history and
+        publishes the change.
+
+        :param cur: the cursor the write was made on
+        :param email: the email of the user who owns the project
+        :param project_id: the ID of the changed project
+        :param operation: one of "insert", "update" or "delete"
+        :param tasks_changed: whether the task tree may have changed
+        :param delta: the write as a diff of the project's history state, if
+        the caller knows it
+        """
+        if operation == "delete":
+            ProjectStats.delete_record(cur, project_id, email)
+        elif tasks_changed:
+            ProjectStats.refresh(cur, project_id, email)
+        if PROJECT_HISTORY_ENABLED:
+            ProjectHistory.record(cur, project_id, email, operation, delta)
+        cls.notify_change(cur, email, project_id, operation)
+
+    @classmethod
+    def insert_record(
+        cls,
+        email: str,
+        project_name: str,
+        project_description: str,
+        tasks: Optional[str],
+        task_roots: Optional[List[str]] = None,
+    ) -> None:
         """
         Insert a new saved project for a given user. Determines the next
         highest project_id for the given email.
@@ -77,11 +282,13 @@ class SavedProjects(SchemaTable):
         is starting
         :param tasks: an optional stringified JSONB input of tasks for the
         project
+        :param task_roots: the hashes of the top level tasks of a tree stored
+        with TaskSubtrees.store, in place of tasks
         """
         # Ensure the email is valid and exists in the auth.users table
         if not isinstance(email, str):
             raise SavedProjectInsertException(f"Email {email} is not a string!")
-        Users.email_exists(email)
+        user_cache.require(email)
 
         # Validate other inputs
         if not isinstance(project_name, str):
@@ -104,18 +311,20 @@ class SavedProjects(SchemaTable):
             st=SavedProjects.string(), project_id=SavedProjects.PROJECT_ID.string(), email=SavedProjects.EMAIL.string()
         )
 
+        # Only deployments that store subtrees have the task_roots column
+        fields = [cls.PROJECT_ID, cls.EMAIL, cls.PROJECT_NAME, cls.PROJECT_DESCRIPTION, cls.TASKS]
+        if task_roots is not None:
+            fields.append(cls.TASK_ROOTS)
+
         insert_query = SQL(
             """
-            INSERT INTO {st} ({project_id}, {email}, {project_name}, {project_description}, {tasks})
-            VALUES (%s, %s, %s, %s, %s);
+            INSERT INTO {st} ({fields})
+            VALUES ({values});
             """
         ).format(
             st=SavedProjects.string(),
-            project_id=SavedProjects.PROJECT_ID.string(),
-            email=SavedProjects.EMAIL.string(),
-            project_name=SavedProjects.PROJECT_NAME.string(),
-            project_description=SavedProjects.PROJECT_DESCRIPTION.string(),
-            tasks=SavedProjects.TASKS.string(),
+            fields=SQL(", ").join(field.string() for field in fields),
+            values=SQL(", ").join(SQL("%s") for _ in fields),
         )
 
         with MinervaCursor() as cur:
@@ -124,16 +333,17 @@ class SavedProjects(SchemaTable):
             next_project_id = cur.fetchone()["next_project_id"]
 
             # Insert the new project with the calculated project_id
-            cur.execute(
-                insert_query,
-                (
-                    next_project_id,
-                    email,
-                    project_name,
-                    project_description,
-                    json.dumps(tasks) if tasks is not None else None,
-                ),
-            )
+            params = [
+                next_project_id,
+                email,
+                project_name,
+                project_description,
+                json.dumps(tasks) if tasks is not None else None,
+            ]
+            if task_roots is not None:
+                params.append(task_roots)
+            cur.execute(insert_query, params)
+            cls.after_write(cur, email, next_project_id, "insert")
 
         return next_project_id
 
@@ -144,6 +354,8 @@ class SavedProjects(SchemaTable):
         project_name: Optional[str] = None,
         project_description: Optional[str] = None,
         tasks: Optional[str] = None,
+        email: Optional[str] = None,
+        task_roots: Optional[List[str]] = None,
     ) -> None:
         """
         Update an existing saved project by project_id.
@@ -152,6 +364,12 @@ class SavedProjects(SchemaTable):
         :param project_name: The new project name (optional).
         :param project_description: The new project description (optional).
         :param tasks: An optional stringified JSONB input of tasks for the project.
+        Fields left as None are unchanged; any other value, even an empty one,
+        is written.
+        :param email: The email of the user who owns the project (optional).
+        When given, only that user's project is updated.
+        :param task_roots: The root hashes of a tree stored with
+        TaskSubtrees.store (optional). Replaces the tasks column.
         :raises SavedProjectUpdateException: If no fields to update were provided or project_id is invalid.
         """
         if not isinstance(project_id, int):
@@ -161,39 +379,113 @@ class SavedProjects(SchemaTable):
         updates = []
         params = []
 
-        if project_name:
+        if project_name is not None:
             updates.append(SQL("{field} = %s").format(field=cls.PROJECT_NAME.string()))
             params.append(project_name)
 
-        if project_description:
+        if project_description is not None:
             updates.append(SQL("{field} = %s").format(field=cls.PROJECT_DESCRIPTION.string()))
             params.append(project_description)
 
-        if tasks:
+        if tasks is not None:
             updates.append(SQL("{field} = %s").format(field=cls.TASKS.string()))
             params.append(tasks)
 
+        if task_roots is not None:
+            updates.append(
+                SQL("{tasks} = NULL, {task_roots} = %s").format(
+                    tasks=cls.TASKS.string(), task_roots=cls.TASK_ROOTS.string()
+                )
+            )
+            params.append(task_roots)
+
         if not updates:
             raise SavedProjectUpdateException("No fields to update were provided.")
 
-        # Add the project_id as the final parameter for the WHERE clause
+        # Bump updated_at so incremental sync picks up the change
+        updates.append(SQL("{field} = CURRENT_TIMESTAMP").format(field=cls.UPDATED_AT.string()))
+
+        # Add the project_id (and owner, if known) as the final parameters for the WHERE clause
+        conditions = [SQL("{field} = %s").format(field=cls.PROJECT_ID.string())]
         params.append(project_id)
 
+        if email is not None:
+            conditions.append(SQL("{field} = %s").format(field=cls.EMAIL.string()))
+            params.append(email)
+
         update_query = SQL(
             """
             UPDATE {st}
             SET {fields}
-            WHERE {project_id} = %s;
+            WHERE {conditions}
+            RETURNING {email};
             """
         ).format(
             st=cls.string(),
             fields=SQL(", ").join(updates),
-            project_id=cls.PROJECT_ID.string(),
+            conditions=SQL(" AND ").join(conditions),
+            email=cls.EMAIL.string(),
         )
 
         # Execute the query
         with MinervaCursor() as cur:
             cur.execute(update_query, params)
+            for row in cur.fetchall():
+                cls.after_write(
+                    cur, row[cls.EMAIL.raw], project_id, "update", tasks_changed=bool(tasks) or task_roots is not None
+                )
+
+    @classmethod
+    def append_subtask(cls, project_id: int, email: str, path: List[int], node: dict) -> int:
+        """
+        Appends a child to one task in a project's tree inside Postgres, so
+        the rest of the tree is neither read nor re-sent.
+
+        :param project_id: The ID of the project to edit.
+        :param email: The email of the user who owns the project.
+        :param path: The child indexes leading to the parent task.
+        :param node: The new task node.
+        :return: The index of the new child within its parent.
+        :raises SavedProjectUpdateException: If the project or parent task
+        does not exist.
+        """
+        if not path or not all(isinstance(index, int) for index in path):
+            raise SavedProjectUpdateException(f"Task path {path} must be a non-empty list of integers!")
+
+        # e.g. [0, 2] is the task at {0,tasks,2} with children at {0,tasks,2,tasks}
+        parent_path = children_json_path(path[:-1]) + [str(path[-1])]
+        children_path = children_json_path(path)
+
+        update_query = SQL(
+            """
+            UPDATE {st}
+            SET {tasks} = jsonb_set(
+                    {tasks}, %s::text[], COALESCE({tasks} #> %s::text[], '[]'::jsonb) || jsonb_build_array(%s::jsonb)
+                ),
+                {updated_at} = CURRENT_TIMESTAMP
+            WHERE {project_id} = %s AND {email} = %s AND jsonb_typeof({tasks} #> %s::text[]) = 'object'
+            RETURNING jsonb_array_length({tasks} #> %s::text[]) - 1 AS child_index;
+            """
+        ).format(
+            st=cls.string(),
+            tasks=cls.TASKS.string(),
+            updated_at=cls.UPDATED_AT.string(),
+            project_id=cls.PROJECT_ID.string(),
+            email=cls.EMAIL.string(),
+        )
+
+        with MinervaCursor() as cur:
+            cur.execute(
+                update_query,
+                (children_path, children_path, json.dumps(node), project_id, email, parent_path, children_path),
+            )
+            result = cur.fetchone()
+            if result is None:
+                raise SavedProjectUpdateException(f"Task {path} does not exist in project {project_id}")
+            delta = ProjectHistory.append_delta(path, result["child_index"], node)
+            cls.after_write(cur, email, project_id, "update", delta=delta)
+
+        return result["child_index"]
 
     @classmethod
     def delete_record(cls, project_id: int, email: str) -> None:
@@ -213,13 +505,14 @@ class SavedProjects(SchemaTable):
         update_query = SQL(
             """
             UPDATE {st}
-            SET {status} = %s, {deleted_at} = CURRENT_TIMESTAMP
+            SET {status} = %s, {deleted_at} = CURRENT_TIMESTAMP, {updated_at} = CURRENT_TIMESTAMP
             WHERE {project_id} = %s AND {email} = %s;
             """
         ).format(
             st=cls.string(),
             status=cls.STATUS.string(),
             deleted_at=cls.DELETED_AT.string(),
+            updated_at=cls.UPDATED_AT.string(),
             project_id=cls.PROJECT_ID.string(),
             email=cls.EMAIL.string(),
         )
@@ -228,6 +521,7 @@ class SavedProjects(SchemaTable):
             cur.execute(update_query, ("deleted", project_id, email))
             if cur.rowcount == 0:
                 raise ValueError(f"No project found with project_id={project_id} and email={email}.")
+            cls.after_write(cur, email, project_id, "delete")
 
     @classmethod
     def select_all(cls, email: str) -> Tuple:
@@ -237,16 +531,16 @@ class SavedProjects(SchemaTable):
         """
         if not isinstance(email, str):
             raise SavedProjectInsertException(f"Email {email} is not a string!")
-        Users.email_exists(email)
+        user_cache.require(email)
         select_query = SQL(
             """
-            SELECT *
+            SELECT {columns}
             FROM {st}
             WHERE {email} = %s AND {status} = 'active';
         """
-        ).format(st=cls.string(), email=cls.EMAIL.string(), status=cls.STATUS.string())
+        ).format(columns=cls.columns(), st=cls.string(), email=cls.EMAIL.string(), status=cls.STATUS.string())
 
-        with MinervaCursor() as cur:
+        with MinervaCursor(read_only=True) as cur:
             cur.execute(select_query, (email,))
             results = cur.fetchall()
 
@@ -263,13 +557,13 @@ class SavedProjects(SchemaTable):
             raise SavedProjectSelectException(f"Project ID {project_id} is not an integer!")
         select_query = SQL(
             """
-                SELECT *
+                SELECT {columns}
                 FROM {st}
                 WHERE {project_id} = %s ;
             """
-        ).format(st=cls.string(), email=cls.PROJECT_ID.string())
+        ).format(columns=cls.columns(), st=cls.string(), project_id=cls.PROJECT_ID.string())
 
-        with MinervaCursor() as cur:
+        with MinervaCursor(read_only=True) as cur:
             cur.execute(select_query, (project_id,))
             results = cur.fetchone()
 
@@ -278,26 +572,1638 @@ class SavedProjects(SchemaTable):
 
         return results
 
+    @classmethod
+    def select_many(cls, project_ids: List[int], email: str, read_only: bool = True) -> Dict[int, Optional[dict]]:
+        """
+        Retrieves several of a user's active projects in a single query.
+        :param project_ids: The IDs of the projects to retrieve.
+        :param email: The email of the user who owns the projects.
+        :param read_only: False to read from the primary, for callers that
+        write back what they read
+        :return: A dict keyed by every requested project_id. Projects that
+        do not exist, are deleted, or belong to someone else map to None.
+        """
+        if not isinstance(email, str):
+            raise SavedProjectSelectException(f"Email {email} is not a string!")
 
-class SavedProjectInsertException(Exception):
-    """
-    An exception for a new saved project
-    """
+        for project_id in project_ids:
+            if not isinstance(project_id, int):
+                raise SavedProjectSelectException(f"Project ID {project_id} is not an integer!")
 
-    pass
+        results = {project_id: None for project_id in project_ids}
+        if not project_ids:
+            return results
+
+        select_query = SQL(
+            """
+            SELECT {columns}
+            FROM {st}
+            WHERE {project_id} = ANY(%s) AND {email} = %s AND {status} = 'active';
+        """
+        ).format(
+            columns=cls.columns(),
+            st=cls.string(),
+            project_id=cls.PROJECT_ID.string(),
+            email=cls.EMAIL.string(),
+            status=cls.STATUS.string(),
+        )
 
+        with MinervaCursor(read_only=read_only) as cur:
+            cur.execute(select_query, (list(results), email))
+            for row in cur.fetchall():
+                results[row[cls.PROJECT_ID.raw]] = row
 
-class SavedProjectUpdateException(Exception):
+        return results
+
+    @classmethod
+    def select_changes(
+        cls, email: str, since: Optional[Tuple[datetime, int]], limit: int, lag_seconds: float
+    ) -> Tuple[List[dict], bool, Tuple[datetime, int]]:
+        """
+        Retrieves a user's projects that were created, updated or deleted
+        after a watermark, in (updated_at, project_id) order.
+
+        Rows committed by slower, overlapping transactions can land behind a
+        watermark that was already handed out. The returned watermark is
+        therefore never advanced past lag_seconds ago, so recent changes are
+        sent again on the next poll instead of being missed.
+
+        :param email: The email of the user who owns the projects.
+        :param since: The (updated_at, project_id) watermark of the last sync,
+        or None for a full sync of the active projects.
+        :param limit: The maximum number of rows to return.
+        :param lag_seconds: How far behind the database clock the watermark
+        is held.
+        :return: A tuple of (rows, has_more, next watermark).
+        """
+        if not isinstance(email, str):
+            raise SavedProjectSelectException(f"Email {email} is not a string!")
+
+        if since is None:
+            condition = SQL("{status} = 'active'").format(status=cls.STATUS.string())
+            params = [email]
+        else:
+            condition = SQL("({updated_at}, {project_id}) > (%s, %s)").format(
+                updated_at=cls.UPDATED_AT.string(), project_id=cls.PROJECT_ID.string()
+            )
+            params = [email, since[0], since[1]]
+
+        select_query = SQL(
+            """
+            SELECT {columns}
+            FROM {st}
+            WHERE {email} = %s AND {condition}
+            ORDER BY {updated_at}, {project_id}
+            LIMIT %s;
+        """
+        ).format(
+            columns=cls.columns(),
+            st=cls.string(),
+            email=cls.EMAIL.string(),
+            condition=condition,
+            updated_at=cls.UPDATED_AT.string(),
+            project_id=cls.PROJECT_ID.string(),
+        )
+
+        with MinervaCursor() as cur:
+            cur.execute(SQL("SELECT LOCALTIMESTAMP - make_interval(secs => %s) AS cutoff;"), (lag_seconds,))
+            cutoff = cur.fetchone()["cutoff"]
+
+            # Fetch one extra row to learn whether another page exists
+            cur.execute(select_query, params + [limit + 1])
+            rows = cur.fetchall()
+
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+
+        cutoff_watermark = (cutoff, 0)
+        if has_more:
+            # Always make progress through a full page
+            watermark = (rows[-1][cls.UPDATED_AT.raw], rows[-1][cls.PROJECT_ID.raw])
+        elif rows:
+            watermark = min((rows[-1][cls.UPDATED_AT.raw], rows[-1][cls.PROJECT_ID.raw]), cutoff_watermark)
+        else:
+            watermark = min(since, cutoff_watermark) if since is not None else cutoff_watermark
+
+        return rows, has_more, watermark
+
+    @classmethod
+    def search_tasks(
+        cls,
+        email: str,
+        query: Optional[str] = None,
+        completed: Optional[bool] = None,
+        priority: Optional[str] = None,
+        limit: int = 50,
+    ) -> List[dict]:
+        """
+        Searches the tasks of all of a user's active projects without
+        returning whole trees. Projects are first narrowed with the GIN
+        indexes on search_vector and tasks, then only the candidates' trees
+        are walked to find the matching tasks.
+
+        :param email: The email of the user who owns the projects.
+        :param query: Free text matched against task names and descriptions,
+        in web search syntax (quotes, OR, -word).
+        :param completed: Only return tasks with this completed flag.
+        :param priority: Only return tasks with this priority.
+        :param limit: The maximum number of tasks to return.
+        :return: A list of matches with project_id, project_name, path (the
+        child indexes of the task), name, description, completed and priority.
+        """
+        if not isinstance(email, str):
+            raise SavedProjectSelectException(f"Email {email} is not a string!")
+
+        if not query and completed is None and priority is None:
+            raise SavedProjectSelectException("A search needs a query or a filter.")
+
+        config = Literal(cls.SEARCH_CONFIG)
+        description = SQL("COALESCE(n.node ->> 'description', n.node ->> 'task_description')")
+        node_priority = SQL("COALESCE(n.node ->> 'priority', n.node ->> 'task_priority')")
+        node_completed = SQL("COALESCE(n.node -> 'completed' = 'true'::jsonb, FALSE)")
+
+        # Filters on whole projects, served by the GIN indexes
+        project_filters = [
+            SQL("{email} = %s AND {status} = 'active'").format(email=cls.EMAIL.string(), status=cls.STATUS.string())
+        ]
+        project_params = [email]
+
+        # Filters on the individual tasks of the candidate projects
+        node_filters = [SQL("TRUE")]
+        node_params = []
+
+        if query:
+            project_filters.append(
+                SQL("{search_vector} @@ websearch_to_tsquery({config}, %s)").format(
+                    search_vector=cls.SEARCH_VECTOR.string(), config=config
+                )
+            )
+            project_params.append(query)
+            node_filters.append(
+                SQL(
+                    "to_tsvector({config}, COALESCE(n.node ->> 'name', '') || ' ' || COALESCE({description}, '')) "
+                    "@@ websearch_to_tsquery({config}, %s)"
+                ).format(config=config, description=description)
+            )
+            node_params.append(query)
+
+        if completed:
+            # A literal jsonpath lets the planner use the jsonb_path_ops index.
+            # Tasks without a completed flag count as incomplete, so only the
+            # completed=true filter can narrow projects this way.
+            project_filters.append(
+                SQL("{schema}.normalized_tasks({tasks}) @? '$.** ? (@.completed == true)'").format(
+                    schema=cls.schema(), tasks=cls.TASKS.string()
+                )
+            )
+
+        if completed is not None:
+            node_filters.append(SQL("{node_completed} = %s").format(node_completed=node_completed))
+            node_params.append(completed)
+
+        if priority is not None:
+            node_filters.append(SQL("{priority} = %s").format(priority=node_priority))
+            node_params.append(priority)
+
+        search_query = SQL(
+            """
+            WITH RECURSIVE candidates AS (
+                SELECT {project_id}, {email}, {schema}.normalized_tasks({tasks}) AS {tasks}
+                FROM {st}
+                WHERE {project_filters}
+            ), {task_nodes}
+            SELECT n.{project_id}, p.{project_name}, n.path, n.node ->> 'name' AS name,
+                   {description} AS description,
+                   {completed} AS completed,
+                   {priority} AS priority
+            FROM task_nodes n
+            JOIN {st} p ON p.{project_id} = n.{project_id} AND p.{email} = n.{email}
+            WHERE {node_filters}
+            ORDER BY n.{project_id}, n.path
+            LIMIT %s;
+            """
+        ).format(
+            st=cls.string(),
+            schema=cls.schema(),
+            project_id=cls.PROJECT_ID.string(),
+            project_name=cls.PROJECT_NAME.string(),
+            email=cls.EMAIL.string(),
+            tasks=cls.TASKS.string(),
+            project_filters=SQL(" AND ").join(project_filters),
+            task_nodes=cls.task_nodes_cte("candidates"),
+            description=description,
+            completed=node_completed,
+            priority=node_priority,
+            node_filters=SQL(" AND ").join(node_filters),
+        )
+
+        with MinervaCursor(read_only=True) as cur:
+            cur.execute(search_query, project_params + node_params + [limit])
+            return cur.fetchall()
+
+
+class ProjectStats(SchemaTable):
     """
-    An exception for updating a saved project
+    The specification for the Project Stats table in the Projects schema.
+    Each row is a rollup of one active project's task tree, refreshed on
+    every write to it, so dashboards can read stats without loading trees.
     """
 
-    pass
+    SCHEMA = "projects"
+    TABLE = "project_stats"
+
+    # Field constants
+    PROJECT_ID = Field("project_id")
+    EMAIL = Field("email")
+    TOTAL_TASKS = Field("total_tasks")
+    COMPLETED_TASKS = Field("completed_tasks")
+    MAX_DEPTH = Field("max_depth")
+    TASKS_BY_PRIORITY = Field("tasks_by_priority")
+    INCOMPLETE_DUE_DATES = Field("incomplete_due_dates")
+    REFRESHED_AT = Field("refreshed_at")
 
+    # The priority counted for tasks that do not have one
+    NO_PRIORITY = "none"
 
-class SavedProjectSelectException(Exception):
-    """
-    An exception for selecting info from a saved project
+    @classmethod
+    def create_sql(cls) -> Composed:
+        """
+        Generates the SQL to create the project stats table.
+        tasks_by_priority maps each priority to its number of tasks, and
+        incomplete_due_dates maps each ISO due date to the number of
+        incomplete tasks due on it, so overdue counts stay correct as days
+        pass without a refresh.
+        :return: A Composed object with the CREATE TABLE statement
+        """
+        return SQL(
+            """
+            CREATE TABLE IF NOT EXISTS {st} (
+                {project_id} INTEGER NOT NULL,
+                {email} VARCHAR(100) NOT NULL,
+                {total_tasks} INTEGER NOT NULL DEFAULT 0,
+                {completed_tasks} INTEGER NOT NULL DEFAULT 0,
+                {max_depth} INTEGER NOT NULL DEFAULT 0,
+                {tasks_by_priority} JSONB NOT NULL DEFAULT '{{}}',
+                {incomplete_due_dates} JSONB NOT NULL DEFAULT '{{}}',
+                {refreshed_at} TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY ({project_id}, {email}),
+                FOREIGN KEY ({project_id}, {email}) REFERENCES {projects} ({project_id}, {email}) ON DELETE CASCADE
+            );
+        """
+        ).format(
+            st=cls.string(),
+            projects=SavedProjects.string(),
+            project_id=cls.PROJECT_ID.string(),
+            email=cls.EMAIL.string(),
+            total_tasks=cls.TOTAL_TASKS.string(),
+            completed_tasks=cls.COMPLETED_TASKS.string(),
+            max_depth=cls.MAX_DEPTH.string(),
+            tasks_by_priority=cls.TASKS_BY_PRIORITY.string(),
+            incomplete_due_dates=cls.INCOMPLETE_DUE_DATES.string(),
+            refreshed_at=cls.REFRESHED_AT.string(),
+        )
+
+    @classmethod
+    def refresh_sql(cls, project_filter: Composed) -> Composed:
+        """
+        Generates the upsert that recomputes the stats of every active
+        project matching project_filter in a single pass over their trees.
+        :param project_filter: a condition on the saved projects table
+        :return: A Composed "WITH ... INSERT" statement
+        """
+        return SQL(
+            """
+            WITH RECURSIVE source AS (
+                SELECT {project_id}, {email}, {schema}.normalized_tasks({tasks}) AS {tasks}
+                FROM {projects}
+                WHERE {status} = 'active' AND {project_filter}
+            ),
+            {task_nodes},
+            nodes AS (
+                SELECT {project_id}, {email}, depth,
+                       COALESCE(node -> 'completed' = 'true'::jsonb, false) AS completed,
+                       COALESCE(NULLIF(COALESCE(node ->> 'priority', node ->> 'task_priority'), ''), {no_priority})
+                           AS priority,
+                       left(node ->> 'task_due_date', 10) AS due_date
+                FROM task_nodes
+            ),
+            totals AS (
+                SELECT s.{project_id}, s.{email}, count(n.depth) AS total_tasks,
+                       count(*) FILTER (WHERE n.completed) AS completed_tasks,
+                       COALESCE(max(n.depth), 0) AS max_depth
+                FROM source s
+                LEFT JOIN nodes n ON n.{project_id} = s.{project_id} AND n.{email} = s.{email}
+                GROUP BY s.{project_id}, s.{email}
+            ),
+            priorities AS (
+                SELECT {project_id}, {email}, jsonb_object_agg(priority, task_count) AS tasks_by_priority
+                FROM (
+                    SELECT {project_id}, {email}, priority, count(*) AS task_count
+                    FROM nodes GROUP BY {project_id}, {email}, priority
+                ) p
+                GROUP BY {project_id}, {email}
+            ),
+            due_dates AS (
+                SELECT {project_id}, {email}, jsonb_object_agg(due_date, task_count) AS incomplete_due_dates
+                FROM (
+                    SELECT {project_id}, {email}, due_date, count(*) AS task_count
+                    FROM nodes
+                    WHERE NOT completed AND due_date ~ '^[0-9]{{4}}-[0-9]{{2}}-[0-9]{{2}}$'
+                    GROUP BY {project_id}, {email}, due_date
+                ) d
+                GROUP BY {project_id}, {email}
+            )
+            INSERT INTO {st} ({project_id}, {email}, {total_tasks}, {completed_tasks}, {max_depth},
+                              {tasks_by_priority}, {incomplete_due_dates}, {refreshed_at})
+            SELECT t.{project_id}, t.{email}, t.total_tasks, t.completed_tasks, t.max_depth,
+                   COALESCE(p.tasks_by_priority, '{{}}'), COALESCE(d.incomplete_due_dates, '{{}}'), CURRENT_TIMESTAMP
+            FROM totals t
+            LEFT JOIN priorities p ON p.{project_id} = t.{project_id} AND p.{email} = t.{email}
+            LEFT JOIN due_dates d ON d.{project_id} = t.{project_id} AND d.{email} = t.{email}
+            ON CONFLICT ({project_id}, {email}) DO UPDATE SET
+                {total_tasks} = EXCLUDED.{total_tasks},
+                {completed_tasks} = EXCLUDED.{completed_tasks},
+                {max_depth} = EXCLUDED.{max_depth},
+                {tasks_by_priority} = EXCLUDED.{tasks_by_priority},
+                {incomplete_due_dates} = EXCLUDED.{incomplete_due_dates},
+                {refreshed_at} = EXCLUDED.{refreshed_at};
+            """
+        ).format(
+            st=cls.string(),
+            projects=SavedProjects.string(),
+            schema=SavedProjects.schema(),
+            project_filter=project_filter,
+            task_nodes=SavedProjects.task_nodes_cte("source"),
+            no_priority=Literal(cls.NO_PRIORITY),
+            project_id=cls.PROJECT_ID.string(),
+            email=cls.EMAIL.string(),
+            tasks=SavedProjects.TASKS.string(),
+            status=SavedProjects.STATUS.string(),
+            total_tasks=cls.TOTAL_TASKS.string(),
+            completed_tasks=cls.COMPLETED_TASKS.string(),
+            max_depth=cls.MAX_DEPTH.string(),
+            tasks_by_priority=cls.TASKS_BY_PRIORITY.string(),
+            incomplete_due_dates=cls.INCOMPLETE_DUE_DATES.string(),
+            refreshed_at=cls.REFRESHED_AT.string(),
+        )
+
+    @classmethod
+    def refresh(cls, cur, project_id: int, email: str) -> None:
+        """
+        Recomputes a project's stats. Takes the cursor of the write that
+        changed the project, so the rollup commits with it.
+        """
+        project_filter = SQL("{project_id} = %s AND {email} = %s").format(
+            project_id=SavedProjects.PROJECT_ID.string(), email=SavedProjects.EMAIL.string()
+        )
+        cur.execute(cls.refresh_sql(project_filter), (project_id, email))
+
+    @classmethod
+    def delete_record(cls, cur, project_id: int, email: str) -> None:
+        """
+        Drops a deleted project's stats, on the cursor of the delete.
+        """
+        delete_query = SQL("DELETE FROM {st} WHERE {project_id} = %s AND {email} = %s;").format(
+            st=cls.string(), project_id=cls.PROJECT_ID.string(), email=cls.EMAIL.string()
+        )
+        cur.execute(delete_query, (project_id, email))
+
+    @classmethod
+    def backfill(cls) -> int:
+        """
+        Computes the stats of every active project, for projects saved
+        before the rollup existed. Safe to run again at any time.
+        :return: the number of projects refreshed
+        """
+        with MinervaCursor() as cur:
+            cur.execute(cls.refresh_sql(SQL("TRUE")))
+            return cur.rowcount
+
+    @classmethod
+    def select_query(cls, project_filter: Composed) -> Composed:
+        """
+        Generates the read of the stats of a user's active projects, with
+        the completion percentage and the number of overdue tasks derived
+        from the stored counts.
+        """
+        return SQL(
+            """
+            SELECT s.{project_id}, p.{project_name}, s.{total_tasks}, s.{completed_tasks},
+                   round(100.0 * s.{completed_tasks} / NULLIF(s.{total_tasks}, 0), 1)::float AS completion_percentage,
+                   (
+                       SELECT COALESCE(sum(d.value::int), 0)::int
+                       FROM jsonb_each_text(s.{incomplete_due_dates}) d
+                       WHERE d.key < to_char(CURRENT_DATE, 'YYYY-MM-DD')
+                   ) AS overdue_tasks,
+                   s.{max_depth}, s.{tasks_by_priority}, s.{incomplete_due_dates}, s.{refreshed_at}
+            FROM {st} s
+            JOIN {projects} p ON p.{project_id} = s.{project_id} AND p.{email} = s.{email}
+            WHERE s.{email} = %s AND p.{status} = 'active' AND {project_filter}
+            ORDER BY s.{project_id};
+            """
+        ).format(
+            st=cls.string(),
+            projects=SavedProjects.string(),
+            project_filter=project_filter,
+            project_id=cls.PROJECT_ID.string(),
+            email=cls.EMAIL.string(),
+            project_name=SavedProjects.PROJECT_NAME.string(),
+            status=SavedProjects.STATUS.string(),
+            total_tasks=cls.TOTAL_TASKS.string(),
+            completed_tasks=cls.COMPLETED_TASKS.string(),
+            max_depth=cls.MAX_DEPTH.string(),
+            tasks_by_priority=cls.TASKS_BY_PRIORITY.string(),
+            incomplete_due_dates=cls.INCOMPLETE_DUE_DATES.string(),
+            refreshed_at=cls.REFRESHED_AT.string(),
+        )
+
+    @classmethod
+    def select_all(cls, email: str) -> List[dict]:
+        """
+        Retrieves the stats of every active project of a user.
+        """
+        if not isinstance(email, str):
+            raise SavedProjectSelectException(f"Email {email} is not a string!")
+
+        with MinervaCursor(read_only=True) as cur:
+            cur.execute(cls.select_query(SQL("TRUE")), (email,))
+            return cur.fetchall()
+
+    @classmethod
+    def select_one(cls, project_id: int, email: str) -> dict:
+        """
+        Retrieves the stats of one of a user's active projects.
+        :raises SavedProjectSelectException: if the user has no such project
+        """
+        if not isinstance(project_id, int):
+            raise SavedProjectSelectException(f"Project ID {project_id} is not an integer!")
+
+        project_filter = SQL("s.{project_id} = %s").format(project_id=cls.PROJECT_ID.string())
+        with MinervaCursor(read_only=True) as cur:
+            cur.execute(cls.select_query(project_filter), (email, project_id))
+            stats = cur.fetchone()
+
+        if stats is None:
+            raise SavedProjectSelectException(f"Project ID {project_id} does not exist!")
+
+        return stats
+
+
+class TaskSubtrees(SchemaTable):
+    """
+    The specification for the Task Subtrees table in the Projects schema,
+    a content-addressed store of task trees. Each row is one task, keyed by
+    the hash of its fields and its children's hashes, so a subtree that
+    appears in many projects (or many times in one) is stored once.
+    Projects saved this way keep only the hashes of their top level tasks
+    in task_roots, and their trees are reassembled when read.
+
+    Stats and search read the tasks column, so they do not cover projects
+    stored as subtrees; the routes refuse them when subtrees are in use.
+    """
+
+    SCHEMA = "projects"
+    TABLE = "task_subtrees"
+
+    # The advisory lock held while collecting garbage, so only one process
+    # walks the stored trees at a time
+    GC_LOCK_ID = 4_152_001
+
+    # Field constants
+    SUBTREE_HASH = Field("subtree_hash")
+    NODE = Field("node")
+    CHILD_HASHES = Field("child_hashes")
+    REFERENCED_AT = Field("referenced_at")
+
+    @classmethod
+    def create_sql(cls) -> Composed:
+        """
+        Generates the SQL to create the task subtrees table and the
+        task_roots column of saved projects.
+        node holds the task without its children. child_hashes holds the hashes
+        of its children in order, or is NULL for a task without a list of
+        children, so trees round trip exactly.
+        :return: A Composed object with the CREATE TABLE statement
+        """
+        return SQL(
+            """
+            CREATE TABLE IF NOT EXISTS {st} (
+                {subtree_hash} CHAR(64) PRIMARY KEY,
+                {node} JSONB NOT NULL,
+                {child_hashes} TEXT[],
+                {referenced_at} TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+            );
+
+            ALTER TABLE {projects} ADD COLUMN IF NOT EXISTS {task_roots} TEXT[];
+        """
+        ).format(
+            st=cls.string(),
+            projects=SavedProjects.string(),
+            task_roots=SavedProjects.TASK_ROOTS.string(),
+            subtree_hash=cls.SUBTREE_HASH.string(),
+            node=cls.NODE.string(),
+            child_hashes=cls.CHILD_HASHES.string(),
+            referenced_at=cls.REFERENCED_AT.string(),
+        )
+
+    @classmethod
+    def hash_tree(cls, tasks: list) -> Tuple[List[str], Dict[str, dict]]:
+        """
+        Splits a task tree into content-addressed rows. A task's hash covers
+        its children's hashes, so changing one task only changes the hashes
+        on its path to the top.
+        :param tasks: the top level list of task nodes
+        :return: the hashes of the top level tasks, and every distinct row
+        keyed by its hash
+        """
+        rows = {}
+
+        def visit(task) -> str:
+            node, children = task, None
+            if isinstance(task, dict) and isinstance(task.get(CHILDREN), list):
+                node = {key: value for key, value in task.items() if key != CHILDREN}
+                children = [visit(child) for child in task[CHILDREN]]
+            row = {"node": node, "children": children}
+            subtree_hash = hashlib.sha256(
+                json.dumps(row, sort_keys=True, separators=(",", ":")).encode("utf-8")
+            ).hexdigest()
+            rows[subtree_hash] = row
+            return subtree_hash
+
+        return [visit(task) for task in tasks], rows
+
+    @classmethod
+    def store(cls, cur, tasks: list, known: Iterable[str] = ()) -> List[str]:
+        """
+        Saves the rows of a task tree that are not stored yet.
+        Rows that are already stored are not sent again, only marked
+        referenced if they were not recently, so garbage collection leaves
+        them alone until the project that reuses them has committed.
+
+        :param cur: the cursor of the write that will reference the tree
+        :param tasks: the top level list of task nodes
+        :param known: hashes known to be stored and referenced, e.g. those of
+        a tree just loaded from a project locked by this transaction
+        :return: the hashes of the top level tasks, for task_roots
+        """
+        roots, rows = cls.hash_tree(tasks)
+        known = set(known)
+        unknown = [subtree_hash for subtree_hash in rows if subtree_hash not in known]
+        if not unknown:
+            return roots
+
+        select_query = SQL(
+            """
+            SELECT {subtree_hash}
+            FROM {st}
+            WHERE {subtree_hash} = ANY(%s)
+              AND {referenced_at} > CURRENT_TIMESTAMP - make_interval(secs => %s);
+            """
+        ).format(st=cls.string(), subtree_hash=cls.SUBTREE_HASH.string(), referenced_at=cls.REFERENCED_AT.string())
+
+        upsert_query = SQL(
+            """
+            INSERT INTO {st} ({subtree_hash}, {node}, {child_hashes})
+            SELECT e ->> 'hash', e -> 'node',
+                   CASE WHEN jsonb_typeof(e -> 'children') = 'array'
+                        THEN ARRAY(SELECT jsonb_array_elements_text(e -> 'children')) END
+            FROM jsonb_array_elements(%s::jsonb) e
+            ON CONFLICT ({subtree_hash}) DO UPDATE SET {referenced_at} = CURRENT_TIMESTAMP;
+            """
+        ).format(
+            st=cls.string(),
+            subtree_hash=cls.SUBTREE_HASH.string(),
+            node=cls.NODE.string(),
+            child_hashes=cls.CHILD_HASHES.string(),
+            referenced_at=cls.REFERENCED_AT.string(),
+        )
+
+        # Recently referenced rows cannot be collected for another half of
+        # the grace period, which is ample time for this write to commit
+        cur.execute(select_query, (unknown, SUBTREE_GC_GRACE_SECONDS / 2))
+        fresh = {row[cls.SUBTREE_HASH.raw] for row in cur.fetchall()}
+        missing = [
+            {"hash": subtree_hash, **rows[subtree_hash]} for subtree_hash in unknown if subtree_hash not in fresh
+        ]
+        if missing:
+            cur.execute(upsert_query, (json.dumps(missing),))
+        return roots
+
+    @classmethod
+    def load(cls, cur, roots: List[List[str]]) -> Tuple[List[list], Set[str]]:
+        """
+        Reassembles task trees from their root hashes. Every row reachable
+        from any of the trees is read once in a single query, however many
+        times it occurs.
+        :param cur: a cursor
+        :param roots: the task_roots of each tree
+        :return: the trees, in the order of roots, and the hashes they use
+        :raises SavedProjectSelectException: if a row is missing
+        """
+        load_query = SQL(
+            """
+            WITH RECURSIVE reachable AS (
+                SELECT s.{subtree_hash}, s.{node}, s.{child_hashes}
+                FROM {st} s
+                WHERE s.{subtree_hash} = ANY(%s)
+                UNION
+                SELECT s.{subtree_hash}, s.{node}, s.{child_hashes}
+                FROM reachable r
+                CROSS JOIN LATERAL unnest(r.{child_hashes}) AS c(child_hash)
+                JOIN {st} s ON s.{subtree_hash} = c.child_hash
+            )
+            SELECT {subtree_hash}, {node}, {child_hashes} FROM reachable;
+            """
+        ).format(
+            st=cls.string(),
+            subtree_hash=cls.SUBTREE_HASH.string(),
+            node=cls.NODE.string(),
+            child_hashes=cls.CHILD_HASHES.string(),
+        )
+
+        top_level = sorted({subtree_hash for tree_roots in roots for subtree_hash in tree_roots})
+        rows = {}
+        if top_level:
+            cur.execute(load_query, (top_level,))
+            rows = {row[cls.SUBTREE_HASH.raw]: row for row in cur.fetchall()}
+
+        def build(subtree_hash: str):
+            row = rows.get(subtree_hash)
+            if row is None:
+                raise SavedProjectSelectException(f"Task subtree {subtree_hash} does not exist!")
+            # Each occurrence gets its own copy, so callers may edit trees freely
+            task = copy.deepcopy(row[cls.NODE.raw])
+            if row[cls.CHILD_HASHES.raw] is not None:
+                task[CHILDREN] = [build(child) for child in row[cls.CHILD_HASHES.raw]]
+            return task
+
+        return [[build(subtree_hash) for subtree_hash in tree_roots] for tree_roots in roots], set(rows)
+
+    @classmethod
+    def assemble(cls, projects: List[dict], read_only: bool = True) -> List[dict]:
+        """
+        Fills in the tasks of saved_projects rows whose trees are stored as
+        subtrees. Rows with a tasks column of their own are left as they are.
+        :param projects: saved_projects rows, edited in place
+        :param read_only: False to read from the primary
+        :return: projects
+        """
+        if not projects:
+            return projects
+
+        roots_query = SQL(
+            """
+            SELECT {project_id}, {email}, {task_roots}
+            FROM {projects}
+            WHERE ({project_id}, {email}) IN (SELECT * FROM unnest(%s::int[], %s::text[]))
+              AND {task_roots} IS NOT NULL;
+            """
+        ).format(
+            projects=SavedProjects.string(),
+            project_id=SavedProjects.PROJECT_ID.string(),
+            email=SavedProjects.EMAIL.string(),
+            task_roots=SavedProjects.TASK_ROOTS.string(),
+        )
+
+        keys = [(project[SavedProjects.PROJECT_ID.raw], project[SavedProjects.EMAIL.raw]) for project in projects]
+        with MinervaCursor(read_only=read_only) as cur:
+            cur.execute(roots_query, ([key[0] for key in keys], [key[1] for key in keys]))
+            stored = {
+                (row[SavedProjects.PROJECT_ID.raw], row[SavedProjects.EMAIL.raw]): row[SavedProjects.TASK_ROOTS.raw]
+                for row in cur.fetchall()
+            }
+            trees, _ = cls.load(cur, list(stored.values()))
+
+        trees = dict(zip(stored, trees))
+        for key, project in zip(keys, projects):
+            if key in trees:
+                project[SavedProjects.TASKS.raw] = trees[key]
+        return projects
+
+    @classmethod
+    def append_subtask(cls, project_id: int, email: str, path: List[int], node: dict) -> int:
+        """
+        Appends a child to one task of a project stored as subtrees. Only the
+        new task and the tasks on its path to the top get new rows. A project
+        that still has a tasks column is moved over to subtrees.
+
+        :param project_id: The ID of the project to edit.
+        :param email: The email of the user who owns the project.
+        :param path: The child indexes leading to the parent task.
+        :param node: The new task node.
+        :return: The index of the new child within its parent.
+        :raises SavedProjectUpdateException: If the project or parent task
+        does not exist.
+        """
+        if not path or not all(isinstance(index, int) for index in path):
+            raise SavedProjectUpdateException(f"Task path {path} must be a non-empty list of integers!")
+
+        # Lock the project so concurrent appends to it queue up
+        lock_query = SQL(
+            """
+            SELECT {tasks}, {task_roots}
+            FROM {projects}
+            WHERE {project_id} = %s AND {email} = %s
+            FOR UPDATE;
+            """
+        ).format(
+            projects=SavedProjects.string(),
+            tasks=SavedProjects.TASKS.string(),
+            task_roots=SavedProjects.TASK_ROOTS.string(),
+            project_id=SavedProjects.PROJECT_ID.string(),
+            email=SavedProjects.EMAIL.string(),
+        )
+
+        update_query = SQL(
+            """
+            UPDATE {projects}
+            SET {tasks} = NULL, {task_roots} = %s, {updated_at} = CURRENT_TIMESTAMP
+            WHERE {project_id} = %s AND {email} = %s;
+            """
+        ).format(
+            projects=SavedProjects.string(),
+            tasks=SavedProjects.TASKS.string(),
+            task_roots=SavedProjects.TASK_ROOTS.string(),
+            updated_at=SavedProjects.UPDATED_AT.string(),
+            project_id=SavedProjects.PROJECT_ID.string(),
+            email=SavedProjects.EMAIL.string(),
+        )
+
+        with MinervaCursor() as cur:
+            cur.execute(lock_query, (project_id, email))
+            project = cur.fetchone()
+            if project is None:
+                raise SavedProjectUpdateException(f"Task {path} does not exist in project {project_id}")
+
+            known = set()
+            if project[SavedProjects.TASK_ROOTS.raw] is not None:
+                (tasks,), known = cls.load(cur, [project[SavedProjects.TASK_ROOTS.raw]])
+            else:
+                tasks = SavedProjects.load_tasks(project)
+
+            parent = find_task(tasks, path)
+            if parent is None or (CHILDREN in parent and not isinstance(parent[CHILDREN], list)):
+                raise SavedProjectUpdateException(f"Task {path} does not exist in project {project_id}")
+            parent.setdefault(CHILDREN, []).append(node)
+
+            child_index = len(parent[CHILDREN]) - 1
+            cur.execute(update_query, (cls.store(cur, tasks, known), project_id, email))
+            SavedProjects.after_write(
+                cur, email, project_id, "update", delta=ProjectHistory.append_delta(path, child_index, node)
+            )
+
+        return child_index
+
+    @classmethod
+    def collect_garbage(cls, grace_seconds: float = SUBTREE_GC_GRACE_SECONDS) -> int:
+        """
+        Deletes the rows no saved project or template can reach any more,
+        e.g. after tasks were edited or projects purged. Rows referenced within the
+        grace period are kept, as a write that is still in flight may be
+        about to reference them. Run on the workers' sweeps (see
+        app.lifecycle); a call made while another process collects does
+        nothing.
+        :return: the number of rows deleted
+        """
+        delete_query = SQL(
+            """
+            WITH RECURSIVE reachable AS (
+                SELECT unnest({task_roots}) AS {subtree_hash}
+                FROM {projects}
+                WHERE {task_roots} IS NOT NULL
+                UNION
+                SELECT unnest({template_roots})
+                FROM {templates}
+                WHERE {template_roots} IS NOT NULL
+                UNION
+                SELECT c.child_hash
+                FROM reachable r
+                JOIN {st} s ON s.{subtree_hash} = r.{subtree_hash}
+                CROSS JOIN LATERAL unnest(s.{child_hashes}) AS c(child_hash)
+            )
+            DELETE FROM {st} s
+            WHERE s.{referenced_at} < CURRENT_TIMESTAMP - make_interval(secs => %s)
+              AND NOT EXISTS (SELECT 1 FROM reachable r WHERE r.{subtree_hash} = s.{subtree_hash});
+            """
+        ).format(
+            st=cls.string(),
+            projects=SavedProjects.string(),
+            templates=ProjectTemplates.string(),
+            task_roots=SavedProjects.TASK_ROOTS.string(),
+            template_roots=ProjectTemplates.TASK_ROOTS.string(),
+            subtree_hash=cls.SUBTREE_HASH.string(),
+            child_hashes=cls.CHILD_HASHES.string(),
+            referenced_at=cls.REFERENCED_AT.string(),
+        )
+
+        with MinervaCursor() as cur:
+            cur.execute("SELECT pg_try_advisory_xact_lock(%s) AS locked;", (cls.GC_LOCK_ID,))
+            if not cur.fetchone()["locked"]:
+                # Another process is collecting
+                return 0
+            cur.execute(delete_query, (grace_seconds,))
+            return cur.rowcount
+
+
+class ProjectHistory(SchemaTable):
+    """
+    The specification for the Project Versions table in the Projects
+    schema. Every write to a project records a version of its name,
+    description and tasks. Most versions hold only a diff (see
+    app.json_diff) against the version before; a full keyframe is stored
+    every HISTORY_KEYFRAME_INTERVAL versions, so rebuilding any version
+    reads at most that many rows.
+    """
+
+    SCHEMA = "projects"
+    TABLE = "project_versions"
+
+    # The advisory lock held while applying retention and picking the
+    # projects to compact, so only one process does so at a time. Each
+    # project is then compacted under its own row lock.
+    COMPACT_LOCK_ID = 4_152_002
+
+    # Field constants
+    PROJECT_ID = Field("project_id")
+    EMAIL = Field("email")
+    VERSION = Field("version")
+    OPERATION = Field("operation")
+    KEYFRAME = Field("keyframe")
+    CONTENT = Field("content")
+    CREATED_AT = Field("created_at")
+
+    # The fields of a project each version records
+    STATE_FIELDS = (SavedProjects.PROJECT_NAME, SavedProjects.PROJECT_DESCRIPTION, SavedProjects.TASKS)
+
+    # Greater than any version, to read up to the latest one
+    LATEST = 2**31 - 1
+
+    @classmethod
+    def create_sql(cls) -> Composed:
+        """
+        Generates the SQL to create the project versions table.
+        content holds the project's state for keyframes, and the diff from
+        the previous version otherwise.
+        :return: A Composed object with the CREATE TABLE statement
+        """
+        return SQL(
+            """
+            CREATE TABLE IF NOT EXISTS {st} (
+                {project_id} INTEGER NOT NULL,
+                {email} VARCHAR(100) NOT NULL,
+                {version} INTEGER NOT NULL,
+                {operation} VARCHAR(20) NOT NULL,
+                {keyframe} BOOLEAN NOT NULL,
+                {content} JSONB NOT NULL,
+                {created_at} TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY ({project_id}, {email}, {version}),
+                FOREIGN KEY ({project_id}, {email}) REFERENCES {projects} ({project_id}, {email}) ON DELETE CASCADE
+            );
+        """
+        ).format(
+            st=cls.string(),
+            projects=SavedProjects.string(),
+            project_id=cls.PROJECT_ID.string(),
+            email=cls.EMAIL.string(),
+            version=cls.VERSION.string(),
+            operation=cls.OPERATION.string(),
+            keyframe=cls.KEYFRAME.string(),
+            content=cls.CONTENT.string(),
+            created_at=cls.CREATED_AT.string(),
+        )
+
+    @classmethod
+    def current_state(cls, cur, project_id: int, email: str) -> Optional[dict]:
+        """
+        Reads the state of a project a version records, on the cursor of
+        the write that changed it.
+        :return: the project's name, description and task tree, or None if
+        the user has no such project
+        """
+        # to_jsonb reads task_roots whether or not the column was added
+        state_query = SQL(
+            """
+            SELECT {fields}, to_jsonb(p) -> {task_roots} AS {task_roots_field}
+            FROM {projects} p
+            WHERE {project_id} = %s AND {email} = %s;
+            """
+        ).format(
+            fields=SQL(", ").join(field.string() for field in cls.STATE_FIELDS),
+            task_roots=Literal(SavedProjects.TASK_ROOTS.raw),
+            task_roots_field=SavedProjects.TASK_ROOTS.string(),
+            projects=SavedProjects.string(),
+            project_id=SavedProjects.PROJECT_ID.string(),
+            email=SavedProjects.EMAIL.string(),
+        )
+
+        cur.execute(state_query, (project_id, email))
+        project = cur.fetchone()
+        if project is None:
+            return None
+
+        if project[SavedProjects.TASK_ROOTS.raw] is not None:
+            (tasks,), _ = TaskSubtrees.load(cur, [project[SavedProjects.TASK_ROOTS.raw]])
+        else:
+            tasks = SavedProjects.load_tasks(project)
+        return {
+            SavedProjects.PROJECT_NAME.raw: project[SavedProjects.PROJECT_NAME.raw],
+            SavedProjects.PROJECT_DESCRIPTION.raw: project[SavedProjects.PROJECT_DESCRIPTION.raw],
+            SavedProjects.TASKS.raw: tasks,
+        }
+
+    @classmethod
+    def chain_query(cls) -> Composed:
+        """
+        Generates the read of the rows needed to rebuild a version: the
+        latest keyframe at or before it, and every diff after that keyframe
+        up to the version. Takes project_id, email and version, twice.
+        """
+        return SQL(
+            """
+            SELECT {version}, {operation}, {keyframe}, {content}, {created_at}
+            FROM {st}
+            WHERE {project_id} = %s AND {email} = %s AND {version} <= %s
+              AND {version} >= (
+                  SELECT max({version}) FROM {st}
+                  WHERE {project_id} = %s AND {email} = %s AND {version} <= %s AND {keyframe}
+              )
+            ORDER BY {version};
+            """
+        ).format(
+            st=cls.string(),
+            project_id=cls.PROJECT_ID.string(),
+            email=cls.EMAIL.string(),
+            version=cls.VERSION.string(),
+            operation=cls.OPERATION.string(),
+            keyframe=cls.KEYFRAME.string(),
+            content=cls.CONTENT.string(),
+            created_at=cls.CREATED_AT.string(),
+        )
+
+    @classmethod
+    def append_delta(cls, path: List[int], child_index: int, node: dict) -> list:
+        """
+        The diff of appending node as child child_index of the task at path.
+        """
+        children_path = [SavedProjects.TASKS.raw]
+        for index in path:
+            children_path += [index, CHILDREN]
+        if child_index == 0:
+            # The parent may not have had a list of children
+            return [[REPLACE, children_path, [node]]]
+        return [[SPLICE, children_path, child_index, 0, [node]]]
+
+    @classmethod
+    def replay(cls, chain: List[dict]) -> dict:
+        """
+        Rebuilds the state of the last version in a chain read with
+        chain_query.
+        """
+        state = copy.deepcopy(chain[0][cls.CONTENT.raw])
+        for row in chain[1:]:
+            state = apply_diff(state, row[cls.CONTENT.raw], in_place=True)
+        return state
+
+    @classmethod
+    def record(cls, cur, project_id: int, email: str, operation: str, delta: Optional[list] = None) -> None:
+        """
+        Records a new version of a project, on the cursor of the write that
+        changed it. The write holds the project's row lock, so versions of a
+        project are recorded one at a time.
+
+        :param cur: the cursor the write was made on
+        :param operation: one of "insert", "update" or "delete"
+        :param delta: the diff of the write, when the caller knows it, e.g.
+        an appended subtask. Saves reading the project's tree.
+        """
+        cur.execute(cls.chain_query(), (project_id, email, cls.LATEST) * 2)
+        chain = cur.fetchall()
+
+        keyframe = not chain or len(chain) >= HISTORY_KEYFRAME_INTERVAL
+        if keyframe or delta is None:
+            state = cls.current_state(cur, project_id, email)
+            if state is None:
+                return
+            if not keyframe:
+                delta = diff(cls.replay(chain), state)
+                if not delta and operation == "update":
+                    return
+                # A diff larger than the project is stored as a keyframe instead
+                keyframe = len(json.dumps(delta)) >= len(json.dumps(state))
+            content = state if keyframe else delta
+        else:
+            content = delta
+
+        insert_query = SQL(
+            """
+            INSERT INTO {st} ({project_id}, {email}, {version}, {operation}, {keyframe}, {content})
+            VALUES (%s, %s, %s, %s, %s, %s);
+            """
+        ).format(
+            st=cls.string(),
+            project_id=cls.PROJECT_ID.string(),
+            email=cls.EMAIL.string(),
+            version=cls.VERSION.string(),
+            operation=cls.OPERATION.string(),
+            keyframe=cls.KEYFRAME.string(),
+            content=cls.CONTENT.string(),
+        )
+
+        version = chain[-1][cls.VERSION.raw] + 1 if chain else 1
+        cur.execute(insert_query, (project_id, email, version, operation, keyframe, json.dumps(content)))
+
+        # A new keyframe may let the oldest run of versions go
+        if keyframe and chain:
+            cur.execute(cls.retention_sql(cls.project_filter()), cls.retention_params() + (project_id, email))
+
+    @classmethod
+    def project_filter(cls) -> Composed:
+        return SQL("{project_id} = %s AND {email} = %s").format(
+            project_id=cls.PROJECT_ID.string(), email=cls.EMAIL.string()
+        )
+
+    @classmethod
+    def retention_params(cls) -> tuple:
+        return HISTORY_MAX_VERSIONS, HISTORY_RETENTION_DAYS
+
+    @classmethod
+    def retention_sql(cls, project_filter: Composed) -> Composed:
+        """
+        Generates the delete of the versions the retention policy no longer
+        keeps, for every project matching project_filter. Each project keeps
+        its last HISTORY_MAX_VERSIONS versions and those from the last
+        HISTORY_RETENTION_DAYS days. Versions are only dropped up to the
+        keyframe the oldest kept version is rebuilt from, so every version
+        left can still be rebuilt.
+        Takes the retention_params, then those of project_filter.
+        """
+        return SQL(
+            """
+            WITH bounds AS (
+                SELECT {project_id}, {email},
+                       GREATEST(
+                           max({version}) - %s + 1,
+                           COALESCE(
+                               min({version}) FILTER (
+                                   WHERE {created_at} >= CURRENT_TIMESTAMP - make_interval(days => %s)
+                               ),
+                               max({version})
+                           )
+                       ) AS oldest_kept
+                FROM {st}
+                WHERE {project_filter}
+                GROUP BY {project_id}, {email}
+            ),
+            bases AS (
+                SELECT v.{project_id}, v.{email}, max(v.{version}) AS base
+                FROM {st} v
+                JOIN bounds b ON b.{project_id} = v.{project_id} AND b.{email} = v.{email}
+                WHERE v.{keyframe} AND v.{version} <= b.oldest_kept
+                GROUP BY v.{project_id}, v.{email}
+            )
+            DELETE FROM {st} v
+            USING bases b
+            WHERE v.{project_id} = b.{project_id} AND v.{email} = b.{email} AND v.{version} < b.base;
+            """
+        ).format(
+            st=cls.string(),
+            project_filter=project_filter,
+            project_id=cls.PROJECT_ID.string(),
+            email=cls.EMAIL.string(),
+            version=cls.VERSION.string(),
+            keyframe=cls.KEYFRAME.string(),
+            created_at=cls.CREATED_AT.string(),
+        )
+
+    @classmethod
+    def select_versions(cls, project_id: int, email: str) -> List[dict]:
+        """
+        Lists the versions of a project still kept, oldest first.
+        """
+        if not isinstance(project_id, int):
+            raise SavedProjectSelectException(f"Project ID {project_id} is not an integer!")
+
+        select_query = SQL(
+            """
+            SELECT {version}, {operation}, {keyframe}, {created_at}
+            FROM {st}
+            WHERE {project_filter}
+            ORDER BY {version};
+            """
+        ).format(
+            st=cls.string(),
+            project_filter=cls.project_filter(),
+            version=cls.VERSION.string(),
+            operation=cls.OPERATION.string(),
+            keyframe=cls.KEYFRAME.string(),
+            created_at=cls.CREATED_AT.string(),
+        )
+
+        with MinervaCursor(read_only=True) as cur:
+            cur.execute(select_query, (project_id, email))
+            return cur.fetchall()
+
+    @classmethod
+    def select_version(cls, project_id: int, email: str, version: int) -> dict:
+        """
+        Rebuilds one version of a project from its keyframe and the diffs
+        after it.
+        :return: the version's number, operation and created_at, and the
+        project's state at that version under "project"
+        :raises SavedProjectSelectException: if the version does not exist or
+        is no longer kept
+        """
+        if not isinstance(version, int):
+            raise SavedProjectSelectException(f"Version {version} is not an integer!")
+
+        with MinervaCursor(read_only=True) as cur:
+            cur.execute(cls.chain_query(), (project_id, email, version) * 2)
+            chain = cur.fetchall()
+
+        if not chain or chain[-1][cls.VERSION.raw] != version:
+            raise SavedProjectSelectException(f"Version {version} of project {project_id} does not exist!")
+
+        head = chain[-1]
+        return {
+            cls.VERSION.raw: version,
+            cls.OPERATION.raw: head[cls.OPERATION.raw],
+            cls.CREATED_AT.raw: head[cls.CREATED_AT.raw],
+            "project": cls.replay(chain),
+        }
+
+    @classmethod
+    def compact(cls, project_id: int, email: str, older_than_days: int = HISTORY_DAILY_AFTER_DAYS) -> int:
+        """
+        Thins out a project's old history: of the versions older than
+        older_than_days, only keyframes and the last version of each day are
+        kept, and the diffs after dropped versions are recomputed to span
+        them.
+        :return: the number of versions dropped
+        """
+        lock_query = SQL("SELECT 1 FROM {projects} WHERE {project_id} = %s AND {email} = %s FOR UPDATE;").format(
+            projects=SavedProjects.string(),
+            project_id=SavedProjects.PROJECT_ID.string(),
+            email=SavedProjects.EMAIL.string(),
+        )
+        select_query = SQL(
+            """
+            SELECT {version}, {keyframe}, {content}, {created_at},
+                   {created_at} < CURRENT_TIMESTAMP - make_interval(days => %s) AS compactable
+            FROM {st}
+            WHERE {project_filter}
+            ORDER BY {version};
+            """
+        ).format(
+            st=cls.string(),
+            project_filter=cls.project_filter(),
+            version=cls.VERSION.string(),
+            keyframe=cls.KEYFRAME.string(),
+            content=cls.CONTENT.string(),
+            created_at=cls.CREATED_AT.string(),
+        )
+        rewrite_query = SQL(
+            "UPDATE {st} SET {keyframe} = %s, {content} = %s WHERE {project_filter} AND {version} = %s;"
+        ).format(
+            st=cls.string(),
+            project_filter=cls.project_filter(),
+            version=cls.VERSION.string(),
+            keyframe=cls.KEYFRAME.string(),
+            content=cls.CONTENT.string(),
+        )
+        delete_query = SQL("DELETE FROM {st} WHERE {project_filter} AND {version} = ANY(%s);").format(
+            st=cls.string(), project_filter=cls.project_filter(), version=cls.VERSION.string()
+        )
+
+        with MinervaCursor() as cur:
+            # Writes to the project wait, so no version is recorded meanwhile
+            cur.execute(lock_query, (project_id, email))
+            cur.execute(select_query, (older_than_days, project_id, email))
+            rows = cur.fetchall()
+
+            dropped = []
+            kept_state = state = None
+            for index, row in enumerate(rows):
+                if row[cls.KEYFRAME.raw]:
+                    state = copy.deepcopy(row[cls.CONTENT.raw])
+                else:
+                    state = apply_diff(state, row[cls.CONTENT.raw])
+
+                following = rows[index + 1] if index + 1 < len(rows) else None
+                day = row[cls.CREATED_AT.raw].date()
+                last_of_day = following is None or following[cls.CREATED_AT.raw].date() != day
+                if row["compactable"] and not row[cls.KEYFRAME.raw] and not last_of_day:
+                    dropped.append(row[cls.VERSION.raw])
+                    continue
+
+                if dropped and dropped[-1] == row[cls.VERSION.raw] - 1 and not row[cls.KEYFRAME.raw]:
+                    # Span the dropped versions with one diff
+                    delta = diff(kept_state, state)
+                    keyframe = len(json.dumps(delta)) >= len(json.dumps(state))
+                    cur.execute(
+                        rewrite_query,
+                        (keyframe, json.dumps(state if keyframe else delta), project_id, email, row[cls.VERSION.raw]),
+                    )
+                kept_state = state
+
+            if dropped:
+                cur.execute(delete_query, (project_id, email, dropped))
+
+        return len(dropped)
+
+    @classmethod
+    def compact_all(cls) -> int:
+        """
+        Applies the retention and compaction policies to every project's
+        history; writes only apply retention to the project they change.
+        Run on the workers' sweeps (see app.lifecycle); a call made while
+        another process compacts does nothing.
+        :return: the number of versions dropped
+        """
+        candidates_query = SQL(
+            """
+            SELECT DISTINCT {project_id}, {email}
+            FROM {st}
+            WHERE {created_at} < CURRENT_TIMESTAMP - make_interval(days => %s) AND NOT {keyframe}
+            GROUP BY {project_id}, {email}, {created_at}::date
+            HAVING count(*) > 1;
+            """
+        ).format(
+            st=cls.string(),
+            project_id=cls.PROJECT_ID.string(),
+            email=cls.EMAIL.string(),
+            keyframe=cls.KEYFRAME.string(),
+            created_at=cls.CREATED_AT.string(),
+        )
+
+        with MinervaCursor() as cur:
+            cur.execute("SELECT pg_try_advisory_xact_lock(%s) AS locked;", (cls.COMPACT_LOCK_ID,))
+            if not cur.fetchone()["locked"]:
+                # Another process is compacting
+                return 0
+            cur.execute(cls.retention_sql(SQL("TRUE")), cls.retention_params())
+            dropped = cur.rowcount
+            cur.execute(candidates_query, (HISTORY_DAILY_AFTER_DAYS,))
+            candidates = cur.fetchall()
+
+        for project in candidates:
+            dropped += cls.compact(project[cls.PROJECT_ID.raw], project[cls.EMAIL.raw])
+        return dropped
+
+
+class ProjectTemplates(SchemaTable):
+    """
+    The specification for the Project Templates table in the Projects
+    schema. A template is a named task tree that projects are started from.
+    Templates without an owner are shared with every user.
+
+    Projects are created from a template inside Postgres, so its tree never
+    travels to the app. When subtrees are shared (see TaskSubtrees), the
+    template's tree is stored as subtrees too and new projects only copy its
+    root hashes; a project's own rows are written once it is edited.
+    """
+
+    SCHEMA = "projects"
+    TABLE = "project_templates"
+
+    # Field constants
+    TEMPLATE_ID = Field("template_id")
+    OWNER_EMAIL = Field("owner_email")
+    TEMPLATE_NAME = Field("template_name")
+    TEMPLATE_DESCRIPTION = Field("template_description")
+    TASKS = Field("tasks")
+    TASK_ROOTS = Field("task_roots")
+    CREATED_AT = Field("created_at")
+
+    # The fields listed to clients. The tree is only read by instantiation.
+    ROW_FIELDS = (TEMPLATE_ID, OWNER_EMAIL, TEMPLATE_NAME, TEMPLATE_DESCRIPTION, CREATED_AT)
+
+    @classmethod
+    def create_sql(cls) -> Composed:
+        """
+        Generates the SQL to create the project templates table.
+        tasks always holds the tree, which history keyframes of new projects
+        are built from. task_roots is set as well when subtrees are shared.
+        :return: A Composed object with the CREATE TABLE statement
+        """
+        return SQL(
+            """
+            CREATE TABLE IF NOT EXISTS {st} (
+                {template_id} SERIAL PRIMARY KEY,
+                {owner_email} VARCHAR(100) REFERENCES auth.users(email) ON DELETE CASCADE,
+                {template_name} VARCHAR(200) NOT NULL,
+                {template_description} TEXT NOT NULL,
+                {tasks} JSONB NOT NULL DEFAULT '[]',
+                {task_roots} TEXT[],
+                {created_at} TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+
+            CREATE INDEX IF NOT EXISTS project_templates_owner_email_idx ON {st} ({owner_email});
+        """
+        ).format(
+            st=cls.string(),
+            template_id=cls.TEMPLATE_ID.string(),
+            owner_email=cls.OWNER_EMAIL.string(),
+            template_name=cls.TEMPLATE_NAME.string(),
+            template_description=cls.TEMPLATE_DESCRIPTION.string(),
+            tasks=cls.TASKS.string(),
+            task_roots=cls.TASK_ROOTS.string(),
+            created_at=cls.CREATED_AT.string(),
+        )
+
+    @classmethod
+    def visible_filter(cls) -> Composed:
+        """
+        The templates a user may see and use: their own and shared ones.
+        Takes the user's email.
+        """
+        return SQL("({owner_email} IS NULL OR {owner_email} = %s)").format(owner_email=cls.OWNER_EMAIL.string())
+
+    @classmethod
+    def insert_record(
+        cls,
+        owner_email: Optional[str],
+        template_name: str,
+        template_description: str,
+        tasks: str,
+        share_subtrees: bool = False,
+    ) -> int:
+        """
+        Saves a new template.
+        :param owner_email: the user the template belongs to, or None for a
+        template shared with everyone
+        :param tasks: the task tree as a JSON string
+        :param share_subtrees: True to also store the tree as subtrees, so
+        projects created from it share them
+        :return: the new template_id
+        :raises ProjectTemplateException: for invalid input
+        """
+        if owner_email is not None:
+            if not isinstance(owner_email, str):
+                raise ProjectTemplateException(f"Email {owner_email} is not a string!")
+            user_cache.require(owner_email)
+
+        if not isinstance(template_name, str) or not template_name:
+            raise ProjectTemplateException(f"Template name {template_name} is not a non-empty string!")
+
+        if not isinstance(template_description, str):
+            raise ProjectTemplateException(f"Template description {template_description} is not a string!")
+
+        if not isinstance(tasks, str):
+            raise ProjectTemplateException(f"Tasks {tasks} is not a string!")
+
+        insert_query = SQL(
+            """
+            INSERT INTO {st} ({owner_email}, {template_name}, {template_description}, {tasks}, {task_roots})
+            VALUES (%s, %s, %s, %s::jsonb, %s)
+            RETURNING {template_id};
+            """
+        ).format(
+            st=cls.string(),
+            template_id=cls.TEMPLATE_ID.string(),
+            owner_email=cls.OWNER_EMAIL.string(),
+            template_name=cls.TEMPLATE_NAME.string(),
+            template_description=cls.TEMPLATE_DESCRIPTION.string(),
+            tasks=cls.TASKS.string(),
+            task_roots=cls.TASK_ROOTS.string(),
+        )
+
+        with MinervaCursor() as cur:
+            task_roots = TaskSubtrees.store(cur, json.loads(tasks)) if share_subtrees else None
+            cur.execute(insert_query, (owner_email, template_name, template_description, tasks, task_roots))
+            return cur.fetchone()[cls.TEMPLATE_ID.raw]
+
+    @classmethod
+    def select_all(cls, email: str) -> List[dict]:
+        """
+        Lists the templates a user may use, without their trees.
+        """
+        if not isinstance(email, str):
+            raise ProjectTemplateException(f"Email {email} is not a string!")
+
+        select_query = SQL(
+            """
+            SELECT {columns}
+            FROM {st}
+            WHERE {visible}
+            ORDER BY {template_id};
+            """
+        ).format(
+            columns=SQL(", ").join(field.string() for field in cls.ROW_FIELDS),
+            st=cls.string(),
+            visible=cls.visible_filter(),
+            template_id=cls.TEMPLATE_ID.string(),
+        )
+
+        with MinervaCursor(read_only=True) as cur:
+            cur.execute(select_query, (email,))
+            return cur.fetchall()
+
+    @classmethod
+    def delete_record(cls, template_id: int, email: str) -> None:
+        """
+        Deletes one of a user's own templates. Projects created from it keep
+        their trees.
+        :raises ProjectTemplateNotFoundException: if the user owns no such
+        template
+        """
+        delete_query = SQL("DELETE FROM {st} WHERE {template_id} = %s AND {owner_email} = %s;").format(
+            st=cls.string(), template_id=cls.TEMPLATE_ID.string(), owner_email=cls.OWNER_EMAIL.string()
+        )
+
+        with MinervaCursor() as cur:
+            cur.execute(delete_query, (template_id, email))
+            if cur.rowcount == 0:
+                raise ProjectTemplateNotFoundException(f"Template {template_id} does not exist!")
+
+    @classmethod
+    def instantiate_sql(cls, share_subtrees: bool) -> Composed:
+        """
+        Generates the INSERT ... SELECT that creates projects from a
+        template under the user's next project_ids. With several projects,
+        each name is numbered, e.g. "Launch (2)".
+        Takes template_id, email, email, email, project_name, count,
+        project_description and count.
+        """
+        if share_subtrees:
+            # Templates saved before subtrees were shared only have a tree
+            tasks = SQL("CASE WHEN t.{task_roots} IS NULL THEN t.{tasks} END, t.{task_roots}").format(
+                tasks=cls.TASKS.string(), task_roots=cls.TASK_ROOTS.string()
+            )
+            fields = SQL("{tasks}, {task_roots}").format(
+                tasks=SavedProjects.TASKS.string(), task_roots=SavedProjects.TASK_ROOTS.string()
+            )
+        else:
+            tasks = SQL("t.{tasks}").format(tasks=cls.TASKS.string())
+            fields = SavedProjects.TASKS.string()
+
+        return SQL(
+            """
+            WITH template AS (
+                SELECT * FROM {st} WHERE {template_id} = %s AND {visible}
+            ),
+            last_project AS (
+                SELECT COALESCE(max({project_id}), 0) AS project_id FROM {projects} WHERE {email} = %s
+            )
+            INSERT INTO {projects} ({project_id}, {email}, {project_name}, {project_description}, {fields})
+            SELECT l.{project_id} + n, %s,
+                   COALESCE(%s, t.{template_name}) || CASE WHEN %s > 1 THEN ' (' || n || ')' ELSE '' END,
+                   COALESCE(%s, t.{template_description}),
+                   {tasks}
+            FROM template t, last_project l, generate_series(1, %s) AS n
+            RETURNING {project_id};
+            """
+        ).format(
+            st=cls.string(),
+            projects=SavedProjects.string(),
+            visible=cls.visible_filter(),
+            fields=fields,
+            tasks=tasks,
+            template_id=cls.TEMPLATE_ID.string(),
+            template_name=cls.TEMPLATE_NAME.string(),
+            template_description=cls.TEMPLATE_DESCRIPTION.string(),
+            project_id=SavedProjects.PROJECT_ID.string(),
+            email=SavedProjects.EMAIL.string(),
+            project_name=SavedProjects.PROJECT_NAME.string(),
+            project_description=SavedProjects.PROJECT_DESCRIPTION.string(),
+        )
+
+    @classmethod
+    def instantiate(
+        cls,
+        template_id: int,
+        email: str,
+        count: int = 1,
+        project_name: Optional[str] = None,
+        project_description: Optional[str] = None,
+        share_subtrees: bool = False,
+    ) -> List[int]:
+        """
+        Creates count projects from a template for a user in a single
+        statement, then runs the bookkeeping of SavedProjects.after_write for
+        all of them at once.
+
+        :param template_id: a template the user may use
+        :param email: the user the projects are created for
+        :param count: how many projects to create
+        :param project_name: the name of the projects, the template's if None
+        :param project_description: their description, the template's if None
+        :param share_subtrees: True to copy the template's root hashes rather
+        than its tree
+        :return: the new project_ids
+        :raises ProjectTemplateNotFoundException: if the user may not use any
+        such template
+        """
+        if not isinstance(template_id, int):
+            raise ProjectTemplateException(f"Template ID {template_id} is not an integer!")
+
+        if not isinstance(count, int) or not 1 <= count <= MAX_TEMPLATE_INSTANCES:
+            raise ProjectTemplateException(f"count must be an integer from 1 to {MAX_TEMPLATE_INSTANCES}")
+
+        if not isinstance(email, str):
+            raise ProjectTemplateException(f"Email {email} is not a string!")
+        user_cache.require(email)
+
+        params = (template_id, email, email, email, project_name, count, project_description, count)
+        with MinervaCursor() as cur:
+            cur.execute(cls.instantiate_sql(share_subtrees), params)
+            project_ids = [row[SavedProjects.PROJECT_ID.raw] for row in cur.fetchall()]
+            if not project_ids:
+                raise ProjectTemplateNotFoundException(f"Template {template_id} does not exist!")
+            cls.after_instantiate(cur, template_id, email, project_ids)
+
+        return project_ids
+
+    @classmethod
+    def after_instantiate(cls, cur, template_id: int, email: str, project_ids: List[int]) -> None:
+        """
+        SavedProjects.after_write for a batch of new projects, one statement
+        per step rather than per project: refreshes their stats, records
+        their first versions from the template's tree and publishes their
+        creation.
+        """
+        project_filter = SQL("{email} = %s AND {project_id} = ANY(%s)").format(
+            email=SavedProjects.EMAIL.string(), project_id=SavedProjects.PROJECT_ID.string()
+        )
+        cur.execute(ProjectStats.refresh_sql(project_filter), (email, project_ids))
+
+        if PROJECT_HISTORY_ENABLED:
+            history_query = SQL(
+                """
+                INSERT INTO {versions} ({project_id}, {email}, {version}, {operation}, {keyframe}, {content})
+                SELECT p.{project_id}, p.{email}, 1, 'insert', true,
+                       jsonb_build_object(
+                           {project_name_key}, p.{project_name},
+                           {project_description_key}, p.{project_description},
+                           {tasks_key}, t.{tasks}
+                       )
+                FROM {projects} p, {st} t
+                WHERE p.{email} = %s AND p.{project_id} = ANY(%s) AND t.{template_id} = %s;
+                """
+            ).format(
+                versions=ProjectHistory.string(),
+                projects=SavedProjects.string(),
+                st=cls.string(),
+                project_id=SavedProjects.PROJECT_ID.string(),
+                email=SavedProjects.EMAIL.string(),
+                project_name=SavedProjects.PROJECT_NAME.string(),
+                project_description=SavedProjects.PROJECT_DESCRIPTION.string(),
+                project_name_key=Literal(SavedProjects.PROJECT_NAME.raw),
+                project_description_key=Literal(SavedProjects.PROJECT_DESCRIPTION.raw),
+                tasks_key=Literal(SavedProjects.TASKS.raw),
+                version=ProjectHistory.VERSION.string(),
+                operation=ProjectHistory.OPERATION.string(),
+                keyframe=ProjectHistory.KEYFRAME.string(),
+                content=ProjectHistory.CONTENT.string(),
+                tasks=cls.TASKS.string(),
+                template_id=cls.TEMPLATE_ID.string(),
+            )
+            cur.execute(history_query, (email, project_ids, template_id))
+
+        # The same payload as SavedProjects.notify_change
+        cur.execute(
+            """
+            SELECT pg_notify(%s, json_build_object('email', %s, 'project_id', id, 'operation', 'insert')::text)
+            FROM unnest(%s::int[]) AS id;
+            """,
+            (PROJECT_CHANGES_CHANNEL, email, project_ids),
+        )
+
+
+class SavedProjectInsertException(Exception):
+    """
+    An exception for a new saved project
+    """
+
+    pass
+
+
+class SavedProjectUpdateException(Exception):
+    """
+    An exception for updating a saved project
+    """
+
+    pass
+
+
+class SavedProjectSelectException(Exception):
+    """
+    An exception for selecting info from a saved project
+    """
+
+    pass
+
+
+class ProjectTemplateException(Exception):
+    """
+    An exception for invalid input to a project template
+    """
+
+    pass
+
+
+class ProjectTemplateNotFoundException(ProjectTemplateException):
+    """
+    An exception for a template that does not exist or belongs to someone else
     """
 
     pass
@@ -0,0 +1,94 @@
+from typing import Optional
+from flask import Flask, current_app, g, jsonify, request
+from psycopg2.errors import QueryCanceled, LockNotAvailable
+from app.config import REQUEST_TIMEOUT_SECONDS
+from app.postgresql_utils import minerva_deadline, DeadlineExceededException
+import time
+
+# Clients may ask for a shorter deadline than the endpoint's, in seconds
+REQUEST_TIMEOUT_HEADER = "Request-Timeout"
+
+# What a query cut short by its deadline or a lock wait raises
+TIMEOUT_EXCEPTIONS = (QueryCanceled, LockNotAvailable, DeadlineExceededException)
+
+
+def request_timeout(seconds: Optional[float]):
+    """
+    A route decorator giving a view its own deadline instead of its
+    blueprint's. None leaves the view without one, for long-running work
+    whose queries are each bounded by MINERVA_STATEMENT_TIMEOUT_MS instead.
+    """
+
+    def decorator(view):
+        view.request_timeout = seconds
+        return view
+
+    return decorator
+
+
+def endpoint_timeout() -> Optional[float]:
+    """
+    The deadline in seconds for the current request: the view's own, then
+    its blueprint's request_timeout, then REQUEST_TIMEOUT_SECONDS. A valid
+    Request-Timeout header can shorten it but never extend it.
+    """
+    view = current_app.view_functions.get(request.endpoint)
+    blueprint = current_app.blueprints.get(request.blueprint) if request.blueprint else None
+    if hasattr(view, "request_timeout"):
+        seconds = view.request_timeout
+    elif hasattr(blueprint, "request_timeout"):
+        seconds = blueprint.request_timeout
+    else:
+        seconds = REQUEST_TIMEOUT_SECONDS
+
+    try:
+        requested = float(request.headers.get(REQUEST_TIMEOUT_HEADER, ""))
+    except ValueError:
+        return seconds
+    if requested > 0 and (seconds is None or requested < seconds):
+        return requested
+    return seconds
+
+
+def bind_deadline() -> None:
+    seconds = endpoint_timeout() if request.endpoint is not None else None
+    deadline = time.monotonic() + seconds if seconds else None
+    g.minerva_deadline_token = minerva_deadline.set(deadline)
+
+
+def unbind_deadline(error=None) -> None:
+    token = g.pop("minerva_deadline_token", None)
+    if token is None:
+        return
+    try:
+        minerva_deadline.reset(token)
+    except ValueError:
+        # Torn down in a different context than it was set in
+        minerva_deadline.set(None)
+
+
+def timeout_response(e: Exception):
+    """
+    The response for a request that ran out of time. A lock that could not be
+    taken is usually brief contention, so it is a retryable 503; a query
+    cancelled at the deadline is a 504.
+    """
+    if isinstance(e, LockNotAvailable):
+        response = jsonify({"error": "The resource is busy, please retry"})
+        response.status_code = 503
+        response.headers["Retry-After"] = "1"
+        return response
+    response = jsonify({"error": "The request took too long to complete"})
+    response.status_code = 504
+    return response
+
+
+def init_deadlines(app: Flask) -> None:
+    """
+    Gives every request a deadline that Minerva cursors enforce, and maps
+    timeouts that escape a view to a 503 or 504.
+    """
+    app.before_request(bind_deadline)
+    app.teardown_request(unbind_deadline)
+    for exception in TIMEOUT_EXCEPTIONS:
+        app.register_error_handler(exception, timeout_response)
@@ -0,0 +1,124 @@
+from typing import Callable, Hashable
+import queue
+import threading
+
+
+class JobQueue:
+    """
+    A small in-process worker pool for background jobs. Jobs are identified
+    by an id whose durable state lives in Minerva; the queue only carries ids.
+
+    Concurrency is bounded by the number of worker threads, and the backlog
+    by max_size. A handler that raises is retried with exponential backoff
+    until max_attempts is reached, after which on_failure is called.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        handler: Callable[[Hashable, int], None],
+        workers: int,
+        max_attempts: int,
+        backoff_seconds: float,
+        max_size: int = 0,
+        on_failure: Callable[[Hashable, Exception], None] = None,
+    ):
+        """
+        :param name: used to name the worker threads
+        :param handler: called as handler(job_id, attempt) to run a job
+        :param workers: the number of jobs run concurrently
+        :param max_attempts: how many times a job is tried before giving up
+        :param backoff_seconds: the delay before the first retry, doubled for
+        each retry after it
+        :param max_size: the largest backlog accepted, 0 for unbounded
+        :param on_failure: called as on_failure(job_id, error) once a job has
+        used up its attempts
+        """
+        self.name = name
+        self.handler = handler
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self.on_failure = on_failure
+        self.jobs = queue.Queue(maxsize=max_size)
+        # Ids queued, running or waiting for a retry, so a sweep that finds
+        # one of them still unfinished in Minerva does not queue it twice
+        self.active = set()
+        self.threads = []
+        self.lock = threading.Lock()
+
+    def submit(self, job_id: Hashable, attempt: int = 1) -> None:
+        """
+        Queues a job, unless this queue already has it.
+        :raises JobQueueFullException: if the backlog is full
+        """
+        self._ensure_started()
+        with self.lock:
+            if job_id in self.active:
+                return
+            self.active.add(job_id)
+        try:
+            self.jobs.put_nowait((job_id, attempt))
+        except queue.Full:
+            with self.lock:
+                self.active.discard(job_id)
+            raise JobQueueFullException(f"The {self.name} queue is full")
+
+    def backlog(self) -> int:
+        """
+        The number of jobs waiting for a worker.
+        """
+        return self.jobs.qsize()
+
+    def join(self) -> None:
+        """
+        Blocks until every queued job, including retries, is finished.
+        """
+        self.jobs.join()
+
+    def _ensure_started(self) -> None:
+        with self.lock:
+            self.threads = [thread for thread in self.threads if thread.is_alive()]
+            while len(self.threads) < self.workers:
+                thread = threading.Thread(target=self._work, name=f"{self.name}-{len(self.threads)}", daemon=True)
+                thread.start()
+                self.threads.append(thread)
+
+    def _retry(self, job_id: Hashable, attempt: int) -> None:
+        # Put the retry back on the queue once its backoff has passed. The
+        # original task stays unfinished until then so join() waits for it.
+        try:
+            self.jobs.put((job_id, attempt))
+        finally:
+            self.jobs.task_done()
+
+    def _work(self) -> None:
+        while True:
+            job_id, attempt = self.jobs.get()
+            try:
+                self.handler(job_id, attempt)
+            except Exception as e:
+                if attempt < self.max_attempts:
+                    print(f"{self.name} job {job_id} failed on attempt {attempt}, retrying: {e}")
+                    delay = self.backoff_seconds * 2 ** (attempt - 1)
+                    threading.Timer(delay, self._retry, args=(job_id, attempt + 1)).start()
+                    continue
+
+                print(f"{self.name} job {job_id} failed after {attempt} attempts: {e}")
+                if self.on_failure is not None:
+                    try:
+                        self.on_failure(job_id, e)
+                    except Exception as failure_error:
+                        print(f"{self.name} could not record the failure of job {job_id}: {failure_error}")
+
+            with self.lock:
+                self.active.discard(job_id)
+            self.jobs.task_done()
+
+
+class JobQueueFullException(Exception):
+    """
+    An exception for a job submitted while the queue's backlog is full
+    """
+
+    pass
@@ -0,0 +1,105 @@
+from typing import Any, List
+import copy
+
+############################################
+# Compact diffs between two JSON documents
+############################################
+
+# A diff is a list of operations, each a list starting with its code and the
+# path (keys and indexes) of the value it changes:
+#   ["r", path, value]                  replace or add the value at path
+#   ["d", path]                         delete the key at path
+#   ["s", path, start, count, items]    splice the list at path
+REPLACE = "r"
+DELETE = "d"
+SPLICE = "s"
+
+
+def same(old: Any, new: Any) -> bool:
+    """
+    Whether two JSON documents are identical. Unlike ==, this tells 1 from
+    1.0 and from true, and 0 from false, so a change of type is recorded.
+    """
+    if old != new or type(old) is not type(new):
+        return False
+    if isinstance(old, dict):
+        return all(same(value, new[key]) for key, value in old.items())
+    if isinstance(old, list):
+        return all(same(old_item, new_item) for old_item, new_item in zip(old, new))
+    return True
+
+
+def diff(old: Any, new: Any, path: List = None) -> List[list]:
+    """
+    The operations that turn old into new. Unchanged values are left out, so
+    editing one task in a large tree yields a diff the size of the edit.
+    :param old: a JSON document
+    :param new: another JSON document
+    :return: a list of operations for apply_diff
+    """
+    path = path or []
+    if same(old, new):
+        return []
+
+    if isinstance(old, dict) and isinstance(new, dict):
+        operations = [[DELETE, path + [key]] for key in old if key not in new]
+        for key, value in new.items():
+            if key in old:
+                operations += diff(old[key], value, path + [key])
+            else:
+                operations.append([REPLACE, path + [key], value])
+        return operations
+
+    if isinstance(old, list) and isinstance(new, list):
+        # Trim the common ends, so appends and inserts only send new items
+        start = 0
+        while start < min(len(old), len(new)) and same(old[start], new[start]):
+            start += 1
+        end = 0
+        while end < min(len(old), len(new)) - start and same(old[-1 - end], new[-1 - end]):
+            end += 1
+        old_middle, new_middle = old[start : len(old) - end], new[start : len(new) - end]
+
+        # Items that line up are diffed in place, the rest are spliced
+        operations = []
+        for offset, (old_item, new_item) in enumerate(zip(old_middle, new_middle)):
+            operations += diff(old_item, new_item, path + [start + offset])
+        paired = min(len(old_middle), len(new_middle))
+        if len(old_middle) != len(new_middle):
+            operations.append([SPLICE, path, start + paired, len(old_middle) - paired, new_middle[paired:]])
+        return operations
+
+    return [[REPLACE, path, new]]
+
+
+def apply_diff(document: Any, operations: List[list], in_place: bool = False) -> Any:
+    """
+    Applies a diff made by diff.
+    :param in_place: True to edit document rather than a copy of it, e.g.
+    when applying a chain of diffs to a copy made once
+    :return: the changed document
+    """
+    if not in_place:
+        document = copy.deepcopy(document)
+    for operation in operations:
+        code, path = operation[0], operation[1]
+
+        if code == REPLACE and not path:
+            document = copy.deepcopy(operation[2])
+            continue
+
+        target = document
+        for step in path[:-1] if code != SPLICE else path:
+            target = target[step]
+
+        if code == REPLACE:
+            target[path[-1]] = copy.deepcopy(operation[2])
+        elif code == DELETE:
+            del target[path[-1]]
+        elif code == SPLICE:
+            start, count, items = operation[2:]
+            target[start : start + count] = copy.deepcopy(items)
+        else:
+            raise ValueError(f"Unknown diff operation {code}")
+
+    return document
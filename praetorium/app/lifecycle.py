@@ -0,0 +1,208 @@
+from typing import List
+from flask import Flask
+from psycopg2 import Error, OperationalError, InterfaceError
+from psycopg2.sql import SQL, Composed
+from app.postgresql_utils import PRIMARY, MinervaCursor, minerva_pools, replica_router
+from app.db_table_specs.minerva_auth_specs import Users
+from app.db_table_specs.minerva_projects_specs import SavedProjects, ProjectStats, TaskSubtrees, ProjectHistory
+from app.db_table_specs.minerva_jobs_specs import DecompositionJobs
+from app.project_storage import project_storage, project_writes
+from app.login_guard import get_dummy_hash
+from app.ai.decomposition import resume_queued_jobs
+from app.account_deletion import resume_account_deletions
+from app.config import (
+    HISTORY_COMPACT_INTERVAL_SECONDS,
+    JOB_SWEEP_INTERVAL_SECONDS,
+    RATE_LIMIT_ENABLED,
+    RATE_LIMIT_STORAGE_URL,
+    SSE_MAX_STREAMS_PER_WORKER,
+    SUBTREE_GC_INTERVAL_SECONDS,
+)
+import multiprocessing
+import threading
+import time
+
+#############################################
+# Process lifecycle: warmup, fork and drain
+#############################################
+
+# The tables nearly every request touches. Reading each once loads its
+# catalog entries into a new Minerva session's caches.
+WARM_TABLES = (Users, SavedProjects, ProjectStats, DecompositionJobs)
+
+
+def warm_statements() -> List[Composed]:
+    return [SQL("SELECT * FROM {} LIMIT 0;").format(table.string()) for table in WARM_TABLES]
+
+
+def warmup(app: Flask) -> None:
+    """
+    Does the work a cold process would otherwise leave to its first
+    requests: compiles the URL map, makes the dummy login hash and opens
+    the Minerva pools, primary and replicas, priming each pooled connection.
+    A replica that cannot be reached is marked down; a primary that cannot
+    be reached is reported and left to the first request, so the process
+    still starts.
+    """
+    # Werkzeug builds its matcher on the first bind
+    app.url_map.update()
+    get_dummy_hash()
+
+    try:
+        minerva_pools.warm(PRIMARY, warm_statements(), **MinervaCursor.primary_connect_kwargs())
+    except Error as e:
+        print(f"Could not warm the Minerva primary: {e}")
+
+    for dsn in replica_router.dsns:
+        try:
+            minerva_pools.warm(dsn, warm_statements(), **MinervaCursor.replica_connect_kwargs(dsn))
+        except (OperationalError, InterfaceError):
+            replica_router.mark_down(dsn)
+        except Error as e:
+            print(f"Could not warm Minerva replica {dsn}: {e}")
+
+    print("Warmup complete.")
+
+
+def sweep() -> None:
+    """
+    Re-queues background jobs and account purges left unfinished in
+    Minerva. Every worker sweeps; each is only ever run by the worker that
+    claims it.
+    """
+    try:
+        resumed = resume_queued_jobs()
+        if resumed:
+            print(f"Resumed {resumed} decomposition jobs.")
+    except Exception as e:
+        print(f"Could not resume decomposition jobs: {e}")
+
+    try:
+        resumed = resume_account_deletions()
+        if resumed:
+            print(f"Resumed {resumed} account deletions.")
+    except Exception as e:
+        print(f"Could not resume account deletions: {e}")
+
+
+def collect_subtrees() -> None:
+    """
+    Deletes the stored task subtrees no project or template references any
+    more, when task trees are stored as subtrees.
+    """
+    if not project_storage.shares_subtrees:
+        return
+    try:
+        collected = TaskSubtrees.collect_garbage()
+        if collected:
+            print(f"Collected {collected} unreferenced task subtrees.")
+    except Exception as e:
+        print(f"Could not collect task subtrees: {e}")
+
+
+def compact_history() -> None:
+    """
+    Applies the retention and compaction policies to every project's
+    version history.
+    """
+    try:
+        dropped = ProjectHistory.compact_all()
+        if dropped:
+            print(f"Compacted project history: dropped {dropped} versions.")
+    except Exception as e:
+        print(f"Could not compact project history: {e}")
+
+
+def start_sweeps(
+    interval_seconds: float = JOB_SWEEP_INTERVAL_SECONDS,
+    collect_interval_seconds: float = SUBTREE_GC_INTERVAL_SECONDS,
+    compact_interval_seconds: float = HISTORY_COMPACT_INTERVAL_SECONDS,
+) -> threading.Thread:
+    """
+    Sweeps now and then every interval_seconds, collects task subtrees
+    every collect_interval_seconds and compacts project history every
+    compact_interval_seconds, on a daemon thread of this process.
+    Called once per worker, after it is forked.
+    """
+
+    def run():
+        next_collection = next_compaction = time.monotonic()
+        while True:
+            sweep()
+            if time.monotonic() >= next_collection:
+                collect_subtrees()
+                next_collection = time.monotonic() + collect_interval_seconds
+            if time.monotonic() >= next_compaction:
+                compact_history()
+                next_compaction = time.monotonic() + compact_interval_seconds
+            time.sleep(interval_seconds)
+
+    thread = threading.Thread(target=run, name="job-sweeper", daemon=True)
+    thread.start()
+    return thread
+
+
+def default_workers() -> int:
+    """
+    How many workers the server runs unless WEB_CONCURRENCY says otherwise:
+    two per core plus one when the workers can share rate limits, and a
+    single worker while each would keep its own memory:// budgets.
+    """
+    if RATE_LIMIT_ENABLED and RATE_LIMIT_STORAGE_URL.startswith("memory://"):
+        return 1
+    return multiprocessing.cpu_count() * 2 + 1
+
+
+def check_server(workers: int, threads: int) -> None:
+    """
+    Called as the server starts, before any worker is forked. Refuses
+    settings under which the workers would silently misbehave.
+    :param workers: how many workers the server runs
+    :param threads: how many threads each worker serves requests on
+    :raises ServerConfigurationException: if the settings are unsafe
+    """
+    if workers > 1 and RATE_LIMIT_ENABLED and RATE_LIMIT_STORAGE_URL.startswith("memory://"):
+        raise ServerConfigurationException(
+            f"{workers} workers cannot share memory:// rate limits: each would allow the full budget. "
+            "Set RATE_LIMIT_STORAGE_URL to a redis:// URL or run a single worker."
+        )
+    if threads <= SSE_MAX_STREAMS_PER_WORKER:
+        raise ServerConfigurationException(
+            f"{threads} threads per worker leave none for requests once {SSE_MAX_STREAMS_PER_WORKER} "
+            "streams are open. Raise GUNICORN_THREADS or lower SSE_MAX_STREAMS_PER_WORKER."
+        )
+
+
+def after_fork(workers: int = 1) -> None:
+    """
+    Called in a worker as soon as it is forked from a parent that loaded the
+    app. Connections the parent opened, e.g. by warming up before forking,
+    cannot be shared, so the worker starts with empty pools of its own.
+
+    Coalesced edits wait in the memory of the worker that accepted them,
+    where a read on another worker cannot flush them, so with more than one
+    worker every update is written before it is acknowledged.
+    :param workers: how many workers the server runs
+    """
+    minerva_pools.discard()
+    if workers > 1 and project_writes.enabled:
+        print("Write coalescing is disabled: pending edits cannot be shared between workers.")
+        project_writes.window_seconds = 0
+
+
+def drain() -> None:
+    """
+    Called as a worker exits, once it has stopped taking requests. Writes
+    out coalesced edits and closes the worker's connections, so Minerva sees
+    clean disconnects rather than dropped sockets.
+    """
+    try:
+        project_writes.flush_all()
+    except Exception as e:
+        print(f"Could not flush pending project writes: {e}")
+    minerva_pools.closeall()
+    print("Worker drained.")
+
+
+class ServerConfigurationException(Exception):
+    pass
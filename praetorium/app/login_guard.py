@@ -0,0 +1,132 @@
+from collections import OrderedDict
+from typing import Optional
+from app.config import (
+    LOGIN_FAILURES_BEFORE_BACKOFF,
+    LOGIN_BACKOFF_BASE_SECONDS,
+    LOGIN_BACKOFF_MAX_SECONDS,
+    LOGIN_FAILURE_WINDOW_SECONDS,
+    LOGIN_GUARD_MAX_ACCOUNTS,
+)
+import bcrypt
+import hashlib
+import threading
+import time
+
+# Failure counts saturate here, which is well past the longest backoff
+MAX_FAILURES = 255
+
+
+class LoginGuard:
+    """
+    Per-process counters of failed logins, keyed by the email that was
+    tried whether or not it is registered. Once an account has failed
+    LOGIN_FAILURES_BEFORE_BACKOFF times it must wait before trying again,
+    twice as long after each further failure.
+
+    The check runs before the user is looked up or any password is hashed,
+    so a guessing attack is refused without a query or a bcrypt, and is
+    refused the same way for registered and unknown emails.
+
+    Each account is stored compactly: an 8 byte digest of the email rather
+    than the email itself, and a single int packing the failure count with
+    the time of the last failure in milliseconds. The least recently failed
+    accounts are evicted past max_accounts.
+    """
+
+    def __init__(self, max_accounts: int = LOGIN_GUARD_MAX_ACCOUNTS):
+        self.max_accounts = max_accounts
+        # digest -> last failure in ms << 8 | failures
+        self.accounts: "OrderedDict[bytes, int]" = OrderedDict()
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(email: str) -> bytes:
+        return hashlib.blake2b(email.strip().lower().encode("utf-8"), digest_size=8).digest()
+
+    @staticmethod
+    def backoff(failures: int) -> float:
+        """
+        How long an account with this many failures must wait after its last
+        one, in seconds.
+        """
+        if failures < LOGIN_FAILURES_BEFORE_BACKOFF:
+            return 0.0
+        doublings = failures - LOGIN_FAILURES_BEFORE_BACKOFF
+        return min(LOGIN_BACKOFF_MAX_SECONDS, LOGIN_BACKOFF_BASE_SECONDS * 2**doublings)
+
+    def _load(self, key: bytes, now_ms: int) -> int:
+        # The failure count, forgetting failures older than the window
+        packed = self.accounts.get(key)
+        if packed is None:
+            return 0
+        if now_ms - (packed >> 8) > LOGIN_FAILURE_WINDOW_SECONDS * 1000:
+            del self.accounts[key]
+            return 0
+        return packed & MAX_FAILURES
+
+    def retry_after(self, email: str) -> float:
+        """
+        The pre-check run before a login is attempted.
+        :return: the seconds until the account may try again, 0 if it may
+        try now
+        """
+        now_ms = int(time.monotonic() * 1000)
+        key = self.key(email)
+        with self.lock:
+            failures = self._load(key, now_ms)
+            if not failures:
+                return 0.0
+            waited = (now_ms - (self.accounts[key] >> 8)) / 1000
+        return max(0.0, self.backoff(failures) - waited)
+
+    def failed(self, email: str) -> None:
+        """
+        Counts a failed login.
+        """
+        now_ms = int(time.monotonic() * 1000)
+        key = self.key(email)
+        with self.lock:
+            failures = min(MAX_FAILURES, self._load(key, now_ms) + 1)
+            self.accounts[key] = now_ms << 8 | failures
+            self.accounts.move_to_end(key)
+            while len(self.accounts) > self.max_accounts:
+                self.accounts.popitem(last=False)
+
+    def succeeded(self, email: str) -> None:
+        """
+        Forgets an account's failures after it signs in.
+        """
+        with self.lock:
+            self.accounts.pop(self.key(email), None)
+
+
+# The per-process login guard
+login_guard = LoginGuard()
+
+# A hash of no one's password, checked against when there is no real hash so
+# a login costs one bcrypt whether or not the email is registered. Made on
+# first use, with the same cost as the hashes made at registration.
+dummy_hash: Optional[bytes] = None
+dummy_hash_lock = threading.Lock()
+
+
+def get_dummy_hash() -> bytes:
+    global dummy_hash
+    with dummy_hash_lock:
+        if dummy_hash is None:
+            dummy_hash = bcrypt.hashpw(b"not a password", bcrypt.gensalt())
+        return dummy_hash
+
+
+def verify_password(password: str, password_hash: Optional[str]) -> bool:
+    """
+    Checks a password against a user's hash in constant cost: when there is
+    no hash, e.g. for an unknown email, the same bcrypt work is done against
+    a dummy hash and the check fails.
+    :param password: the password that was given
+    :param password_hash: the user's stored hash, or None if there is no user
+    """
+    if password_hash is None:
+        bcrypt.checkpw(password.encode("utf-8"), get_dummy_hash())
+        return False
+    return bcrypt.checkpw(password.encode("utf-8"), password_hash.encode("utf-8"))
@@ -1,14 +1,28 @@
 from abc import ABCMeta
-from dotenv import load_dotenv
-from psycopg2 import connect, extensions
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Tuple
+from psycopg2 import connect, extensions, OperationalError, InterfaceError
 from psycopg2.extras import RealDictCursor
+from psycopg2.pool import ThreadedConnectionPool, PoolError
 from psycopg2.sql import SQL, Identifier
+import itertools
 import os
+import sys
+import threading
+import time
 from app.database_const import MINERVA
+from app.config import (
+    MINERVA_POOL_MIN_CONNECTIONS,
+    MINERVA_POOL_MAX_CONNECTIONS,
+    MINERVA_REPLICA_DSNS,
+    READ_YOUR_WRITES_SECONDS,
+    REPLICA_HEALTH_CHECK_SECONDS,
+    REPLICA_RETRY_SECONDS,
+    MINERVA_STATEMENT_TIMEOUT_MS,
+    MINERVA_LOCK_TIMEOUT_MS,
+)
 from stringcase import camelcase
 
-load_dotenv()
-
 # Access the password and other DB credentials
 MINERVA_PASSWORD = os.getenv("MINERVA_PASSWORD")
 MINERVA_USER = os.getenv("MINERVA_USER", "postgres")
@@ -77,20 +91,339 @@ class SchemaTable:
         return SQL("{}.{}").format(cls.schema(), cls.table())
 
 
+# The name of the primary's pool
+PRIMARY = "primary"
+
+# When the current client last wrote to the primary, as a time.time() value.
+# The app carries it in a cookie so reads right after a write stay on the
+# primary whichever process or host serves them; commits move it forward.
+minerva_last_write: ContextVar[Optional[float]] = ContextVar("minerva_last_write", default=None)
+
+# When the current request must be finished by, as a time.monotonic() value.
+# Cursors turn the time left into a statement timeout.
+minerva_deadline: ContextVar[Optional[float]] = ContextVar("minerva_deadline", default=None)
+
+
+class ConnectionPools:
+    """
+    One thread-safe connection pool per database, each created the first
+    time that database is used.
+    """
+
+    def __init__(
+        self,
+        min_connections: int = MINERVA_POOL_MIN_CONNECTIONS,
+        max_connections: int = MINERVA_POOL_MAX_CONNECTIONS,
+    ):
+        self.min_connections = min_connections
+        self.max_connections = max_connections
+        self.pools: Dict[str, ThreadedConnectionPool] = {}
+        # When each pooled connection was last handed back, by id()
+        self.last_used: Dict[int, float] = {}
+        # Pools inherited across a fork, kept only so they are never closed
+        self.abandoned: List[ThreadedConnectionPool] = []
+        self.lock = threading.Lock()
+
+    def getconn(self, name: str, **connect_kwargs) -> Tuple[extensions.connection, bool]:
+        """
+        Checks out a connection to the named database.
+        :param connect_kwargs: how to connect, used when the pool is created
+        :return: the connection, and whether it came from the pool. Once the
+        pool is exhausted, a one-off connection is returned instead.
+        """
+        pool = self.pool(name, **connect_kwargs)
+        try:
+            connection = pool.getconn()
+        except PoolError:
+            return connect(**connect_kwargs), False
+
+        # A connection the server dropped while it sat in the pool
+        if connection.closed:
+            pool.putconn(connection, close=True)
+            connection = pool.getconn()
+        return connection, True
+
+    def pool(self, name: str, **connect_kwargs) -> ThreadedConnectionPool:
+        """
+        The named database's pool, created with its minimum connections
+        open the first time it is asked for.
+        """
+        with self.lock:
+            pool = self.pools.get(name)
+            if pool is None:
+                pool = ThreadedConnectionPool(self.min_connections, self.max_connections, **connect_kwargs)
+                self.pools[name] = pool
+            return pool
+
+    def warm(self, name: str, statements: List = ("SELECT 1;",), **connect_kwargs) -> None:
+        """
+        Opens the named database's pool ahead of its first request and runs
+        statements on each of its minimum connections, checking that they
+        work and loading the server's per-session caches for what the
+        statements touch.
+        """
+        checked_out = []
+        try:
+            for _ in range(max(1, self.min_connections)):
+                connection, pooled = self.getconn(name, **connect_kwargs)
+                checked_out.append((connection, pooled))
+                with connection.cursor() as cur:
+                    for statement in statements:
+                        cur.execute(statement)
+                connection.rollback()
+        finally:
+            for connection, pooled in checked_out:
+                if pooled:
+                    self.putconn(name, connection)
+                else:
+                    connection.close()
+
+    def discard(self) -> None:
+        """
+        Forgets every pool without closing its connections, for a process
+        just forked from one that had them open. The inherited connections
+        share their sockets with the parent, so closing them, or letting them
+        be garbage collected, would end the parent's sessions too.
+        """
+        with self.lock:
+            self.abandoned.extend(self.pools.values())
+            self.pools = {}
+            self.last_used = {}
+
+    def closeall(self) -> None:
+        """
+        Closes every pooled connection, for a process about to exit.
+        """
+        with self.lock:
+            pools, self.pools = self.pools, {}
+            self.last_used = {}
+        for pool in pools.values():
+            pool.closeall()
+
+    def idle_seconds(self, connection: extensions.connection) -> float:
+        """
+        How long a pooled connection sat unused, infinite if it is new.
+        """
+        return time.monotonic() - self.last_used.get(id(connection), float("-inf"))
+
+    def putconn(self, name: str, connection: extensions.connection, close: bool = False) -> None:
+        """
+        Returns a pooled connection, closing it instead if it is broken.
+        """
+        close = close or bool(connection.closed)
+        if close:
+            self.last_used.pop(id(connection), None)
+        else:
+            self.last_used[id(connection)] = time.monotonic()
+        self.pools[name].putconn(connection, close=close)
+
+
+class ReplicaRouter:
+    """
+    Decides where read-only cursors go: round robin across the replicas that
+    are up, or the primary when there are none or when the client wrote
+    within the read-your-writes window.
+
+    The window is not kept here but carried by the client as the time of its
+    last write (see minerva_last_write), so it holds across every worker and
+    host behind the load balancer.
+    """
+
+    def __init__(
+        self,
+        dsns: List[str] = MINERVA_REPLICA_DSNS,
+        pin_seconds: float = READ_YOUR_WRITES_SECONDS,
+        retry_seconds: float = REPLICA_RETRY_SECONDS,
+    ):
+        self.dsns = list(dsns)
+        self.pin_seconds = pin_seconds
+        self.retry_seconds = retry_seconds
+        self.down_until: Dict[str, float] = {}
+        self.turn = itertools.count()
+        self.lock = threading.Lock()
+
+    def record_write(self) -> None:
+        """
+        Keeps the current client's reads on the primary for the pin window.
+        """
+        if self.dsns:
+            minerva_last_write.set(time.time())
+
+    def is_pinned(self, last_write: Optional[float]) -> bool:
+        """
+        Whether a client that last wrote at this time must read from the
+        primary. A time in the future, e.g. from a host whose clock runs
+        ahead, pins for no longer than the window either.
+        """
+        return last_write is not None and abs(time.time() - last_write) < self.pin_seconds
+
+    def replicas(self, last_write: Optional[float] = None) -> List[str]:
+        """
+        The replicas to try for a read, in order. Empty means the primary.
+        :param last_write: when the client last wrote, if it has
+        """
+        if not self.dsns or self.is_pinned(last_write):
+            return []
+        now = time.monotonic()
+        with self.lock:
+            up = [dsn for dsn in self.dsns if self.down_until.get(dsn, 0) <= now]
+        if not up:
+            return []
+        start = next(self.turn) % len(up)
+        return up[start:] + up[:start]
+
+    def mark_down(self, dsn: str) -> None:
+        """
+        Skips a replica that failed until the retry delay has passed.
+        """
+        print(f"Minerva replica unavailable, failing over: {dsn}")
+        with self.lock:
+            self.down_until[dsn] = time.monotonic() + self.retry_seconds
+
+
+# Process-wide connection pools and replica routing
+minerva_pools = ConnectionPools()
+replica_router = ReplicaRouter()
+
+
+class UnitOfWork:
+    """
+    One primary connection and transaction shared by every MinervaCursor
+    opened while the unit is current, so a request that calls several spec
+    methods checks out a single connection and commits once, atomically.
+    Each cursor block runs in its own savepoint: an error rolls back just
+    that block and the rest of the transaction stays usable.
+
+    The connection is checked out by the first cursor that needs one. Used
+    as a context manager the unit commits on a clean exit; the app begins one
+    per request and commits it once the response is known to succeed.
+    """
+
+    def __init__(self):
+        self.connection = None
+        self.pooled = False
+        self.active = False
+        self.wrote = False
+        self.broken = False
+        self.savepoints = itertools.count(1)
+        self.commit_callbacks: List[Callable[[], None]] = []
+        self.token = None
+
+    @classmethod
+    def current(cls) -> Optional["UnitOfWork"]:
+        """
+        The unit of work cursors would join right now, if any.
+        """
+        unit = minerva_unit_of_work.get()
+        return unit if unit is not None and unit.active else None
+
+    def begin(self) -> "UnitOfWork":
+        """
+        Makes this the current unit of work.
+        """
+        self.active = True
+        self.token = minerva_unit_of_work.set(self)
+        return self
+
+    def checkout(self) -> extensions.connection:
+        """
+        The unit's connection, checked out from the primary's pool on first use.
+        """
+        if self.connection is None:
+            self.connection, self.pooled = minerva_pools.getconn(PRIMARY, **MinervaCursor.primary_connect_kwargs())
+        return self.connection
+
+    def after_commit(self, callback: Callable[[], None]) -> None:
+        """
+        Runs callback once the unit commits. It is dropped on rollback.
+        """
+        self.commit_callbacks.append(callback)
+
+    def finish(self, commit: bool) -> None:
+        """
+        Commits or rolls back the unit's transaction and returns its
+        connection. Cursors opened afterwards run on their own.
+        :raises: any error from the commit, once the connection is returned
+        """
+        if not self.active:
+            return
+        self.active = False
+        callbacks, self.commit_callbacks = self.commit_callbacks, []
+
+        if self.connection is not None:
+            try:
+                if commit and not self.broken:
+                    self.connection.commit()
+                    print("Unit of work committed.")
+                    if self.wrote:
+                        replica_router.record_write()
+                else:
+                    self.connection.rollback()
+                    print("Unit of work rolled back.")
+            except (OperationalError, InterfaceError):
+                self.broken = True
+                raise
+            finally:
+                if self.pooled:
+                    minerva_pools.putconn(PRIMARY, self.connection, close=self.broken)
+                else:
+                    self.connection.close()
+                self.connection = None
+
+        if commit and not self.broken:
+            for callback in callbacks:
+                callback()
+
+    def end(self) -> None:
+        """
+        Stops this being the current unit of work.
+        """
+        if self.token is None:
+            return
+        try:
+            minerva_unit_of_work.reset(self.token)
+        except ValueError:
+            # Streamed responses finish in a different context
+            minerva_unit_of_work.set(None)
+        self.token = None
+
+    def __enter__(self) -> "UnitOfWork":
+        return self.begin()
+
+    def __exit__(self, exception_type, exception_value, exception_traceback):
+        try:
+            self.finish(commit=exception_type is None)
+        finally:
+            self.end()
+
+
+# The unit of work the current request's cursors join
+minerva_unit_of_work: ContextVar[Optional[UnitOfWork]] = ContextVar("minerva_unit_of_work", default=None)
+
+
 class MinervaCursor(object, metaclass=ABCMeta):
     """
     A psycopg2 cursor that executres queries and is handled in a 'with' block.
     The with block usage eliminates worries about closing the cursor, returning
     the connection, or committing the changes.
+
+    Connections come from per-database pools. A cursor opened with
+    read_only=True may be served by a read replica (see ReplicaRouter);
+    everything else goes to the primary. Inside a UnitOfWork, cursors on the
+    primary join the unit's transaction instead of committing on their own.
     """
 
     @classmethod
     def get_minerva_connection(cls):
         """
-        Creates and returns a new connection to the Minerva PostgreSQL
-        database.
+        Creates and returns a new, unpooled connection to the Minerva
+        PostgreSQL primary, for long-lived uses such as LISTEN.
         """
-        return connect(
+        return connect(**cls.primary_connect_kwargs())
+
+    @classmethod
+    def primary_connect_kwargs(cls) -> dict:
+        return dict(
             host=MINERVA_HOST,
             database=MINERVA,
             user=MINERVA_USER,
@@ -98,13 +431,57 @@ class MinervaCursor(object, metaclass=ABCMeta):
             cursor_factory=RealDictCursor,
         )
 
-    def __init__(self):
+    @classmethod
+    def replica_connect_kwargs(cls, dsn: str) -> dict:
+        return dict(dsn=dsn, cursor_factory=RealDictCursor)
+
+    def __init__(self, read_only: bool = False):
         """
-        Initializes the MinervaCursor instance by establishing a
-        connection to the database.
+        Initializes the MinervaCursor instance.
+        :param read_only: whether the block only reads, so it may run on a
+        replica
         """
+        self.read_only = read_only
+        self.pool_name = None
+        self.pooled = False
         self.minerva_connection = None
         self.cursor = None
+        self.unit = None
+        self.savepoint = None
+
+    def checkout(self) -> None:
+        """
+        Checks out a connection: the current unit of work's, from a healthy
+        replica for read-only cursors when there is one, or from the primary.
+        Read-only cursors only use a replica while the unit has not touched
+        the primary, so they always see the unit's own writes.
+        """
+        replicas = replica_router.replicas(minerva_last_write.get()) if self.read_only else []
+
+        unit = UnitOfWork.current()
+        if unit is not None and (unit.connection is not None or not replicas):
+            self.unit, self.pool_name, self.minerva_connection = unit, PRIMARY, unit.checkout()
+            return
+
+        if self.read_only:
+            for dsn in replicas:
+                connection = None
+                try:
+                    connection, pooled = minerva_pools.getconn(dsn, **self.replica_connect_kwargs(dsn))
+                    if minerva_pools.idle_seconds(connection) > REPLICA_HEALTH_CHECK_SECONDS:
+                        with connection.cursor() as cur:
+                            cur.execute("SELECT 1;")
+                        connection.rollback()
+                except (OperationalError, InterfaceError):
+                    if connection is not None and pooled:
+                        minerva_pools.putconn(dsn, connection, close=True)
+                    replica_router.mark_down(dsn)
+                    continue
+                self.pool_name, self.pooled, self.minerva_connection = dsn, pooled, connection
+                return
+
+        connection, pooled = minerva_pools.getconn(PRIMARY, **self.primary_connect_kwargs())
+        self.pool_name, self.pooled, self.minerva_connection = PRIMARY, pooled, connection
 
     def __enter__(self) -> extensions.cursor:
         """
@@ -113,21 +490,76 @@ class MinervaCursor(object, metaclass=ABCMeta):
         :return: A cursor with the Minerva role that will be assigned to
         whatever variable is used with "as".
         """
-        # Establish the connection
-        self.minerva_connection = self.get_minerva_connection()
+        # Check out a connection
+        self.checkout()
 
-        # Create a cursor from the connection
-        self.cursor = self.minerva_connection.cursor()
+        try:
+            # Create a cursor from the connection
+            self.cursor = self.minerva_connection.cursor()
+            self.begin_block()
+        except BaseException:
+            # __exit__ is not called when __enter__ fails
+            self.__exit__(*sys.exc_info())
+            raise
 
         # Return the cursor to be used in the "with" block
         return self.cursor
 
+    def begin_block(self) -> None:
+        """
+        Opens a savepoint when the cursor joined a unit of work and applies
+        the timeouts, in one round trip. The timeout settings are
+        transaction-local, so pooled connections come back clean.
+        :raises DeadlineExceededException: if the deadline has already passed
+        """
+        statement_ms, lock_ms = self.timeouts()
+
+        statements = []
+        if self.unit is not None:
+            self.savepoint = f"minerva_savepoint_{next(self.unit.savepoints)}"
+            statements.append(f"SAVEPOINT {self.savepoint};")
+        if statement_ms or lock_ms:
+            statements.append(
+                "SELECT set_config('statement_timeout', %s, true), set_config('lock_timeout', %s, true);"
+            )
+
+        if statements:
+            params = (str(statement_ms), str(lock_ms)) if statement_ms or lock_ms else None
+            self.cursor.execute(" ".join(statements), params)
+
+    def timeouts(self) -> Tuple[int, int]:
+        """
+        The statement timeout, bounded by the time left before the request
+        deadline, and the lock timeout, bounded by MINERVA_LOCK_TIMEOUT_MS,
+        in milliseconds. 0 means no timeout.
+        :raises DeadlineExceededException: if the deadline has already passed
+        """
+        statement_ms = MINERVA_STATEMENT_TIMEOUT_MS
+        deadline = minerva_deadline.get()
+        if deadline is not None:
+            remaining_ms = int((deadline - time.monotonic()) * 1000)
+            if remaining_ms <= 0:
+                raise DeadlineExceededException("The request deadline passed before the query could run")
+            statement_ms = min(statement_ms, remaining_ms) if statement_ms else remaining_ms
+
+        lock_ms = MINERVA_LOCK_TIMEOUT_MS
+        if statement_ms and lock_ms:
+            lock_ms = min(lock_ms, statement_ms)
+
+        return statement_ms, lock_ms
+
     def __exit__(self, exception_type, exception_value, exception_traceback):
         """
         The tear-down code that will close the cursor at the end of the
         statement. If there were any issues, rollback changes. Otherwise,
         close the cursor, commit to the DB, and return the connection.
+        Inside a unit of work only the block's savepoint is released or
+        rolled back; the unit commits later.
         """
+        if self.unit is not None:
+            self.end_block(exception_type, exception_value)
+            return
+
         try:
             if exception_type is not None:
                 # If there was an exception, rollback any changes
@@ -137,16 +569,43 @@ class MinervaCursor(object, metaclass=ABCMeta):
                 # If no exceptions, commit the transaction
                 self.minerva_connection.commit()
                 print("Transaction committed successfully.")
+                if not self.read_only:
+                    replica_router.record_write()
         except Exception as e:
             print(f"Error during commit/rollback: {e}")
         finally:
-            # Close the cursor and connection
+            # Close the cursor and return the connection
             if self.cursor:
                 self.cursor.close()
                 print("Cursor closed.")
             if self.minerva_connection:
-                self.minerva_connection.close()
-                print("Connection closed.")
+                if self.pooled:
+                    broken = isinstance(exception_value, (OperationalError, InterfaceError))
+                    minerva_pools.putconn(self.pool_name, self.minerva_connection, close=broken)
+                    print("Connection returned to the pool.")
+                else:
+                    self.minerva_connection.close()
+                    print("Connection closed.")
+
+    def end_block(self, exception_type, exception_value) -> None:
+        try:
+            if self.savepoint is not None:
+                if exception_type is None:
+                    self.cursor.execute(f"RELEASE SAVEPOINT {self.savepoint};")
+                else:
+                    self.cursor.execute(f"ROLLBACK TO SAVEPOINT {self.savepoint};")
+                    print("Rolled back to the savepoint due to an error.")
+            if exception_type is None and not self.read_only:
+                self.unit.wrote = True
+        except Exception as e:
+            print(f"Error during savepoint release/rollback: {e}")
+            self.unit.broken = True
+        finally:
+            if isinstance(exception_value, (OperationalError, InterfaceError)):
+                self.unit.broken = True
+            if self.cursor:
+                self.cursor.close()
+                print("Cursor closed.")
 
 
 def to_camel_case(data):
@@ -155,3 +614,11 @@ def to_camel_case(data):
     if isinstance(data, dict):
         return {camelcase(key): to_camel_case(value) for key, value in data.items()}
     return data
+
+
+class DeadlineExceededException(Exception):
+    """
+    An exception for a query attempted after its request's deadline
+    """
+
+    pass
@@ -0,0 +1,170 @@
+from typing import Dict, Optional, Set
+from psycopg2 import extensions
+from app.postgresql_utils import MinervaCursor
+from app.database_const import PROJECT_CHANGES_CHANNEL
+import json
+import os
+import queue
+import select
+import threading
+import time
+
+# Seconds to wait between reconnect attempts after the listener loses Minerva
+RECONNECT_DELAY_SECONDS = 1.0
+
+# How often the listener wakes up to notice that every subscriber has left
+POLL_INTERVAL_SECONDS = 5.0
+
+
+class Subscription:
+    """
+    One client's view of the project change stream. Events are buffered in a
+    bounded queue; if the client falls behind, the oldest events are dropped
+    and a single "resync" event tells it to fall back to /projects/changes.
+    """
+
+    def __init__(self, email: str, project_id: Optional[int] = None, max_size: int = 100):
+        self.email = email
+        self.project_id = project_id
+        self.events = queue.Queue(maxsize=max_size)
+
+    def wants(self, event: dict) -> bool:
+        """
+        Whether this subscription cares about the event.
+        """
+        return self.project_id is None or event.get("project_id") == self.project_id
+
+    def put(self, event: dict) -> None:
+        """
+        Queues an event without ever blocking the listener thread.
+        """
+        try:
+            self.events.put_nowait(event)
+        except queue.Full:
+            # Replace the backlog with a single marker so the client re-syncs
+            with self.events.mutex:
+                self.events.queue.clear()
+            self.events.put_nowait({"operation": "resync"})
+
+    def get(self, timeout: float) -> Optional[dict]:
+        """
+        Waits up to timeout seconds for the next event.
+        :return: the event, or None if nothing arrived in time
+        """
+        try:
+            return self.events.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class ProjectChangeListener:
+    """
+    Multiplexes a single LISTEN connection per process across every
+    subscribed client. The connection is opened on the first subscription and
+    closed once the last subscriber leaves.
+    """
+
+    def __init__(self, channel: str = PROJECT_CHANGES_CHANNEL):
+        self.channel = channel
+        self.subscribers: Dict[str, Set[Subscription]] = {}
+        self.lock = threading.Lock()
+        self.thread = None
+        self.pid = None
+
+    def subscribe(self, email: str, project_id: Optional[int] = None, max_size: int = 100) -> Subscription:
+        """
+        Registers a subscriber for a user's changes, optionally narrowed to
+        one project.
+        """
+        subscription = Subscription(email, project_id, max_size)
+        with self.lock:
+            self.subscribers.setdefault(email, set()).add(subscription)
+            self._ensure_started()
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        """
+        Removes a subscriber. The listener thread notices on its next wake-up.
+        """
+        with self.lock:
+            subscriptions = self.subscribers.get(subscription.email)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self.subscribers[subscription.email]
+
+    def subscriber_count(self) -> int:
+        """
+        The number of currently connected subscribers in this process.
+        """
+        with self.lock:
+            return sum(len(subscriptions) for subscriptions in self.subscribers.values())
+
+    def dispatch(self, payload: str) -> None:
+        """
+        Fans one NOTIFY payload out to the matching subscribers.
+        """
+        try:
+            event = json.loads(payload)
+        except ValueError:
+            print(f"Ignoring malformed {self.channel} payload: {payload}")
+            return
+
+        with self.lock:
+            subscriptions = list(self.subscribers.get(event.pop("email", None), ()))
+
+        for subscription in subscriptions:
+            if subscription.wants(event):
+                subscription.put(event)
+
+    def _ensure_started(self) -> None:
+        """
+        Starts the listener thread if it is not running in this process. Must
+        be called with the lock held. A forked child never inherits a running
+        thread, so the pid check restarts it after fork.
+        """
+        if self.thread is not None and self.thread.is_alive() and self.pid == os.getpid():
+            return
+
+        self.pid = os.getpid()
+        self.thread = threading.Thread(target=self._run, name=f"{self.channel}-listener", daemon=True)
+        self.thread.start()
+
+    def _has_subscribers(self) -> bool:
+        with self.lock:
+            if self.subscribers:
+                return True
+            # Clear the thread under the lock so a racing subscribe starts a new one
+            self.thread = None
+            return False
+
+    def _run(self) -> None:
+        """
+        The listener loop. Reconnects on failure and exits once every
+        subscriber has gone.
+        """
+        while self._has_subscribers():
+            connection = None
+            try:
+                connection = MinervaCursor.get_minerva_connection()
+                connection.set_isolation_level(extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                with connection.cursor() as cur:
+                    cur.execute(f"LISTEN {self.channel};")
+
+                while self._has_subscribers():
+                    readable, _, _ = select.select([connection], [], [], POLL_INTERVAL_SECONDS)
+                    if not readable:
+                        continue
+                    connection.poll()
+                    while connection.notifies:
+                        self.dispatch(connection.notifies.pop(0).payload)
+            except Exception as e:
+                print(f"Project change listener error: {e}")
+                time.sleep(RECONNECT_DELAY_SECONDS)
+            finally:
+                if connection is not None:
+                    connection.close()
+
+
+# The per-process listener shared by every SSE stream
+project_change_listener = ProjectChangeListener()
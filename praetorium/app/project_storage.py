@@ -0,0 +1,505 @@
+from abc import ABCMeta, abstractmethod
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable, Dict, Iterator, List, Optional, Type
+from app.config import PROJECT_STORAGE_URL, SQLITE_BUSY_TIMEOUT_MS, WRITE_COALESCE_WINDOW_MS
+from app.db_table_specs.minerva_projects_specs import (
+    SavedProjects,
+    SavedProjectInsertException,
+    SavedProjectUpdateException,
+    SavedProjectSelectException,
+    TaskSubtrees,
+)
+from app.postgresql_utils import MinervaCursor, UnitOfWork
+from app.task_tree import CHILDREN
+from app.user_cache import user_cache
+from app.write_coalescer import WriteCoalescer, flush_on_exit
+import json
+import sqlite3
+import threading
+
+
+class ProjectStorage(object, metaclass=ABCMeta):
+    """
+    Where saved projects are kept. Backends return rows as dicts keyed by
+    the SavedProjects field names and raise the SavedProjects exceptions, so
+    callers can switch between them freely.
+    """
+
+    # Whether task trees are stored as content-addressed subtrees
+    shares_subtrees = False
+
+    @abstractmethod
+    def insert(self, email: str, project_name: str, project_description: str, tasks: Optional[str]) -> int:
+        """
+        Saves a new project under the user's next project_id.
+        :param tasks: the task tree as a JSON string
+        :return: the new project_id
+        :raises SavedProjectInsertException: for invalid input
+        """
+        pass
+
+    @abstractmethod
+    def update(
+        self,
+        project_id: int,
+        project_name: Optional[str] = None,
+        project_description: Optional[str] = None,
+        tasks: Optional[str] = None,
+        email: Optional[str] = None,
+    ) -> None:
+        """
+        Changes the given fields of a project, those that are not None, even
+        when empty. Without an email, the project is matched by project_id
+        alone.
+        :raises SavedProjectUpdateException: if there is nothing to update
+        """
+        pass
+
+    @abstractmethod
+    def append_subtask(self, project_id: int, email: str, path: List[int], node: dict) -> int:
+        """
+        Appends a child to the task at path without rewriting the tree.
+        :return: the index of the new child within its parent
+        :raises SavedProjectUpdateException: if the parent task does not exist
+        """
+        pass
+
+    @abstractmethod
+    def delete(self, project_id: int, email: str) -> None:
+        """
+        Marks a project deleted.
+        :raises ValueError: if the user has no such project
+        """
+        pass
+
+    @abstractmethod
+    def select_all(self, email: str) -> List[dict]:
+        """
+        A user's active projects.
+        """
+        pass
+
+    @abstractmethod
+    def select_one(self, project_id: int) -> dict:
+        """
+        A project by project_id.
+        :raises SavedProjectSelectException: if there is none
+        """
+        pass
+
+    @abstractmethod
+    def select_many(self, project_ids: List[int], email: str, read_only: bool = True) -> Dict[int, Optional[dict]]:
+        """
+        Several of a user's active projects at once.
+        :return: every requested project_id, mapped to None when the user has
+        no such active project
+        """
+        pass
+
+
+class MinervaProjectStorage(ProjectStorage):
+    """
+    Projects in the Minerva Postgres database, through the SavedProjects
+    spec. Writes also refresh the stats rollup and publish change
+    notifications, and join the request's unit of work.
+    """
+
+    def insert(self, email, project_name, project_description, tasks):
+        return SavedProjects.insert_record(email, project_name, project_description, tasks)
+
+    def update(self, project_id, project_name=None, project_description=None, tasks=None, email=None):
+        SavedProjects.update_record(project_id, project_name, project_description, tasks, email)
+
+    def append_subtask(self, project_id, email, path, node):
+        return SavedProjects.append_subtask(project_id, email, path, node)
+
+    def delete(self, project_id, email):
+        SavedProjects.delete_record(project_id, email)
+
+    def select_all(self, email):
+        return SavedProjects.select_all(email)
+
+    def select_one(self, project_id):
+        return SavedProjects.select_one(project_id)
+
+    def select_many(self, project_ids, email, read_only=True):
+        return SavedProjects.select_many(project_ids, email, read_only=read_only)
+
+
+class DedupProjectStorage(MinervaProjectStorage):
+    """
+    Projects in Minerva with their task trees stored as content-addressed
+    subtrees (see TaskSubtrees), for deployments where many projects share
+    large parts of their trees, e.g. when they are generated from the same
+    prompts. A write only sends the subtrees Minerva does not have yet.
+
+    Projects saved before switching to this storage keep their tasks column
+    until their tree is next written.
+    """
+
+    shares_subtrees = True
+
+    @classmethod
+    def task_list(cls, tasks: Optional[str]) -> Optional[list]:
+        """
+        The tree in a tasks JSON string, or None for anything that is not a
+        list of tasks, which is then stored in the tasks column as before.
+        """
+        if not isinstance(tasks, str):
+            return None
+        try:
+            tree = json.loads(tasks)
+        except ValueError:
+            return None
+        return tree if isinstance(tree, list) else None
+
+    def insert(self, email, project_name, project_description, tasks):
+        tree = self.task_list(tasks)
+        if tree is None:
+            return super().insert(email, project_name, project_description, tasks)
+
+        # Subtrees left behind by a failed insert are collected later
+        with MinervaCursor() as cur:
+            task_roots = TaskSubtrees.store(cur, tree)
+        return SavedProjects.insert_record(email, project_name, project_description, None, task_roots)
+
+    def update(self, project_id, project_name=None, project_description=None, tasks=None, email=None):
+        tree = self.task_list(tasks)
+        if tree is None:
+            return super().update(project_id, project_name, project_description, tasks, email)
+
+        with MinervaCursor() as cur:
+            task_roots = TaskSubtrees.store(cur, tree)
+        SavedProjects.update_record(project_id, project_name, project_description, None, email, task_roots)
+
+    def append_subtask(self, project_id, email, path, node):
+        return TaskSubtrees.append_subtask(project_id, email, path, node)
+
+    def select_all(self, email):
+        return TaskSubtrees.assemble(super().select_all(email))
+
+    def select_one(self, project_id):
+        return TaskSubtrees.assemble([super().select_one(project_id)])[0]
+
+    def select_many(self, project_ids, email, read_only=True):
+        projects = super().select_many(project_ids, email, read_only)
+        TaskSubtrees.assemble([project for project in projects.values() if project is not None], read_only)
+        return projects
+
+
+class SQLiteProjectStorage(ProjectStorage):
+    """
+    Projects in an embedded SQLite database file, for single-node
+    deployments and CI runs without Postgres. The database runs in WAL mode
+    so reads never wait for a writer, and task trees are stored as JSON text
+    edited in place with the JSON1 functions.
+
+    Only the project records live here: stats, search, incremental sync and
+    change notifications remain Minerva features.
+    """
+
+    CREATE_SQL = """
+        CREATE TABLE IF NOT EXISTS saved_projects (
+            project_id INTEGER NOT NULL,
+            email TEXT NOT NULL,
+            project_name TEXT NOT NULL,
+            project_description TEXT NOT NULL,
+            tasks TEXT CHECK (tasks IS NULL OR json_valid(tasks)),
+            status TEXT NOT NULL DEFAULT 'active',
+            created_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now')),
+            updated_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now')),
+            deleted_at TEXT,
+            PRIMARY KEY (project_id, email)
+        );
+
+        CREATE INDEX IF NOT EXISTS saved_projects_email_updated_at_idx
+            ON saved_projects (email, updated_at, project_id);
+    """
+
+    # SQLite's CURRENT_TIMESTAMP only has second precision
+    NOW = "strftime('%Y-%m-%d %H:%M:%f', 'now')"
+
+    TIMESTAMP_FIELDS = (SavedProjects.CREATED_AT, SavedProjects.UPDATED_AT, SavedProjects.DELETED_AT)
+
+    def __init__(
+        self,
+        path: str,
+        require_user: Callable[[str], object] = user_cache.require,
+        busy_timeout_ms: int = SQLITE_BUSY_TIMEOUT_MS,
+    ):
+        """
+        :param path: the database file, created if missing
+        :param require_user: raises for an email that is not registered
+        :param busy_timeout_ms: how long a writer waits for another to finish
+        """
+        self.path = path
+        self.require_user = require_user
+        self.busy_timeout_ms = busy_timeout_ms
+        # sqlite3 connections may not be shared between threads
+        self.local = threading.local()
+        self.connection().executescript(self.CREATE_SQL)
+
+    def connection(self) -> sqlite3.Connection:
+        db = getattr(self.local, "connection", None)
+        if db is None:
+            # Autocommit mode; transactions are begun explicitly
+            db = sqlite3.connect(self.path, isolation_level=None, timeout=self.busy_timeout_ms / 1000)
+            db.row_factory = sqlite3.Row
+            db.execute("PRAGMA journal_mode = WAL;")
+            db.execute("PRAGMA synchronous = NORMAL;")
+            self.local.connection = db
+        return db
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """
+        A write transaction. It takes the write lock up front, so two
+        transactions cannot both read the next project_id.
+        """
+        db = self.connection()
+        db.execute("BEGIN IMMEDIATE;")
+        try:
+            yield db
+        except BaseException:
+            db.execute("ROLLBACK;")
+            raise
+        db.execute("COMMIT;")
+
+    @classmethod
+    def row(cls, row: sqlite3.Row) -> dict:
+        project = dict(row)
+        if project[SavedProjects.TASKS.raw] is not None:
+            project[SavedProjects.TASKS.raw] = json.loads(project[SavedProjects.TASKS.raw])
+        for field in cls.TIMESTAMP_FIELDS:
+            if project[field.raw] is not None:
+                project[field.raw] = datetime.fromisoformat(project[field.raw])
+        return project
+
+    @classmethod
+    def json_path(cls, path: List[int]) -> str:
+        """
+        The JSON1 path of the task at path, e.g. [0, 2] is $[0].tasks[2].
+        """
+        return "$" + f".{CHILDREN}".join(f"[{index}]" for index in path)
+
+    def insert(self, email, project_name, project_description, tasks):
+        if not isinstance(email, str):
+            raise SavedProjectInsertException(f"Email {email} is not a string!")
+        self.require_user(email)
+
+        if not isinstance(project_name, str):
+            raise SavedProjectInsertException(f"Project name {project_name} is not a string!")
+
+        if not isinstance(project_description, str):
+            raise SavedProjectInsertException(f"Project description {project_description} is not a string!")
+
+        if tasks is not None and not isinstance(tasks, str):
+            raise SavedProjectInsertException(f"Tasks {tasks} is not a string!")
+
+        with self.transaction() as db:
+            (project_id,) = db.execute(
+                "SELECT COALESCE(MAX(project_id), 0) + 1 FROM saved_projects WHERE email = ?;", (email,)
+            ).fetchone()
+            db.execute(
+                """
+                INSERT INTO saved_projects (project_id, email, project_name, project_description, tasks)
+                VALUES (?, ?, ?, ?, json(?));
+                """,
+                (project_id, email, project_name, project_description, tasks),
+            )
+        return project_id
+
+    def update(self, project_id, project_name=None, project_description=None, tasks=None, email=None):
+        if not isinstance(project_id, int):
+            raise SavedProjectUpdateException(f"Project ID {project_id} is not an integer!")
+
+        updates, params = [], []
+        if project_name is not None:
+            updates.append("project_name = ?")
+            params.append(project_name)
+        if project_description is not None:
+            updates.append("project_description = ?")
+            params.append(project_description)
+        if tasks is not None:
+            updates.append("tasks = json(?)")
+            params.append(tasks)
+        if not updates:
+            raise SavedProjectUpdateException("No fields to update were provided.")
+        updates.append(f"updated_at = {self.NOW}")
+
+        conditions = ["project_id = ?"]
+        params.append(project_id)
+        if email is not None:
+            conditions.append("email = ?")
+            params.append(email)
+
+        with self.transaction() as db:
+            db.execute(f"UPDATE saved_projects SET {', '.join(updates)} WHERE {' AND '.join(conditions)};", params)
+
+    def append_subtask(self, project_id, email, path, node):
+        if not path or not all(isinstance(index, int) for index in path):
+            raise SavedProjectUpdateException(f"Task path {path} must be a non-empty list of integers!")
+
+        parent_path = self.json_path(path)
+        children_path = f"{parent_path}.{CHILDREN}"
+
+        with self.transaction() as db:
+            result = db.execute(
+                f"""
+                UPDATE saved_projects
+                SET tasks = json_set(
+                        tasks,
+                        :children,
+                        json_insert(COALESCE(json_extract(tasks, :children), '[]'), '$[#]', json(:node))
+                    ),
+                    updated_at = {self.NOW}
+                WHERE project_id = :project_id AND email = :email AND json_type(tasks, :parent) = 'object'
+                RETURNING json_array_length(tasks, :children) - 1;
+                """,
+                {
+                    "children": children_path,
+                    "parent": parent_path,
+                    "node": json.dumps(node),
+                    "project_id": project_id,
+                    "email": email,
+                },
+            ).fetchone()
+
+        if result is None:
+            raise SavedProjectUpdateException(f"Task {path} does not exist in project {project_id}")
+        return result[0]
+
+    def delete(self, project_id, email):
+        if not isinstance(project_id, int):
+            raise ValueError(f"Project ID {project_id} must be an integer.")
+
+        if not isinstance(email, str):
+            raise ValueError(f"Email {email} must be a string.")
+
+        with self.transaction() as db:
+            deleted = db.execute(
+                f"""
+                UPDATE saved_projects SET status = 'deleted', deleted_at = {self.NOW}, updated_at = {self.NOW}
+                WHERE project_id = ? AND email = ?;
+                """,
+                (project_id, email),
+            ).rowcount
+        if deleted == 0:
+            raise ValueError(f"No project found with project_id={project_id} and email={email}.")
+
+    def select_all(self, email):
+        if not isinstance(email, str):
+            raise SavedProjectInsertException(f"Email {email} is not a string!")
+        self.require_user(email)
+
+        rows = self.connection().execute(
+            "SELECT * FROM saved_projects WHERE email = ? AND status = 'active';", (email,)
+        ).fetchall()
+        return [self.row(row) for row in rows]
+
+    def select_one(self, project_id):
+        if not isinstance(project_id, int):
+            raise SavedProjectSelectException(f"Project ID {project_id} is not an integer!")
+
+        row = self.connection().execute(
+            "SELECT * FROM saved_projects WHERE project_id = ?;", (project_id,)
+        ).fetchone()
+        if row is None:
+            raise SavedProjectSelectException(f"Project ID {project_id} does not exist!")
+        return self.row(row)
+
+    def select_many(self, project_ids, email, read_only=True):
+        if not isinstance(email, str):
+            raise SavedProjectSelectException(f"Email {email} is not a string!")
+
+        for project_id in project_ids:
+            if not isinstance(project_id, int):
+                raise SavedProjectSelectException(f"Project ID {project_id} is not an integer!")
+
+        results = {project_id: None for project_id in project_ids}
+        if not project_ids:
+            return results
+
+        rows = self.connection().execute(
+            """
+            SELECT * FROM saved_projects
+            WHERE project_id IN (SELECT value FROM json_each(?)) AND email = ? AND status = 'active';
+            """,
+            (json.dumps(list(results)), email),
+        ).fetchall()
+        for row in rows:
+            results[row[SavedProjects.PROJECT_ID.raw]] = self.row(row)
+        return results
+
+
+class UnknownStorageException(Exception):
+    """
+    An exception for a project storage URL with an unknown scheme
+    """
+
+    pass
+
+
+# Backends selectable through the PROJECT_STORAGE_URL scheme
+STORAGE_BACKENDS: Dict[str, Type[ProjectStorage]] = {
+    "minerva": MinervaProjectStorage,
+    "minerva+dedup": DedupProjectStorage,
+    "sqlite": SQLiteProjectStorage,
+}
+
+
+def get_project_storage(url: Optional[str] = None) -> ProjectStorage:
+    """
+    Creates the storage for a URL: minerva:// for Postgres,
+    minerva+dedup:// for Postgres with deduplicated task trees, or
+    sqlite:///path/to/projects.db for an embedded database.
+    :param url: defaults to PROJECT_STORAGE_URL
+    :raises UnknownStorageException: for an unknown scheme
+    """
+    url = url or PROJECT_STORAGE_URL
+    scheme, _, location = url.partition("://")
+    if scheme not in STORAGE_BACKENDS:
+        raise UnknownStorageException(f"Unknown project storage {url}")
+    if scheme == "sqlite":
+        return SQLiteProjectStorage(location[1:] if location.startswith("/") else location)
+    return STORAGE_BACKENDS[scheme]()
+
+
+# The storage the routes use
+project_storage = get_project_storage()
+
+
+def write_project(key, fields) -> None:
+    """
+    Persists a batch of coalesced edits for one (email, project_id). The
+    edits belong to earlier requests, so they commit in a unit of work of
+    their own rather than with whichever request flushes them.
+    """
+    email, project_id = key
+    if not project_writes.enabled:
+        # Written synchronously, as part of the submitting request
+        project_storage.update(project_id, email=email, **fields)
+        return
+
+    with UnitOfWork():
+        project_storage.update(project_id, email=email, **fields)
+
+
+def report_failed_write(key, error: Exception) -> None:
+    """
+    Tells a user's change stream that coalesced edits they were sent a 202
+    for could not be saved, so the client can resend them.
+    """
+    email, project_id = key
+    try:
+        with MinervaCursor() as cur:
+            SavedProjects.notify_change(cur, email, project_id, "write_failed")
+    except Exception as e:
+        print(f"Could not report the failed write for {key}: {e}")
+
+
+# Collapses rapid edits to the same project into a single UPDATE
+project_writes = flush_on_exit(
+    WriteCoalescer(write_project, WRITE_COALESCE_WINDOW_MS / 1000, on_failure=report_failed_write)
+)
@@ -0,0 +1,315 @@
+from abc import ABCMeta, abstractmethod
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+from flask import Flask, current_app, g, jsonify, request
+from flask_jwt_extended import verify_jwt_in_request, get_jwt_identity
+from app.config import (
+    RATE_LIMIT_ENABLED,
+    RATE_LIMIT_STORAGE_URL,
+    RATE_LIMIT_MEMORY_MAX_KEYS,
+    RATE_LIMIT_DEFAULT,
+    MAX_CONCURRENT_REQUESTS_PER_USER,
+)
+import math
+import threading
+import time
+
+PERIODS = {"second": 1, "minute": 60, "hour": 60 * 60}
+
+
+class Rate:
+    """
+    A budget of `limit` requests per `period` seconds, enforced as a token
+    bucket that holds up to `limit` tokens and refills continuously.
+    """
+
+    def __init__(self, limit: int, period: float):
+        self.limit = limit
+        self.period = period
+
+    @property
+    def per_second(self) -> float:
+        return self.limit / self.period
+
+    @classmethod
+    def parse(cls, spec: str) -> "Rate":
+        """
+        Parses a rate such as "10/minute".
+        :raises ValueError: if spec is not "<requests>/<second|minute|hour>"
+        """
+        try:
+            limit, period = spec.strip().split("/")
+            return cls(int(limit), PERIODS[period.strip().lower()])
+        except (ValueError, KeyError):
+            raise ValueError(f"Invalid rate {spec!r}, expected e.g. 10/minute")
+
+    def __repr__(self):
+        return f"Rate({self.limit}/{self.period}s)"
+
+
+class TokenBucketStore(object, metaclass=ABCMeta):
+    """
+    Where token buckets are kept.
+    """
+
+    @abstractmethod
+    def take(self, key: str, rate: Rate, cost: int = 1) -> Tuple[bool, float]:
+        """
+        Takes cost tokens from the bucket at key, refilling it first.
+        :return: whether the tokens were available, and if not, how many
+        seconds until they will be
+        """
+        pass
+
+
+class MemoryTokenBucketStore(TokenBucketStore):
+    """
+    Buckets in a dict, for a single process. The least recently used
+    buckets are evicted past max_keys; an evicted bucket was idle, so it
+    would have refilled anyway.
+    """
+
+    def __init__(self, max_keys: int = RATE_LIMIT_MEMORY_MAX_KEYS):
+        self.max_keys = max_keys
+        self.buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self.lock = threading.Lock()
+
+    def take(self, key: str, rate: Rate, cost: int = 1) -> Tuple[bool, float]:
+        now = time.monotonic()
+        with self.lock:
+            tokens, updated_at = self.buckets.get(key, (rate.limit, now))
+            tokens = min(rate.limit, tokens + (now - updated_at) * rate.per_second)
+
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+
+            self.buckets[key] = (tokens, now)
+            self.buckets.move_to_end(key)
+            while len(self.buckets) > self.max_keys:
+                self.buckets.popitem(last=False)
+
+        return allowed, 0.0 if allowed else (cost - tokens) / rate.per_second
+
+
+class RedisTokenBucketStore(TokenBucketStore):
+    """
+    Buckets in Redis, shared by every worker and host. The refill and take
+    run in one Lua script, so concurrent requests cannot both spend the last
+    token, and the Redis clock is used so hosts need not agree on the time.
+    """
+
+    SCRIPT = """
+        local rate = tonumber(ARGV[1])
+        local burst = tonumber(ARGV[2])
+        local cost = tonumber(ARGV[3])
+        local clock = redis.call('TIME')
+        local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+
+        local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at')
+        local tokens = tonumber(state[1]) or burst
+        local updated_at = tonumber(state[2]) or now
+        tokens = math.min(burst, tokens + math.max(0, now - updated_at) * rate)
+
+        local allowed = 0
+        local retry_after = 0
+        if tokens >= cost then
+            tokens = tokens - cost
+            allowed = 1
+        else
+            retry_after = (cost - tokens) / rate
+        end
+
+        redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated_at', now)
+        redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000))
+        return {allowed, tostring(retry_after)}
+    """
+
+    def __init__(self, url: str):
+        # Redis is optional, and only imported by deployments that use it
+        try:
+            import redis
+        except ImportError:
+            raise RateLimitConfigException("The redis package is required for a redis:// rate limit store")
+        self.client = redis.Redis.from_url(url)
+        self.script = self.client.register_script(self.SCRIPT)
+
+    def take(self, key: str, rate: Rate, cost: int = 1) -> Tuple[bool, float]:
+        allowed, retry_after = self.script(keys=[f"rate_limit:{key}"], args=[rate.per_second, rate.limit, cost])
+        return bool(allowed), float(retry_after)
+
+
+def create_store(url: str = RATE_LIMIT_STORAGE_URL) -> TokenBucketStore:
+    """
+    Creates the token bucket store for a storage URL.
+    :raises RateLimitConfigException: for an unknown scheme
+    """
+    if url.startswith("memory://"):
+        return MemoryTokenBucketStore()
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisTokenBucketStore(url)
+    raise RateLimitConfigException(f"Unknown rate limit store {url}")
+
+
+def request_identity() -> Optional[str]:
+    """
+    The JWT identity of the current request, or None without a valid token.
+    For hooks that run before jwt_required checks the token properly.
+    """
+    if "request_identity" not in g:
+        try:
+            verify_jwt_in_request(optional=True)
+            g.request_identity = get_jwt_identity()
+        except Exception:
+            g.request_identity = None
+    return g.request_identity
+
+
+def rate_limit(spec: str):
+    """
+    A route decorator giving a view its own budget instead of its
+    blueprint's.
+    """
+    rate = Rate.parse(spec)
+
+    def decorator(view):
+        view.rate_limit = rate
+        return view
+
+    return decorator
+
+
+def no_concurrency_limit(view):
+    """
+    A route decorator exempting a view from the per-user concurrency quota,
+    for long-lived streams that would otherwise hold a slot for their whole
+    lifetime.
+    """
+    view.concurrency_exempt = True
+    return view
+
+
+class ConcurrencyQuota:
+    """
+    Counts each caller's requests in flight in this process.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.in_flight: Dict[str, int] = {}
+        self.lock = threading.Lock()
+
+    def acquire(self, key: str) -> bool:
+        with self.lock:
+            if self.in_flight.get(key, 0) >= self.limit:
+                return False
+            self.in_flight[key] = self.in_flight.get(key, 0) + 1
+            return True
+
+    def release(self, key: str) -> None:
+        with self.lock:
+            remaining = self.in_flight.get(key, 0) - 1
+            if remaining > 0:
+                self.in_flight[key] = remaining
+            else:
+                self.in_flight.pop(key, None)
+
+
+class RateLimiter:
+    """
+    Enforces token bucket budgets on every request, per client IP and per
+    JWT identity, plus a per-user quota on concurrent requests. A view's own
+    budget (set with rate_limit) takes precedence over its blueprint's, which
+    takes precedence over the default. Refused requests get a 429 with a
+    Retry-After header.
+
+    If the store fails, requests are let through: an outage of the shared
+    store should not take the API down with it.
+    """
+
+    def __init__(
+        self,
+        store: TokenBucketStore,
+        default: str = RATE_LIMIT_DEFAULT,
+        blueprints: Optional[Dict[str, str]] = None,
+        max_concurrent: int = MAX_CONCURRENT_REQUESTS_PER_USER,
+    ):
+        self.store = store
+        self.default = Rate.parse(default)
+        self.blueprints = {name: Rate.parse(spec) for name, spec in (blueprints or {}).items()}
+        self.concurrency = ConcurrencyQuota(max_concurrent) if max_concurrent > 0 else None
+
+    def init_app(self, app: Flask) -> None:
+        app.before_request(self.before_request)
+        app.teardown_request(self.teardown_request)
+
+    def rule(self) -> Tuple[str, Rate]:
+        """
+        The bucket scope and budget for the current request.
+        """
+        view = current_app.view_functions.get(request.endpoint)
+        if getattr(view, "rate_limit", None) is not None:
+            return request.endpoint, view.rate_limit
+        if request.blueprint in self.blueprints:
+            return request.blueprint, self.blueprints[request.blueprint]
+        return "default", self.default
+
+    def before_request(self):
+        if request.method == "OPTIONS" or request.endpoint is None:
+            return None
+
+        identity = request_identity()
+        scope, rate = self.rule()
+        keys = [f"{scope}:ip:{request.remote_addr}"]
+        if identity is not None:
+            keys.append(f"{scope}:user:{identity}")
+
+        for key in keys:
+            try:
+                allowed, retry_after = self.store.take(key, rate)
+            except Exception as e:
+                print(f"Rate limit store failed, allowing request: {e}")
+                break
+            if not allowed:
+                return self.too_many_requests(retry_after)
+
+        view = current_app.view_functions.get(request.endpoint)
+        if self.concurrency is not None and not getattr(view, "concurrency_exempt", False):
+            key = identity or request.remote_addr
+            if not self.concurrency.acquire(key):
+                return self.too_many_requests(1, "Too many concurrent requests")
+            g.concurrency_key = key
+
+        return None
+
+    def teardown_request(self, error=None) -> None:
+        key = g.pop("concurrency_key", None)
+        if key is not None:
+            self.concurrency.release(key)
+
+    @staticmethod
+    def too_many_requests(retry_after: float, message: str = "Too many requests"):
+        response = jsonify({"error": message})
+        response.status_code = 429
+        response.headers["Retry-After"] = str(max(1, math.ceil(retry_after)))
+        return response
+
+
+def init_rate_limiting(app: Flask, blueprints: Optional[Dict[str, str]] = None) -> Optional[RateLimiter]:
+    """
+    Enables rate limiting on the app, unless RATE_LIMIT_ENABLED is off.
+    :param blueprints: budgets for whole blueprints, by blueprint name
+    """
+    if not RATE_LIMIT_ENABLED:
+        return None
+    limiter = RateLimiter(create_store(), blueprints=blueprints)
+    limiter.init_app(app)
+    return limiter
+
+
+class RateLimitConfigException(Exception):
+    """
+    An exception for a rate limit store that cannot be set up
+    """
+
+    pass
@@ -0,0 +1,125 @@
+from functools import wraps
+from typing import Any, Optional
+from flask import request, jsonify
+from werkzeug.exceptions import RequestEntityTooLarge
+from app.compression import (
+    IDENTITY,
+    decompress,
+    UnsupportedEncodingException,
+    DecompressedBodyTooLargeException,
+)
+from app.config import REQUEST_BODY_CHUNK_SIZE
+import json
+
+
+def read_body(max_size: int, chunk_size: int = REQUEST_BODY_CHUNK_SIZE) -> bytes:
+    """
+    Reads the request body in chunks, giving up as soon as it grows past
+    max_size instead of buffering an upload of any size first.
+    :raises RequestBodyTooLargeException: if the body is larger than max_size
+    """
+    if request.content_length is not None and request.content_length > max_size:
+        raise RequestBodyTooLargeException(f"Request body exceeds {max_size} bytes")
+
+    body = bytearray()
+    try:
+        while True:
+            chunk = request.stream.read(chunk_size)
+            if not chunk:
+                break
+            body += chunk
+            if len(body) > max_size:
+                raise RequestBodyTooLargeException(f"Request body exceeds {max_size} bytes")
+    except RequestEntityTooLarge:
+        raise RequestBodyTooLargeException(f"Request body exceeds {max_size} bytes")
+    return bytes(body)
+
+
+def parse_json(body: bytes, max_objects: Optional[int] = None) -> Any:
+    """
+    Parses a JSON document, aborting mid-parse once it has produced more
+    than max_objects objects. Task trees are one object per task, so this
+    stops a tree with too many nodes before the rest of it is built.
+    :raises RequestBodyTooLargeException: if the document holds too many
+    objects or is nested too deeply to parse
+    :raises MalformedRequestBodyException: if the body is not valid JSON
+    """
+    count = 0
+
+    def count_objects(pairs):
+        nonlocal count
+        count += 1
+        if max_objects is not None and count > max_objects:
+            raise RequestBodyTooLargeException(f"Request body holds more than {max_objects} objects")
+        return dict(pairs)
+
+    try:
+        return json.loads(body, object_pairs_hook=count_objects)
+    except RecursionError:
+        raise RequestBodyTooLargeException("Request body is nested too deeply")
+    except ValueError as e:
+        raise MalformedRequestBodyException(f"Malformed JSON body: {e}")
+
+
+def json_body(max_size: int, max_objects: Optional[int] = None):
+    """
+    A route decorator that reads a JSON object body under a per-endpoint
+    size limit, inflating gzip or brotli bodies on the way, so the view can
+    call request.get_json() as usual. Oversized bodies are refused with a 413
+    as soon as the limit is crossed, before they are fully read or parsed.
+
+    :param max_size: the largest body accepted, compressed or not
+    :param max_objects: the most JSON objects the body may hold
+    """
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            # Lets werkzeug enforce the limit on bodies without a length too
+            request.max_content_length = max_size
+
+            if not request.is_json:
+                return jsonify({"error": "Content-Type must be application/json"}), 415
+
+            encoding = request.headers.get("Content-Encoding", IDENTITY).strip().lower()
+            try:
+                body = read_body(max_size)
+                if encoding not in ("", IDENTITY):
+                    body = decompress(body, encoding, max_size)
+                data = parse_json(body, max_objects)
+            except UnsupportedEncodingException as e:
+                return jsonify({"error": str(e)}), 415
+            except (RequestBodyTooLargeException, DecompressedBodyTooLargeException) as e:
+                return jsonify({"error": str(e)}), 413
+            except MalformedRequestBodyException as e:
+                return jsonify({"error": str(e)}), 400
+            except Exception as e:
+                return jsonify({"error": f"Malformed {encoding} body: {e}"}), 400
+
+            if not isinstance(data, dict):
+                return jsonify({"error": "Request body must be a JSON object"}), 400
+
+            # Later get_data()/get_json() calls read from these caches
+            request._cached_data = body
+            request._cached_json = (data, data)
+            return view(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+class RequestBodyTooLargeException(Exception):
+    """
+    An exception for a request body over its endpoint's limits
+    """
+
+    pass
+
+
+class MalformedRequestBodyException(Exception):
+    """
+    An exception for a request body that is not valid JSON
+    """
+
+    pass
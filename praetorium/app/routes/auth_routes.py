@@ -1,13 +1,23 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity, get_jwt
 import bcrypt
-from app.postgresql_utils import MinervaCursor
-from app.db_table_specs.minerva_auth_specs import Users
+from app.postgresql_utils import MinervaCursor, UnitOfWork, to_camel_case
+from app.db_table_specs.minerva_auth_specs import Users, EmailDoesNotExistException
+from app.db_table_specs.minerva_account_specs import AccountDeletions
+from app.account_deletion import account_deletion_queue
+from app.jobs import JobQueueFullException
+from app.user_cache import user_cache
+from app.login_guard import login_guard, verify_password
 from psycopg2.sql import SQL
+from app.request_body import json_body
+from app.rate_limit import RateLimiter
+from app.deadlines import timeout_response, TIMEOUT_EXCEPTIONS
+from app.config import MAX_AUTH_BODY_SIZE, AUTH_REQUEST_TIMEOUT_SECONDS
 from datetime import timedelta
 
 
 auth_bp = Blueprint("auth", __name__)
+auth_bp.request_timeout = AUTH_REQUEST_TIMEOUT_SECONDS
 blacklist = set()
 
 
@@ -18,17 +28,20 @@ def get_users():
     try:
         query = SQL("SELECT * FROM {st};").format(st=Users.string())
 
-        with MinervaCursor() as cur:
+        with MinervaCursor(read_only=True) as cur:
             cur.execute(query)
             users = cur.fetchall()
 
         return jsonify(users), 200
+    except TIMEOUT_EXCEPTIONS as e:
+        return timeout_response(e)
     except Exception as e:
         return jsonify({Users.ERROR.string(): str(e)}), 500
 
 
 # User Registration Route
 @auth_bp.route("/register", methods=["POST"])
+@json_body(MAX_AUTH_BODY_SIZE)
 def register():
     data = request.get_json()
     email = data.get(Users.EMAIL.raw)
@@ -65,16 +78,29 @@ def register():
         # Insert the new user into the database
         cur.execute(insert_query, (email, hashed_password.decode("utf-8"), first_name, last_name, plan))
 
+    # Forget that the email was unknown
+    Users.changed(email)
+
     return jsonify({"message": "User registered successfully"}), 201
 
 
 # User Login Route
 @auth_bp.route("/login", methods=["POST"])
+@json_body(MAX_AUTH_BODY_SIZE)
 def login():
     data = request.get_json()
     email = data.get(Users.EMAIL.raw)
     password = data.get(Users.PASSWORD)
 
+    if not isinstance(email, str) or not isinstance(password, str):
+        return jsonify({"message": "Email and password are required"}), 400
+
+    # Accounts backing off after repeated failures are refused before any
+    # query or bcrypt, whether or not the email is registered
+    retry_after = login_guard.retry_after(email)
+    if retry_after > 0:
+        return RateLimiter.too_many_requests(retry_after, "Too many failed login attempts")
+
     # SQL query to find the user by email
     select_query = SQL("SELECT * FROM {st} WHERE {email} = %s LIMIT 1;").format(
         st=Users.string(), email=Users.EMAIL.string()
@@ -84,8 +110,17 @@ def login():
         cur.execute(select_query, (email,))
         user = cur.fetchone()
 
-    # Verify the password
-    if user is not None and bcrypt.checkpw(password.encode("utf-8"), user[Users.PASSWORD_HASH.raw].encode("utf-8")):
+    # Accounts pending deletion can no longer sign in
+    if user is not None and user[Users.STATUS.raw] == Users.PENDING_DELETION:
+        user = None
+
+    # Verify the password. Unknown emails are checked against a dummy hash,
+    # so every login costs one bcrypt and its latency does not reveal whether
+    # the email is registered.
+    if verify_password(password, user[Users.PASSWORD_HASH.raw] if user is not None else None):
+        login_guard.succeeded(email)
+        # The profile was just read, so the requests that follow can use it
+        user_cache.put(email, user)
         access_token = create_access_token(identity=email, expires_delta=timedelta(hours=12))
         return (
             jsonify(
@@ -94,6 +129,7 @@ def login():
             200,
         )
 
+    login_guard.failed(email)
     return jsonify({"message": "Invalid credentials"}), 401
 
 
@@ -108,6 +144,7 @@ def logout():
 # Delete user route
 @auth_bp.route("/delete_user", methods=["DELETE"])
 @jwt_required()
+@json_body(MAX_AUTH_BODY_SIZE)
 def delete_user():
     try:
         # Get the email from the JWT token
@@ -121,16 +158,78 @@ def delete_user():
         if token_email != email:
             return jsonify({"message": "Unauthorized action"}), 403
 
-        # Execute the delete query
-        delete_query = SQL("DELETE FROM {st} WHERE {email} = %s;").format(st=Users.string(), email=Users.EMAIL.string())
+        # The user is only marked here, and is unusable from now on. Their
+        # projects and row are purged by a background worker, in small
+        # batches, once the mark is committed.
+        with UnitOfWork():
+            requested = AccountDeletions.request(email)
+        if not requested:
+            return jsonify({"message": "User not found"}), 404
 
-        with MinervaCursor() as cur:
-            cur.execute(delete_query, (email,))
-            if cur.rowcount == 0:
-                return jsonify({"message": "User not found"}), 404
+        try:
+            account_deletion_queue.submit(email)
+        except JobQueueFullException:
+            # The mark is committed, so a worker's sweep picks the purge up
+            return jsonify({"message": "User deletion scheduled"}), 202
 
         return jsonify({"message": "User deleted successfully"}), 200
 
+    except TIMEOUT_EXCEPTIONS as e:
+        return timeout_response(e)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+# Account deletion progress, for admins
+@auth_bp.route("/deletions", methods=["GET"])
+@jwt_required()
+def get_deletions():
+    """
+    Lists the most recent account deletions and how far each purge has got.
+    Accepts an optional status query parameter, e.g. ?status=running.
+    :return: JSON response with the deletions, newest first.
+    """
+    email = get_jwt_identity()  # Get the user's email from the JWT
+
+    try:
+        if user_cache.require(email).get(Users.ROLE.raw) != Users.ADMIN_ROLE:
+            return jsonify({"error": "Only admins may view account deletions"}), 403
+
+        deletions = AccountDeletions.select_all(request.args.get(AccountDeletions.STATUS.raw))
+        return jsonify({"deletions": to_camel_case(deletions)}), 200
+    except TIMEOUT_EXCEPTIONS as e:
+        return timeout_response(e)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+# Plan changes, for admins
+@auth_bp.route("/plan", methods=["PUT"])
+@jwt_required()
+@json_body(MAX_AUTH_BODY_SIZE)
+def update_plan():
+    """
+    Moves a user to a new plan. Expects a JSON body with email and plan.
+    :return: JSON response with a message.
+    """
+    email = get_jwt_identity()  # Get the admin's email from the JWT
+
+    data = request.get_json()
+    user_email = data.get(Users.EMAIL.raw)
+    plan = data.get(Users.PLAN.raw)
+    if not user_email or not plan:
+        return jsonify({"error": "Missing required fields"}), 400
+
+    try:
+        if user_cache.require(email).get(Users.ROLE.raw) != Users.ADMIN_ROLE:
+            return jsonify({"error": "Only admins may change plans"}), 403
+
+        Users.update_plan(user_email, plan)
+        return jsonify({"message": "Plan updated successfully"}), 200
+    except EmailDoesNotExistException:
+        return jsonify({"message": "User not found"}), 404
+    except TIMEOUT_EXCEPTIONS as e:
+        return timeout_response(e)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -139,6 +238,9 @@ def delete_user():
 @jwt_required(refresh=True)
 def refresh():
     current_user = get_jwt_identity()
+    # Accounts deleted since the token was issued cannot refresh it
+    if user_cache.get(current_user) is None:
+        return jsonify({"message": "User not found"}), 404
     new_token = create_access_token(identity=current_user)
     return jsonify({"access_token": new_token}), 200
 
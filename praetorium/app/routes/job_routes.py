@@ -0,0 +1,68 @@
+from flask import request, jsonify, Blueprint
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from app.ai.decomposition import decomposition_queue
+from app.db_table_specs.minerva_jobs_specs import DecompositionJobs, DecompositionJobException
+from app.db_table_specs.minerva_projects_specs import SavedProjects
+from app.jobs import JobQueueFullException
+from app.postgresql_utils import to_camel_case, UnitOfWork
+from app.request_body import json_body
+from app.deadlines import timeout_response, TIMEOUT_EXCEPTIONS
+from app.config import MAX_COMMAND_BODY_SIZE, JOBS_REQUEST_TIMEOUT_SECONDS
+
+jobs_bp = Blueprint("jobs", __name__)
+jobs_bp.request_timeout = JOBS_REQUEST_TIMEOUT_SECONDS
+
+
+# Submit an AI decomposition of a project
+@jobs_bp.route("/decompose", methods=["POST"])
+@jwt_required()
+@json_body(MAX_COMMAND_BODY_SIZE)
+def submit_decomposition():
+    """
+    Queues a background AI decomposition of one of the authenticated user's
+    projects. The result is written back into the project's tasks.
+    :return: JSON response with the job id to poll.
+    """
+    data = request.get_json()
+
+    email = get_jwt_identity()  # Get the user's email from the JWT
+    project_id = data.get(SavedProjects.PROJECT_ID.raw)
+
+    if not isinstance(project_id, int):
+        return jsonify({"error": "project_id must be an integer"}), 400
+
+    try:
+        # Committed before it is queued, so a worker can claim it
+        with UnitOfWork():
+            job_id = DecompositionJobs.insert_record(email, project_id)
+        decomposition_queue.submit(job_id)
+        return jsonify({"jobId": job_id, "status": DecompositionJobs.QUEUED}), 202
+    except JobQueueFullException as e:
+        # The job stays queued in Minerva and is resumed by the next sweep
+        return jsonify({"error": str(e)}), 503
+    except TIMEOUT_EXCEPTIONS as e:
+        return timeout_response(e)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+# Get the status and result of a job
+@jobs_bp.route("/<int:job_id>", methods=["GET"])
+@jwt_required()
+def get_job(job_id):
+    """
+    Retrieves one of the authenticated user's decomposition jobs.
+    :param job_id: The ID of the job to retrieve.
+    :return: JSON response with the job's status, attempts and result.
+    """
+    email = get_jwt_identity()  # Get the user's email from the JWT
+
+    try:
+        job = DecompositionJobs.select_one(job_id, email)
+        return jsonify({"job": to_camel_case(job)}), 200
+    except DecompositionJobException as e:
+        return jsonify({"error": str(e)}), 404
+    except TIMEOUT_EXCEPTIONS as e:
+        return timeout_response(e)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
@@ -1,10 +1,116 @@
-from flask import request, jsonify, Blueprint
+from flask import request, jsonify, Blueprint, Response, stream_with_context
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from app.db_table_specs.minerva_projects_specs import SavedProjects
+from app.db_table_specs.minerva_projects_specs import (
+    SavedProjects,
+    ProjectStats,
+    ProjectHistory,
+    ProjectTemplates,
+    TaskSubtrees,
+    SavedProjectSelectException,
+    ProjectTemplateException,
+    ProjectTemplateNotFoundException,
+)
+from app.db_table_specs.minerva_auth_specs import Users
 from app.postgresql_utils import to_camel_case
+from app.project_storage import project_storage, project_writes, MinervaProjectStorage
+from app.user_cache import user_cache
+from app.request_body import json_body
+from app.rate_limit import rate_limit, no_concurrency_limit
+from app.deadlines import request_timeout, timeout_response, TIMEOUT_EXCEPTIONS
+from app.config import (
+    MAX_BATCH_PROJECT_IDS,
+    MAX_TEMPLATE_INSTANCES,
+    MAX_SEARCH_RESULTS,
+    SYNC_PAGE_SIZE,
+    SYNC_WATERMARK_LAG_SECONDS,
+    SSE_HEARTBEAT_SECONDS,
+    SSE_QUEUE_SIZE,
+    SSE_MAX_STREAMS_PER_WORKER,
+    MAX_PROJECT_BODY_SIZE,
+    MAX_COMMAND_BODY_SIZE,
+    TASK_TREE_MAX_NODES,
+    RATE_LIMIT_PROJECT_WRITES,
+    PROJECTS_REQUEST_TIMEOUT_SECONDS,
+)
+from app.project_events import project_change_listener
+from app.ai.expansion_cache import expansion_cache, get_expansion_provider
+from app.task_tree import find_task, ancestor_names
+from app.task_schema import task_tree_validator, InvalidTaskTreeException, TaskTreeTooLargeException
+from datetime import datetime
+from functools import wraps
+import base64
 import json
+import threading
 
 projects_bp = Blueprint("projects", __name__)
+projects_bp.request_timeout = PROJECTS_REQUEST_TIMEOUT_SECONDS
+
+# The streams this worker may hold open at once, each on a thread of its own
+stream_slots = threading.BoundedSemaphore(SSE_MAX_STREAMS_PER_WORKER)
+
+
+def flush_user_writes(email: str) -> None:
+    """
+    Flushes a user's pending edits so a following read sees them.
+    """
+    project_writes.flush_matching(lambda key: key[0] == email)
+
+
+def minerva_only(feature: str, subtrees: bool = True):
+    """
+    A route decorator refusing a view with a 501 unless projects are kept
+    in Minerva, for features built on Minerva tables the other backends do
+    not have, such as the change feed, stats, history and templates.
+    :param feature: what the view offers, for the error message
+    :param subtrees: False to also refuse the view when task trees are
+    stored as subtrees (see DedupProjectStorage), for features that read
+    the tasks column in SQL
+    """
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if not isinstance(project_storage, MinervaProjectStorage):
+                return jsonify({"error": f"{feature} need Minerva project storage"}), 501
+            if not subtrees and project_storage.shares_subtrees:
+                return jsonify({"error": f"{feature} do not cover task trees stored as subtrees"}), 501
+            return view(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def encode_sync_token(watermark) -> str:
+    """
+    Encodes an (updated_at, project_id) watermark as an opaque token.
+    """
+    updated_at, project_id = watermark
+    raw = json.dumps({"ts": updated_at.isoformat(), "id": project_id}).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_sync_token(token: str):
+    """
+    Decodes a token produced by encode_sync_token.
+    :raises ValueError: if the token is malformed
+    """
+    try:
+        raw = json.loads(base64.urlsafe_b64decode(token.encode("ascii")))
+        return datetime.fromisoformat(raw["ts"]), int(raw["id"])
+    except Exception as e:
+        raise ValueError(f"Invalid sync token: {e}")
+
+
+def stats_json(stats: dict) -> dict:
+    """
+    Camel cases a project stats row. The priority and due date maps are
+    keyed by data, not field names, so they are passed through as is.
+    """
+    maps = (ProjectStats.TASKS_BY_PRIORITY, ProjectStats.INCOMPLETE_DUE_DATES)
+    result = to_camel_case({key: value for key, value in stats.items() if key not in [field.raw for field in maps]})
+    result.update({field.camelcase(): stats[field.raw] for field in maps})
+    return result
 
 
 # Get all projects for the authenticated user
@@ -18,8 +124,11 @@ def get_projects():
     email = get_jwt_identity()  # Get the user's email from the JWT
 
     try:
-        projects = to_camel_case(SavedProjects.select_all(email=email))
+        flush_user_writes(email)
+        projects = to_camel_case(project_storage.select_all(email=email))
         return jsonify({"projects": projects}), 200
+    except TIMEOUT_EXCEPTIONS as e:
+        return timeout_response(e)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -34,17 +143,216 @@ def get_project(project_id):
     :return: JSON response containing the project details.
     """
     try:
-        project = SavedProjects.select_one(project_id=project_id)
+        project_writes.flush((get_jwt_identity(), project_id))
+        project = project_storage.select_one(project_id=project_id)
         if not project:
             return jsonify({"error": "Project not found"}), 404
         return jsonify({"project": project}), 200
+    except TIMEOUT_EXCEPTIONS as e:
+        return timeout_response(e)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
+# Get several projects in one round-trip
+@projects_bp.route("/get_many", methods=["GET"])
+@jwt_required()
+def get_many():
+    """
+    Retrieves several saved projects for the authenticated user with a single
+    query. Project IDs are passed as a comma separated list, e.g. ?ids=1,2,3.
+    :return: JSON response with the projects keyed by project_id. IDs that
+    were not found map to null.
+    """
+    email = get_jwt_identity()  # Get the user's email from the JWT
+
+    raw_ids = request.args.get("ids", "")
+    try:
+        # Deduplicate while keeping the requested order
+        project_ids = list(dict.fromkeys(int(part) for part in raw_ids.split(",") if part.strip()))
+    except ValueError:
+        return jsonify({"error": "ids must be a comma separated list of integers"}), 400
+
+    if not project_ids:
+        return jsonify({"error": "Missing ids"}), 400
+
+    if len(project_ids) > MAX_BATCH_PROJECT_IDS:
+        return jsonify({"error": f"At most {MAX_BATCH_PROJECT_IDS} ids may be requested at once"}), 400
+
+    try:
+        for project_id in project_ids:
+            project_writes.flush((email, project_id))
+        projects = project_storage.select_many(project_ids=project_ids, email=email)
+        projects = {str(project_id): to_camel_case(project) for project_id, project in projects.items()}
+        return jsonify({"projects": projects}), 200
+    except TIMEOUT_EXCEPTIONS as e:
+        return timeout_response(e)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+# Get the projects that changed since the last sync
+@projects_bp.route("/changes", methods=["GET"])
+@jwt_required()
+@minerva_only("Project changes")
+def get_changes():
+    """
+    Retrieves the authenticated user's projects that were created, updated or
+    deleted since the watermark in ?since=<token>. Without a token, returns
+    all active projects. Deleted projects are returned as tombstones.
+    :return: JSON response with the changed projects, the tombstones, the
+    token for the next call and whether more changes are waiting.
+    """
+    email = get_jwt_identity()  # Get the user's email from the JWT
+
+    since = request.args.get("since")
+    try:
+        watermark = decode_sync_token(since) if since else None
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        flush_user_writes(email)
+        rows, has_more, next_watermark = SavedProjects.select_changes(
+            email=email, since=watermark, limit=SYNC_PAGE_SIZE, lag_seconds=SYNC_WATERMARK_LAG_SECONDS
+        )
+        if project_storage.shares_subtrees:
+            # Fills in the trees of the changed projects, read from the primary like the changes
+            TaskSubtrees.assemble([row for row in rows if row[SavedProjects.STATUS.raw] != "deleted"], False)
+    except TIMEOUT_EXCEPTIONS as e:
+        return timeout_response(e)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+    projects = [row for row in rows if row[SavedProjects.STATUS.raw] != "deleted"]
+    deleted = [
+        {
+            SavedProjects.PROJECT_ID.camelcase(): row[SavedProjects.PROJECT_ID.raw],
+            SavedProjects.DELETED_AT.camelcase(): row[SavedProjects.DELETED_AT.raw],
+        }
+        for row in rows
+        if row[SavedProjects.STATUS.raw] == "deleted"
+    ]
+
+    return (
+        jsonify(
+            {
+                "projects": to_camel_case(projects),
+                "deleted": deleted,
+                "nextToken": encode_sync_token(next_watermark),
+                "hasMore": has_more,
+            }
+        ),
+        200,
+    )
+
+
+# Search tasks across all of the user's projects
+@projects_bp.route("/search", methods=["GET"])
+@jwt_required()
+@minerva_only("Task searches", subtrees=False)
+def search_tasks():
+    """
+    Searches task names and descriptions across the authenticated user's
+    projects. Accepts ?q=<text> and the optional filters ?completed=true|false
+    and ?priority=<priority>, plus ?limit=<n>.
+    :return: JSON response with the matching tasks, each with its project_id
+    and path, without the surrounding trees.
+    """
+    email = get_jwt_identity()  # Get the user's email from the JWT
+
+    query = request.args.get("q", "").strip() or None
+    priority = request.args.get("priority") or None
+
+    completed = request.args.get("completed")
+    if completed is not None:
+        if completed.lower() not in ("true", "false"):
+            return jsonify({"error": "completed must be true or false"}), 400
+        completed = completed.lower() == "true"
+
+    try:
+        limit = min(int(request.args.get("limit", MAX_SEARCH_RESULTS)), MAX_SEARCH_RESULTS)
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+
+    if limit < 1:
+        return jsonify({"error": "limit must be at least 1"}), 400
+
+    if query is None and completed is None and priority is None:
+        return jsonify({"error": "Missing q or a filter"}), 400
+
+    try:
+        flush_user_writes(email)
+        results = SavedProjects.search_tasks(
+            email=email, query=query, completed=completed, priority=priority, limit=limit
+        )
+        return jsonify({"results": to_camel_case(results)}), 200
+    except TIMEOUT_EXCEPTIONS as e:
+        return timeout_response(e)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+# Stream project changes as they happen
+@projects_bp.route("/stream", methods=["GET"])
+@no_concurrency_limit
+@request_timeout(None)
+@jwt_required()
+def stream_changes():
+    """
+    Streams the authenticated user's project changes as Server-Sent Events.
+    Pass ?project_id=<id> to follow a single project. Each event carries the
+    project_id and operation; clients fetch the new state with get_project or
+    get_many. A "resync" operation means events were dropped and the client
+    should call /projects/changes.
+    :return: A text/event-stream response that stays open.
+    """
+    email = get_jwt_identity()  # Get the user's email from the JWT
+
+    project_id = request.args.get("project_id")
+    if project_id is not None:
+        try:
+            project_id = int(project_id)
+        except ValueError:
+            return jsonify({"error": "project_id must be an integer"}), 400
+
+    if not stream_slots.acquire(blocking=False):
+        response = jsonify({"error": "Too many open streams, try again shortly"})
+        response.status_code = 503
+        response.headers["Retry-After"] = str(int(SSE_HEARTBEAT_SECONDS))
+        return response
+
+    subscription = project_change_listener.subscribe(email, project_id, SSE_QUEUE_SIZE)
+
+    def events():
+        try:
+            # Tell the browser how quickly to reconnect if the stream drops
+            yield "retry: 3000\n\n"
+            while True:
+                event = subscription.get(timeout=SSE_HEARTBEAT_SECONDS)
+                if event is None:
+                    # Comment lines keep proxies from closing an idle stream
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"event: {event['operation']}\ndata: {json.dumps(to_camel_case(event))}\n\n"
+        finally:
+            project_change_listener.unsubscribe(subscription)
+
+    response = Response(
+        stream_with_context(events()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+    # Frees the slot however the stream ends, even if it never started
+    response.call_on_close(stream_slots.release)
+    return response
+
+
 # Create a new project
 @projects_bp.route("/create_project", methods=["POST"])
+@rate_limit(RATE_LIMIT_PROJECT_WRITES)
 @jwt_required()
+@json_body(MAX_PROJECT_BODY_SIZE, max_objects=TASK_TREE_MAX_NODES + 1)
 def insert_project():
     """
     Inserts a new project into the saved_projects table for the authenticated user.
@@ -57,23 +365,32 @@ def insert_project():
     project_description = data.get(SavedProjects.PROJECT_DESCRIPTION.raw)
     tasks = data.get(SavedProjects.TASKS.raw)
 
-    # Ensure tasks is a valid JSON string
+    # Validate the tree and store it in canonical form
     if tasks is not None:
-        tasks = json.dumps(tasks)
+        try:
+            tasks = task_tree_validator.dumps(tasks)
+        except InvalidTaskTreeException as e:
+            return jsonify({"error": str(e)}), 400
+        except TaskTreeTooLargeException as e:
+            return jsonify({"error": str(e)}), 413
 
     if not project_name or not project_description:
         return jsonify({"error": "Missing required fields"}), 400
 
     try:
-        next_project_id = SavedProjects.insert_record(email, project_name, project_description, tasks)
+        next_project_id = project_storage.insert(email, project_name, project_description, tasks)
         return jsonify({"message": "Project created successfully", "projectId": next_project_id}), 201
+    except TIMEOUT_EXCEPTIONS as e:
+        return timeout_response(e)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
 # Update an existing project
 @projects_bp.route("/update_project", methods=["PUT"])
+@rate_limit(RATE_LIMIT_PROJECT_WRITES)
 @jwt_required()
+@json_body(MAX_PROJECT_BODY_SIZE, max_objects=TASK_TREE_MAX_NODES + 1)
 def update_project():
     """
     Updates an existing project in the saved_projects table for the authenticated user.
@@ -81,25 +398,437 @@ def update_project():
     """
     data = request.get_json()
 
+    email = get_jwt_identity()  # Get the user's email from the JWT
     project_id = data.get(SavedProjects.PROJECT_ID.raw)
-    project_name = data.get(SavedProjects.PROJECT_NAME.raw)
-    project_description = data.get(SavedProjects.PROJECT_DESCRIPTION.raw)
+    # Empty names and descriptions are left unchanged
+    project_name = data.get(SavedProjects.PROJECT_NAME.raw) or None
+    project_description = data.get(SavedProjects.PROJECT_DESCRIPTION.raw) or None
     tasks = data.get(SavedProjects.TASKS.raw)
 
-    # Ensure tasks is a valid JSON string
+    # Validate the tree and store it in canonical form
     if tasks is not None:
-        tasks = json.dumps(tasks)
+        try:
+            tasks = task_tree_validator.dumps(tasks)
+        except InvalidTaskTreeException as e:
+            return jsonify({"error": str(e)}), 400
+        except TaskTreeTooLargeException as e:
+            return jsonify({"error": str(e)}), 413
 
     if not project_id:
         return jsonify({"error": "Missing project_id"}), 400
 
+    if not isinstance(project_id, int):
+        return jsonify({"error": f"Project ID {project_id} is not an integer!"}), 400
+
+    if not (project_name or project_description or tasks):
+        return jsonify({"error": "No fields to update were provided."}), 400
+
     try:
-        SavedProjects.update_record(project_id, project_name, project_description, tasks)
+        project_writes.submit(
+            (email, project_id), project_name=project_name, project_description=project_description, tasks=tasks
+        )
+        if project_writes.enabled:
+            # The edit is merged with its neighbours and written shortly
+            return jsonify({"message": "Project update accepted"}), 202
         return jsonify({"message": "Project updated successfully"}), 200
+    except TIMEOUT_EXCEPTIONS as e:
+        return timeout_response(e)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
+# Expand a task into subtasks with the AI, streaming them as they arrive
+@projects_bp.route("/expand_task", methods=["POST"])
+@request_timeout(None)
+@jwt_required()
+@json_body(MAX_COMMAND_BODY_SIZE)
+def expand_task():
+    """
+    Asks the AI provider to break one task into subtasks. Each subtask is
+    appended to the stored tree as soon as it is generated and streamed to
+    the client, as NDJSON by default or as Server-Sent Events when the client
+    accepts text/event-stream or passes ?format=sse.
+
+    The request body holds project_id and path, the child indexes leading to
+    the task, e.g. [0, 2]. Each streamed message holds the new task and its
+    path; the final message holds "done" and the number of subtasks added.
+    """
+    data = request.get_json()
+
+    email = get_jwt_identity()  # Get the user's email from the JWT
+    project_id = data.get(SavedProjects.PROJECT_ID.raw)
+    path = data.get("path")
+
+    if not isinstance(project_id, int):
+        return jsonify({"error": "project_id must be an integer"}), 400
+
+    if not isinstance(path, list) or not path or not all(isinstance(index, int) for index in path):
+        return jsonify({"error": "path must be a non-empty list of integers"}), 400
+
+    try:
+        project_writes.flush((email, project_id))
+        project = project_storage.select_many([project_id], email, read_only=False)[project_id]
+        if project is None:
+            return jsonify({"error": "Project not found"}), 404
+
+        tasks = SavedProjects.load_tasks(project)
+        task = find_task(tasks, path)
+        if task is None:
+            return jsonify({"error": f"Task {path} not found"}), 404
+
+        # Trees written by insert_record are stored as a JSON string; store
+        # them as a JSON array so subtasks can be appended in place
+        if isinstance(project[SavedProjects.TASKS.raw], str):
+            project_storage.update(project_id, tasks=json.dumps(tasks), email=email)
+
+        provider = get_expansion_provider()
+    except TIMEOUT_EXCEPTIONS as e:
+        return timeout_response(e)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+    sse = request.args.get("format") == "sse" or request.accept_mimetypes.best == "text/event-stream"
+
+    def encode(message: dict) -> str:
+        if sse:
+            return f"data: {json.dumps(message)}\n\n"
+        return json.dumps(message) + "\n"
+
+    def subtasks():
+        count = 0
+        try:
+            for node in provider.expand_task(task, ancestor_names(tasks, path)):
+                index = project_storage.append_subtask(project_id, email, path, node)
+                count += 1
+                yield encode({"path": path + [index], "task": node})
+            yield encode({"done": True, "count": count})
+        except Exception as e:
+            # Subtasks already streamed stay saved
+            yield encode({"error": str(e), "count": count})
+
+    return Response(
+        stream_with_context(subtasks()),
+        mimetype="text/event-stream" if sse else "application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# Report completion, overdue and priority stats for every project
+@projects_bp.route("/stats", methods=["GET"])
+@jwt_required()
+@minerva_only("Project stats", subtrees=False)
+def get_stats():
+    """
+    Retrieves the stats rollup of each of the authenticated user's projects,
+    plus totals across them. Reads the precomputed rollup, never the trees.
+    :return: JSON response with per-project stats and the user's totals.
+    """
+    email = get_jwt_identity()  # Get the user's email from the JWT
+
+    try:
+        flush_user_writes(email)
+        projects = ProjectStats.select_all(email)
+    except TIMEOUT_EXCEPTIONS as e:
+        return timeout_response(e)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+    total_tasks = sum(stats[ProjectStats.TOTAL_TASKS.raw] for stats in projects)
+    completed_tasks = sum(stats[ProjectStats.COMPLETED_TASKS.raw] for stats in projects)
+    tasks_by_priority = {}
+    for stats in projects:
+        for priority, count in stats[ProjectStats.TASKS_BY_PRIORITY.raw].items():
+            tasks_by_priority[priority] = tasks_by_priority.get(priority, 0) + count
+
+    totals = {
+        "projects": len(projects),
+        "totalTasks": total_tasks,
+        "completedTasks": completed_tasks,
+        "completionPercentage": round(100 * completed_tasks / total_tasks, 1) if total_tasks else None,
+        "overdueTasks": sum(stats["overdue_tasks"] for stats in projects),
+        "maxDepth": max((stats[ProjectStats.MAX_DEPTH.raw] for stats in projects), default=0),
+        "tasksByPriority": tasks_by_priority,
+    }
+    return jsonify({"projects": [stats_json(stats) for stats in projects], "totals": totals}), 200
+
+
+# Report the stats of a single project
+@projects_bp.route("/stats/<int:project_id>", methods=["GET"])
+@jwt_required()
+@minerva_only("Project stats", subtrees=False)
+def get_project_stats(project_id):
+    """
+    Retrieves the stats rollup of one of the authenticated user's projects.
+    :param project_id: The ID of the project.
+    :return: JSON response with the project's stats.
+    """
+    email = get_jwt_identity()  # Get the user's email from the JWT
+
+    try:
+        project_writes.flush((email, project_id))
+        stats = ProjectStats.select_one(project_id, email)
+        return jsonify({"stats": stats_json(stats)}), 200
+    except SavedProjectSelectException:
+        return jsonify({"error": "Project not found"}), 404
+    except TIMEOUT_EXCEPTIONS as e:
+        return timeout_response(e)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+# Save a task tree as a template
+@projects_bp.route("/templates", methods=["POST"])
+@rate_limit(RATE_LIMIT_PROJECT_WRITES)
+@jwt_required()
+@json_body(MAX_PROJECT_BODY_SIZE, max_objects=TASK_TREE_MAX_NODES + 1)
+@minerva_only("Templates")
+def insert_template():
+    """
+    Saves a template for the authenticated user. Admins may pass
+    "shared": true to offer it to every user.
+    :return: JSON response with the new templateId or an error.
+    """
+    data = request.get_json()
+
+    email = get_jwt_identity()  # Get the user's email from the JWT
+    template_name = data.get(ProjectTemplates.TEMPLATE_NAME.raw)
+    template_description = data.get(ProjectTemplates.TEMPLATE_DESCRIPTION.raw, "")
+
+    if not template_name:
+        return jsonify({"error": "Missing required fields"}), 400
+
+    try:
+        tasks = task_tree_validator.dumps(data.get(ProjectTemplates.TASKS.raw) or [])
+    except InvalidTaskTreeException as e:
+        return jsonify({"error": str(e)}), 400
+    except TaskTreeTooLargeException as e:
+        return jsonify({"error": str(e)}), 413
+
+    try:
+        owner = email
+        if data.get("shared"):
+            if user_cache.require(email).get(Users.ROLE.raw) != Users.ADMIN_ROLE:
+                return jsonify({"error": "Only admins may share templates"}), 403
+            owner = None
+
+        template_id = ProjectTemplates.insert_record(
+            owner, template_name, template_description, tasks, share_subtrees=project_storage.shares_subtrees
+        )
+        return jsonify({"message": "Template created successfully", "templateId": template_id}), 201
+    except ProjectTemplateException as e:
+        return jsonify({"error": str(e)}), 400
+    except TIMEOUT_EXCEPTIONS as e:
+        return timeout_response(e)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+# List the templates the user may start projects from
+@projects_bp.route("/templates", methods=["GET"])
+@jwt_required()
+@minerva_only("Templates")
+def get_templates():
+    """
+    Lists the authenticated user's templates and the shared ones, without
+    their trees.
+    :return: JSON response containing the list of templates.
+    """
+    email = get_jwt_identity()  # Get the user's email from the JWT
+
+    try:
+        return jsonify({"templates": to_camel_case(ProjectTemplates.select_all(email))}), 200
+    except TIMEOUT_EXCEPTIONS as e:
+        return timeout_response(e)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+# Delete one of the user's templates
+@projects_bp.route("/templates/<int:template_id>", methods=["DELETE"])
+@jwt_required()
+@minerva_only("Templates")
+def delete_template(template_id):
+    """
+    Deletes one of the authenticated user's templates.
+    :param template_id: The ID of the template.
+    :return: JSON response with a success or error message.
+    """
+    email = get_jwt_identity()  # Get the user's email from the JWT
+
+    try:
+        ProjectTemplates.delete_record(template_id, email)
+        return jsonify({"message": "Template deleted successfully"}), 200
+    except ProjectTemplateNotFoundException:
+        return jsonify({"error": "Template not found"}), 404
+    except TIMEOUT_EXCEPTIONS as e:
+        return timeout_response(e)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+# Start one or many projects from a template
+@projects_bp.route("/instantiate_template", methods=["POST"])
+@rate_limit(RATE_LIMIT_PROJECT_WRITES)
+@jwt_required()
+@json_body(MAX_COMMAND_BODY_SIZE)
+@minerva_only("Templates")
+def instantiate_template():
+    """
+    Creates projects from a template for the authenticated user. The tree is
+    copied inside Minerva, so creating hundreds of projects at once costs a
+    single request and a handful of statements.
+
+    The request body holds template_id and optionally count (default 1),
+    project_name and project_description, which default to the template's.
+    :return: JSON response with the new projectIds.
+    """
+    data = request.get_json()
+
+    email = get_jwt_identity()  # Get the user's email from the JWT
+    template_id = data.get(ProjectTemplates.TEMPLATE_ID.raw)
+    count = data.get("count", 1)
+
+    if not isinstance(template_id, int):
+        return jsonify({"error": "template_id must be an integer"}), 400
+
+    if not isinstance(count, int) or not 1 <= count <= MAX_TEMPLATE_INSTANCES:
+        return jsonify({"error": f"count must be an integer from 1 to {MAX_TEMPLATE_INSTANCES}"}), 400
+
+    try:
+        project_ids = ProjectTemplates.instantiate(
+            template_id,
+            email,
+            count,
+            project_name=data.get(SavedProjects.PROJECT_NAME.raw),
+            project_description=data.get(SavedProjects.PROJECT_DESCRIPTION.raw),
+            share_subtrees=project_storage.shares_subtrees,
+        )
+        return jsonify({"message": "Projects created successfully", "projectIds": project_ids}), 201
+    except ProjectTemplateNotFoundException:
+        return jsonify({"error": "Template not found"}), 404
+    except ProjectTemplateException as e:
+        return jsonify({"error": str(e)}), 400
+    except TIMEOUT_EXCEPTIONS as e:
+        return timeout_response(e)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+# List the versions kept in a project's history
+@projects_bp.route("/history/<int:project_id>", methods=["GET"])
+@jwt_required()
+@minerva_only("Project histories")
+def get_history(project_id):
+    """
+    Lists the versions of one of the authenticated user's projects, oldest
+    first. Each is numbered and says which operation made it.
+    :param project_id: The ID of the project.
+    :return: JSON response with the versions.
+    """
+    email = get_jwt_identity()  # Get the user's email from the JWT
+
+    try:
+        project_writes.flush((email, project_id))
+        versions = ProjectHistory.select_versions(project_id, email)
+        if not versions:
+            return jsonify({"error": "Project not found"}), 404
+        return jsonify({"versions": to_camel_case(versions)}), 200
+    except TIMEOUT_EXCEPTIONS as e:
+        return timeout_response(e)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+# Rebuild one version of a project
+@projects_bp.route("/history/<int:project_id>/<int:version>", methods=["GET"])
+@jwt_required()
+@minerva_only("Project histories")
+def get_version(project_id, version):
+    """
+    Retrieves a project as it was at one version: its name, description and
+    tasks.
+    :param project_id: The ID of the project.
+    :param version: The version number, from /history/<project_id>.
+    :return: JSON response with the version.
+    """
+    email = get_jwt_identity()  # Get the user's email from the JWT
+
+    try:
+        project_writes.flush((email, project_id))
+        return jsonify({"version": ProjectHistory.select_version(project_id, email, version)}), 200
+    except SavedProjectSelectException:
+        return jsonify({"error": "Version not found"}), 404
+    except TIMEOUT_EXCEPTIONS as e:
+        return timeout_response(e)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+# Roll a project back to an earlier version
+@projects_bp.route("/restore_version", methods=["POST"])
+@rate_limit(RATE_LIMIT_PROJECT_WRITES)
+@jwt_required()
+@json_body(MAX_COMMAND_BODY_SIZE)
+@minerva_only("Project histories")
+def restore_version():
+    """
+    Restores one of the authenticated user's projects to an earlier
+    version. The restore is itself recorded as a new version, so it can be
+    undone in turn.
+    :return: JSON response with a success message or error.
+    """
+    data = request.get_json()
+
+    email = get_jwt_identity()  # Get the user's email from the JWT
+    project_id = data.get(SavedProjects.PROJECT_ID.raw)
+    version = data.get(ProjectHistory.VERSION.raw)
+
+    if not isinstance(project_id, int) or not isinstance(version, int):
+        return jsonify({"error": "project_id and version must be integers"}), 400
+
+    try:
+        project_writes.flush((email, project_id))
+        state = ProjectHistory.select_version(project_id, email, version)["project"]
+        project_storage.update(
+            project_id,
+            project_name=state[SavedProjects.PROJECT_NAME.raw],
+            project_description=state[SavedProjects.PROJECT_DESCRIPTION.raw],
+            tasks=json.dumps(state[SavedProjects.TASKS.raw]),
+            email=email,
+        )
+        return jsonify({"message": "Project restored successfully"}), 200
+    except SavedProjectSelectException:
+        return jsonify({"error": "Version not found"}), 404
+    except TIMEOUT_EXCEPTIONS as e:
+        return timeout_response(e)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+# Report how often AI expansions were served from the cache
+@projects_bp.route("/ai_cache_stats", methods=["GET"])
+@jwt_required()
+def ai_cache_stats():
+    """
+    Reports this process's AI expansion cache counters.
+    :return: JSON response with exact, similar and persistent hits, misses,
+    evictions and the overall hit rate.
+    """
+    return jsonify(expansion_cache.report()), 200
+
+
+# Report how many writes coalescing saved
+@projects_bp.route("/write_stats", methods=["GET"])
+@jwt_required()
+def write_stats():
+    """
+    Reports this process's write-coalescing counters.
+    :return: JSON response with the submitted, flushed, saved, failed and
+    pending counts.
+    """
+    return jsonify(project_writes.report()), 200
+
+
 @projects_bp.route("/delete_project", methods=["DELETE"])
 @jwt_required()
 def delete_project():
@@ -114,9 +843,11 @@ def delete_project():
         return jsonify({"error": "Both project_id and email are required."}), 400
 
     try:
-        SavedProjects.delete_record(project_id, email)
+        project_storage.delete(project_id, email)
         return jsonify({"message": "Project deleted successfully"}), 200
     except ValueError as e:
         return jsonify({"error": str(e)}), 404
+    except TIMEOUT_EXCEPTIONS as e:
+        return timeout_response(e)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
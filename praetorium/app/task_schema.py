@@ -0,0 +1,206 @@
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from app.config import (
+    TASK_TREE_MAX_DEPTH,
+    TASK_TREE_MAX_NODES,
+    TASK_TREE_MAX_BYTES,
+    TASK_NAME_MAX_LENGTH,
+    TASK_DESCRIPTION_MAX_LENGTH,
+)
+from app.task_tree import CHILDREN
+import json
+
+#############################################
+# Validation and normalization of task trees
+#############################################
+
+# Marks an optional field that is absent from a node
+MISSING = object()
+
+
+def text(max_length: int, keep_null: bool = False) -> Callable[[Any], Optional[str]]:
+    """
+    A checker for a string field, stripped of surrounding whitespace.
+    :param keep_null: True to keep the field as null when it is absent or
+    null, rather than dropping it from the node
+    """
+
+    def check(value):
+        if value is MISSING or value is None:
+            return None
+        if not isinstance(value, str):
+            raise ValueError("must be a string")
+        value = value.strip()
+        if len(value) > max_length:
+            raise ValueError(f"must be at most {max_length} characters")
+        return value
+
+    check.keep_null = keep_null
+    return check
+
+
+def flag(value) -> bool:
+    """
+    A checker for a boolean field, false when absent.
+    """
+    if value is MISSING or value is None:
+        return False
+    if not isinstance(value, bool):
+        raise ValueError("must be true or false")
+    return value
+
+
+def iso_date(value) -> Optional[str]:
+    """
+    A checker for an ISO 8601 date or datetime. Blank dates become null.
+    """
+    if value is MISSING or value is None or value == "":
+        return None
+    if not isinstance(value, str):
+        raise ValueError("must be an ISO 8601 date")
+    value = value.strip()
+    try:
+        datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError("must be an ISO 8601 date")
+    return value
+
+
+def task_id(value) -> Optional[int]:
+    """
+    A checker for the optional client-side task id.
+    """
+    if value is MISSING or value is None:
+        return None
+    if not isinstance(value, int) or isinstance(value, bool):
+        raise ValueError("must be an integer")
+    return value
+
+
+# The canonical task node: each field with the keys it may arrive under and
+# its checker. Clients use both spellings of description and priority, so a
+# node keeps the key it arrived with. Keys not listed here are dropped.
+# Aquila adds a task with a null name and saves the tree before it is named,
+# so names may be null or empty.
+TASK_SCHEMA: Dict[str, Tuple[Tuple[str, ...], Callable[[Any], Any]]] = {
+    "task_id": (("task_id",), task_id),
+    "name": (("name",), text(TASK_NAME_MAX_LENGTH, keep_null=True)),
+    "description": (("description", "task_description"), text(TASK_DESCRIPTION_MAX_LENGTH)),
+    "completed": (("completed",), flag),
+    "priority": (("priority", "task_priority"), text(TASK_NAME_MAX_LENGTH)),
+    "task_start_date": (("task_start_date",), iso_date),
+    "task_due_date": (("task_due_date",), iso_date),
+}
+
+
+class TaskTreeValidator:
+    """
+    Validates a task tree against a schema and rewrites it in canonical
+    form. The schema is compiled once into a flat list of field checkers, and
+    trees are walked with an explicit stack, so deep trees cannot exhaust
+    the recursion limit and oversized ones are abandoned as soon as a limit
+    is crossed.
+    """
+
+    def __init__(
+        self,
+        schema: Dict[str, Tuple[Tuple[str, ...], Callable[[Any], Any]]] = TASK_SCHEMA,
+        max_depth: int = TASK_TREE_MAX_DEPTH,
+        max_nodes: int = TASK_TREE_MAX_NODES,
+        max_bytes: int = TASK_TREE_MAX_BYTES,
+    ):
+        self.max_depth = max_depth
+        self.max_nodes = max_nodes
+        self.max_bytes = max_bytes
+        self.fields = [(name, aliases, check) for name, (aliases, check) in schema.items()]
+
+    def normalize(self, tasks: Any) -> List[dict]:
+        """
+        Validates a tree and returns its canonical form. The input is not
+        modified.
+        :raises InvalidTaskTreeException: naming the first offending node
+        :raises TaskTreeTooLargeException: if a limit is exceeded
+        """
+        if tasks is None:
+            return []
+        if not isinstance(tasks, list):
+            raise InvalidTaskTreeException("tasks must be a list")
+
+        root = []
+        nodes = 0
+        # Each entry is (raw children, canonical list to fill, depth, path)
+        stack = [(tasks, root, 1, "tasks")]
+        while stack:
+            children, canonical, depth, path = stack.pop()
+            if depth > self.max_depth:
+                raise TaskTreeTooLargeException(f"tasks may be nested at most {self.max_depth} levels deep")
+
+            nodes += len(children)
+            if nodes > self.max_nodes:
+                raise TaskTreeTooLargeException(f"tasks may hold at most {self.max_nodes} tasks")
+
+            for index, node in enumerate(children):
+                node_path = f"{path}[{index}]"
+                if not isinstance(node, dict):
+                    raise InvalidTaskTreeException(f"{node_path} must be an object")
+
+                normalized = self._node(node, node_path)
+                canonical.append(normalized)
+
+                grandchildren = node.get(CHILDREN)
+                if grandchildren is None:
+                    continue
+                if not isinstance(grandchildren, list):
+                    raise InvalidTaskTreeException(f"{node_path}.{CHILDREN} must be a list")
+                if grandchildren:
+                    stack.append((grandchildren, normalized[CHILDREN], depth + 1, f"{node_path}.{CHILDREN}"))
+
+        return root
+
+    def dumps(self, tasks: Any) -> str:
+        """
+        Normalizes a tree and serializes it compactly, enforcing the byte
+        limit on the stored form.
+        :raises TaskTreeTooLargeException: if the stored form is too large
+        """
+        encoded = json.dumps(self.normalize(tasks), separators=(",", ":"), ensure_ascii=False)
+        if len(encoded.encode("utf-8")) > self.max_bytes:
+            raise TaskTreeTooLargeException(f"tasks may be at most {self.max_bytes} bytes")
+        return encoded
+
+    def _node(self, node: dict, path: str) -> dict:
+        normalized = {}
+        for name, aliases, check in self.fields:
+            key, value = name, MISSING
+            for alias in aliases:
+                if node.get(alias) is not None:
+                    key, value = alias, node[alias]
+                    break
+            try:
+                value = check(value)
+            except ValueError as e:
+                raise InvalidTaskTreeException(f"{path}.{key} {e}")
+            if value is not None or getattr(check, "keep_null", False):
+                normalized[key] = value
+        normalized[CHILDREN] = []
+        return normalized
+
+
+# The validator used by the project routes
+task_tree_validator = TaskTreeValidator()
+
+
+class InvalidTaskTreeException(Exception):
+    """
+    An exception for a task tree that does not match the task schema
+    """
+
+    pass
+
+
+class TaskTreeTooLargeException(Exception):
+    """
+    An exception for a task tree beyond the configured limits
+    """
+
+    pass
@@ -0,0 +1,46 @@
+from typing import List, Optional
+
+###################################################
+# Helpers for the nested task trees stored in tasks
+###################################################
+
+# The key holding a task's children
+CHILDREN = "tasks"
+
+
+def find_task(tasks: List[dict], path: List[int]) -> Optional[dict]:
+    """
+    Follows a path of child indexes down a task tree.
+    :param tasks: the top level list of task nodes
+    :param path: the index at each level, e.g. [0, 2] is the third child of
+    the first top level task
+    :return: the task node, or None if the path does not exist
+    """
+    node = None
+    children = tasks
+    for index in path:
+        if not isinstance(children, list) or not 0 <= index < len(children):
+            return None
+        node = children[index]
+        if not isinstance(node, dict):
+            return None
+        children = node.get(CHILDREN) or []
+    return node
+
+
+def ancestor_names(tasks: List[dict], path: List[int]) -> List[str]:
+    """
+    The names of the tasks above the node at path, outermost first.
+    """
+    return [find_task(tasks, path[:depth]).get("name") or "" for depth in range(1, len(path))]
+
+
+def children_json_path(path: List[int]) -> List[str]:
+    """
+    Converts a task path into the Postgres text[] path of that task's
+    children array, e.g. [0, 2] becomes {0,tasks,2,tasks}.
+    """
+    json_path = []
+    for index in path:
+        json_path += [str(index), CHILDREN]
+    return json_path
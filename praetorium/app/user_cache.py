@@ -0,0 +1,116 @@
+from collections import OrderedDict
+from typing import Optional, Tuple
+from app.config import USER_CACHE_TTL_SECONDS, USER_CACHE_NEGATIVE_TTL_SECONDS, USER_CACHE_MAX_ENTRIES
+from app.db_table_specs.minerva_auth_specs import Users, EmailDoesNotExistException
+import copy
+import threading
+import time
+
+
+class UserCache:
+    """
+    A per-process LRU cache of user profiles keyed by email, so checking
+    that a user exists or reading their plan does not query auth.users on
+    every request. Unknown emails are cached too, for a shorter time, so a
+    flood of requests for a missing user does not reach Minerva either.
+
+    Entries are invalidated whenever Users announces a change.
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: float = USER_CACHE_TTL_SECONDS,
+        negative_ttl_seconds: float = USER_CACHE_NEGATIVE_TTL_SECONDS,
+        max_entries: int = USER_CACHE_MAX_ENTRIES,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self.max_entries = max_entries
+        # email -> (profile or None, expires_at)
+        self.entries: "OrderedDict[str, Tuple[Optional[dict], float]]" = OrderedDict()
+        # Counts invalidations, so a load that raced one is not cached
+        self.generation = 0
+        # email -> generation of its last invalidation, bounded like entries
+        self.invalidated: "OrderedDict[str, int]" = OrderedDict()
+        # The latest generation dropped from invalidated. A load older than
+        # it cannot tell whether its email was invalidated, so is not cached
+        self.forgotten_generation = 0
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "negative_hits": 0, "misses": 0, "invalidations": 0}
+
+    def get(self, email: str) -> Optional[dict]:
+        """
+        A user's profile, from the cache or Minerva.
+        :return: a copy of the profile, or None if the email is not registered
+        """
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(email)
+            if entry is not None and entry[1] > now:
+                self.entries.move_to_end(email)
+                self.stats["hits" if entry[0] is not None else "negative_hits"] += 1
+                return copy.copy(entry[0])
+            self.stats["misses"] += 1
+            generation = self.generation
+
+        profile = Users.select_profile(email)
+        self._store(email, profile, generation)
+        return copy.copy(profile)
+
+    def require(self, email: str) -> dict:
+        """
+        A user's profile.
+        :raises EmailDoesNotExistException: if the email is not registered
+        """
+        profile = self.get(email)
+        if profile is None:
+            raise EmailDoesNotExistException(f"{email} is not registered!")
+        return profile
+
+    def put(self, email: str, profile: Optional[dict]) -> None:
+        """
+        Caches a profile read elsewhere, e.g. during login. Fields outside
+        Users.PROFILE_FIELDS, such as the password hash, are dropped.
+        """
+        if profile is not None:
+            profile = {field.raw: profile.get(field.raw) for field in Users.PROFILE_FIELDS}
+        with self.lock:
+            generation = self.generation
+        self._store(email, profile, generation)
+
+    def invalidate(self, email: str) -> None:
+        """
+        Drops a user's cached profile.
+        """
+        with self.lock:
+            self.entries.pop(email, None)
+            self.generation += 1
+            self.invalidated[email] = self.generation
+            self.invalidated.move_to_end(email)
+            while len(self.invalidated) > self.max_entries:
+                self.forgotten_generation = self.invalidated.popitem(last=False)[1]
+            self.stats["invalidations"] += 1
+
+    def report(self) -> dict:
+        """
+        Hit and miss counters plus the overall hit rate.
+        """
+        with self.lock:
+            hits = self.stats["hits"] + self.stats["negative_hits"]
+            lookups = hits + self.stats["misses"]
+            return {**self.stats, "entries": len(self.entries), "hit_rate": hits / lookups if lookups else 0.0}
+
+    def _store(self, email: str, profile: Optional[dict], generation: int) -> None:
+        ttl = self.ttl_seconds if profile is not None else self.negative_ttl_seconds
+        with self.lock:
+            if self.invalidated.get(email, 0) > generation or self.forgotten_generation > generation:
+                return
+            self.entries[email] = (profile, time.monotonic() + ttl)
+            self.entries.move_to_end(email)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+
+# The per-process user cache
+user_cache = UserCache()
+Users.on_change(user_cache.invalidate)
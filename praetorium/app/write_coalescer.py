@@ -0,0 +1,224 @@
+from typing import Callable, Dict, Hashable, Optional
+import atexit
+import threading
+import time
+
+
+class PendingWrite:
+    """
+    The merged, not yet flushed edits for one project.
+    """
+
+    def __init__(self, deadline: float, attempts: int = 0):
+        self.deadline = deadline
+        self.fields = {}
+        self.writes = 0
+        # How many times writing these edits has failed
+        self.attempts = attempts
+
+    def merge(self, fields: dict) -> None:
+        """
+        Layers newer edits over older ones. None means "leave unchanged",
+        matching SavedProjects.update_record.
+        """
+        self.fields.update({name: value for name, value in fields.items() if value is not None})
+        self.writes += 1
+
+
+class KeyLock:
+    """
+    The lock serializing writes for one key, and how many threads hold or
+    wait for it, so it can be dropped once the key is idle.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.users = 0
+
+
+class WriteCoalescer:
+    """
+    Collapses bursts of updates to the same key into a single write.
+
+    The first edit to a key opens a window of window_seconds; every edit to
+    that key inside the window is merged into it, and one write is issued
+    when the window closes. Writes for a key are serialized by a per-key
+    lock, so an edit that arrives while its key is being flushed lands in a
+    new window that flushes after the current one. Reads call flush() first
+    to see their own writes.
+
+    A write that fails is put back, under any edits made since, and retried
+    after a backoff. Once it has failed max_attempts times its edits are
+    dropped and on_failure is called so the client can be told.
+    """
+
+    def __init__(
+        self,
+        write: Callable[[Hashable, dict], None],
+        window_seconds: float,
+        max_attempts: int = 3,
+        on_failure: Optional[Callable[[Hashable, Exception], None]] = None,
+    ):
+        """
+        :param write: called as write(key, fields) to persist merged edits
+        :param window_seconds: how long edits to one key are collected, and
+        the delay before the first retry of a failed write, doubled for each
+        retry after it
+        :param max_attempts: how many times a write is tried before its edits
+        are dropped
+        :param on_failure: called as on_failure(key, error) when edits are
+        dropped
+        """
+        self.write = write
+        self.window_seconds = window_seconds
+        self.max_attempts = max_attempts
+        self.on_failure = on_failure
+        self.pending: Dict[Hashable, PendingWrite] = {}
+        self.key_locks: Dict[Hashable, KeyLock] = {}
+        self.condition = threading.Condition()
+        self.thread = None
+        self.stats = {"submitted": 0, "flushed": 0, "saved": 0, "retried": 0, "failed": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.window_seconds > 0
+
+    def submit(self, key: Hashable, **fields) -> None:
+        """
+        Queues an edit for key. Flushes synchronously when coalescing is
+        disabled.
+        """
+        if not self.enabled:
+            with self.condition:
+                self.stats["submitted"] += 1
+            self._write(key, fields, 1)
+            return
+
+        with self.condition:
+            self.stats["submitted"] += 1
+            pending = self.pending.get(key)
+            if pending is None:
+                pending = self.pending[key] = PendingWrite(time.monotonic() + self.window_seconds)
+                self._ensure_started()
+                self.condition.notify()
+            pending.merge(fields)
+
+    def flush(self, key: Hashable) -> None:
+        """
+        Writes out the pending edits for key, if any, before returning.
+        :raises Exception: whatever the write raised, after its edits were
+        put back for a retry
+        """
+        with self.condition:
+            key_lock = self.key_locks.get(key)
+            if key_lock is None:
+                key_lock = self.key_locks[key] = KeyLock()
+            key_lock.users += 1
+
+        # Taking the key lock first waits out a flush already in progress, so
+        # writes for one key always land in the order they were merged
+        try:
+            with key_lock.lock:
+                with self.condition:
+                    pending = self.pending.pop(key, None)
+                if pending is not None:
+                    try:
+                        self._write(key, pending.fields, pending.writes)
+                    except Exception as e:
+                        self._retry(key, pending, e)
+                        raise
+        finally:
+            with self.condition:
+                key_lock.users -= 1
+                if key_lock.users == 0:
+                    del self.key_locks[key]
+
+    def flush_matching(self, predicate: Callable[[Hashable], bool]) -> None:
+        """
+        Flushes every pending key for which predicate(key) is true.
+        """
+        with self.condition:
+            keys = [key for key in self.pending if predicate(key)]
+        for key in keys:
+            self.flush(key)
+
+    def flush_all(self) -> None:
+        """
+        Flushes everything. Used on shutdown.
+        """
+        self.flush_matching(lambda key: True)
+
+    def report(self) -> dict:
+        """
+        Counters describing how much work coalescing saved. "flushed" is
+        the number of writes issued and "saved" the number of edits that
+        were merged into another write instead of issuing their own.
+        """
+        with self.condition:
+            return {**self.stats, "pending": len(self.pending), "window_ms": int(self.window_seconds * 1000)}
+
+    def _write(self, key: Hashable, fields: dict, writes: int) -> None:
+        self.write(key, fields)
+        with self.condition:
+            self.stats["flushed"] += 1
+            # Every other edit merged into this write was saved
+            self.stats["saved"] += writes - 1
+
+    def _retry(self, key: Hashable, failed: PendingWrite, error: Exception) -> None:
+        # Puts failed edits back under any made since, or drops them once
+        # they have used up their attempts
+        attempts = failed.attempts + 1
+        with self.condition:
+            if attempts >= self.max_attempts:
+                self.stats["failed"] += failed.writes
+            else:
+                self.stats["retried"] += 1
+                backoff = self.window_seconds * 2 ** (attempts - 1)
+                retry = PendingWrite(time.monotonic() + backoff, attempts)
+                retry.fields, retry.writes = dict(failed.fields), failed.writes
+                newer = self.pending.get(key)
+                if newer is not None:
+                    retry.fields.update(newer.fields)
+                    retry.writes += newer.writes
+                self.pending[key] = retry
+                self._ensure_started()
+                self.condition.notify()
+                return
+
+        if self.on_failure is not None:
+            self.on_failure(key, error)
+
+    def _ensure_started(self) -> None:
+        # Must be called with the condition held
+        if self.thread is None or not self.thread.is_alive():
+            self.thread = threading.Thread(target=self._run, name="write-coalescer", daemon=True)
+            self.thread.start()
+
+    def _run(self) -> None:
+        """
+        Flushes each key once its window closes.
+        """
+        while True:
+            with self.condition:
+                while not self.pending:
+                    self.condition.wait()
+                now = time.monotonic()
+                due = [key for key, pending in self.pending.items() if pending.deadline <= now]
+                if not due:
+                    self.condition.wait(min(pending.deadline for pending in self.pending.values()) - now)
+                    continue
+
+            for key in due:
+                try:
+                    self.flush(key)
+                except Exception as e:
+                    # Put back for a retry, or reported through on_failure
+                    print(f"Coalesced write for {key} failed: {e}")
+
+
+def flush_on_exit(coalescer: WriteCoalescer) -> WriteCoalescer:
+    """
+    Registers the coalescer to be flushed when the interpreter exits.
+    """
+    atexit.register(coalescer.flush_all)
+    return coalescer
@@ -0,0 +1,56 @@
+# Production server settings: gunicorn -c gunicorn.conf.py
+#
+# The app is loaded once in the master and forked into pre-forked workers,
+# each serving requests on a pool of threads. Workers drop any Minerva
+# connections inherited from the master, warm their own pools before taking
+# traffic, sweep for unfinished background jobs and drain on exit. A HUP
+# reload starts new workers and gives the old ones graceful_timeout to finish
+# their requests.
+from app.lifecycle import after_fork, check_server, default_workers, drain, start_sweeps, warmup
+import os
+
+wsgi_app = "run:app"
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:5000")
+
+# Each worker's threads share its Minerva pool, so MINERVA_POOL_MAX_CONNECTIONS
+# should be at least the thread count. Open /projects/stream connections each
+# hold a thread, up to SSE_MAX_STREAMS_PER_WORKER of them.
+#
+# Workers only share rate limits through a redis:// RATE_LIMIT_STORAGE_URL.
+# With the default memory:// store a single worker runs; set
+# RATE_LIMIT_STORAGE_URL (or RATE_LIMIT_ENABLED=false) to get two per core
+# plus one. A WEB_CONCURRENCY above 1 with memory:// refuses to start.
+workers = int(os.getenv("WEB_CONCURRENCY", default_workers()))
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", 4))
+
+# Import the app before forking so workers share its memory and start warm
+preload_app = True
+
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 30))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", 30))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", 5))
+
+# Recycle workers now and then, at staggered times so they never all
+# reconnect to Minerva at once
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", 10000))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", 1000))
+
+
+def on_starting(server):
+    # Runs in the master; an error here stops the server before it forks
+    check_server(server.cfg.workers, server.cfg.threads)
+
+
+def post_fork(server, worker):
+    after_fork(server.cfg.workers)
+
+
+def post_worker_init(worker):
+    # Runs before the worker accepts its first connection
+    warmup(worker.wsgi)
+    start_sweeps()
+
+
+def worker_exit(server, worker):
+    drain()
@@ -1,7 +1,10 @@
 from app import create_app
+from app.lifecycle import start_sweeps
 
 # Create the Flask app instance
 app = create_app()
 
+# The development server. Production runs gunicorn -c gunicorn.conf.py
 if __name__ == "__main__":
+    start_sweeps()
     app.run(host="localhost", port=5000, debug=True)
@@ -0,0 +1,125 @@
+from app.account_deletion import account_deletion_queue, run_account_deletion
+from app.db_table_specs.minerva_account_specs import AccountDeletions
+from app.jobs import JobQueue
+from app.lifecycle import sweep
+from app.postgresql_utils import MinervaCursor
+from app.user_cache import user_cache
+import app.account_deletion
+import app.routes.auth_routes
+import pytest
+import threading
+
+EMAIL = "testuser@example.com"
+OTHER_EMAIL = "someone@example.com"
+
+
+@pytest.fixture
+def cleanup(setup_user):
+    yield
+    with MinervaCursor() as cur:
+        cur.execute("DELETE FROM projects.saved_projects WHERE email = ANY(%s);", ([EMAIL, OTHER_EMAIL],))
+        cur.execute("DELETE FROM auth.users WHERE email = %s;", (OTHER_EMAIL,))
+        cur.execute("DELETE FROM auth.account_deletions WHERE email = ANY(%s);", ([EMAIL, OTHER_EMAIL],))
+
+
+def deletion(email):
+    with MinervaCursor() as cur:
+        cur.execute("SELECT * FROM auth.account_deletions WHERE email = %s;", (email,))
+        return cur.fetchone()
+
+
+# Test that a deleted account is unusable at once and purged in batches
+def test_purge_in_batches(cleanup, monkeypatch):
+    monkeypatch.setattr(app.account_deletion, "ACCOUNT_DELETION_BATCH_SIZE", 2)
+    monkeypatch.setattr(app.account_deletion, "ACCOUNT_DELETION_BATCH_PAUSE_MS", 0)
+    with MinervaCursor() as cur:
+        for index in range(5):
+            cur.execute(
+                "INSERT INTO projects.saved_projects (email, project_name, project_description) VALUES (%s, %s, '');",
+                (EMAIL, f"Deleted Project {index}"),
+            )
+
+    assert AccountDeletions.request(EMAIL)
+    assert not AccountDeletions.request(EMAIL), "An account is only deleted once"
+    assert user_cache.get(EMAIL) is None, "The account is treated as unregistered while it is purged"
+    assert deletion(EMAIL)[AccountDeletions.STATUS.raw] == AccountDeletions.PENDING
+
+    run_account_deletion(EMAIL, 1)
+
+    with MinervaCursor() as cur:
+        cur.execute("SELECT count(*) FROM projects.saved_projects WHERE email = %s;", (EMAIL,))
+        assert cur.fetchone()["count"] == 0
+        cur.execute("SELECT count(*) FROM auth.users WHERE email = %s;", (EMAIL,))
+        assert cur.fetchone()["count"] == 0
+
+    record = deletion(EMAIL)
+    assert record[AccountDeletions.STATUS.raw] == AccountDeletions.COMPLETED
+    assert record[AccountDeletions.PROJECTS_TOTAL.raw] == 5
+    assert record[AccountDeletions.PROJECTS_DELETED.raw] == 5
+    assert record[AccountDeletions.BATCHES.raw] == 3
+    assert record[AccountDeletions.FINISHED_AT.raw] is not None
+
+
+# Test that a purge never touches an account that is not pending deletion
+def test_purge_requires_pending_user(cleanup):
+    with MinervaCursor() as cur:
+        cur.execute(
+            "INSERT INTO projects.saved_projects (email, project_name, project_description) VALUES (%s, 'Kept', '');",
+            (EMAIL,),
+        )
+
+    assert AccountDeletions.purge_batch(EMAIL, 10) == 0
+    with MinervaCursor() as cur:
+        cur.execute("SELECT count(*) FROM projects.saved_projects WHERE email = %s;", (EMAIL,))
+        assert cur.fetchone()["count"] == 1
+
+
+# Test that only admins see the progress of account deletions
+def test_deletions_route(client, cleanup, auth_headers):
+    with MinervaCursor() as cur:
+        cur.execute("INSERT INTO auth.users (email, password_hash) VALUES (%s, 'x');", (OTHER_EMAIL,))
+    AccountDeletions.request(OTHER_EMAIL)
+
+    response = client.get("/auth/deletions", headers=auth_headers)
+    assert response.status_code == 403
+
+    with MinervaCursor() as cur:
+        cur.execute("UPDATE auth.users SET role = 'admin' WHERE email = %s;", (EMAIL,))
+    user_cache.invalidate(EMAIL)
+
+    response = client.get("/auth/deletions?status=pending", headers=auth_headers)
+    assert response.status_code == 200
+    deletions = {deletion["email"]: deletion for deletion in response.json["deletions"]}
+    assert deletions[OTHER_EMAIL]["status"] == AccountDeletions.PENDING
+    assert deletions[OTHER_EMAIL]["projectsDeleted"] == 0
+
+
+# Test that a deletion refused by a full queue is still accepted, and picked
+# up by the next sweep
+def test_deletion_when_queue_full(client, cleanup, auth_headers, monkeypatch):
+    running = threading.Event()
+    release = threading.Event()
+    full = JobQueue(
+        "account_deletion",
+        lambda email, attempt: running.set() or release.wait(timeout=2),
+        workers=1,
+        max_attempts=1,
+        backoff_seconds=0,
+        max_size=1,
+    )
+    full.submit("running@example.com")
+    running.wait(timeout=2)
+    full.submit("queued@example.com")
+    monkeypatch.setattr(app.routes.auth_routes, "account_deletion_queue", full)
+
+    try:
+        response = client.delete("/auth/delete_user", json={"email": EMAIL}, headers=auth_headers)
+        assert response.status_code == 202
+    finally:
+        release.set()
+    assert deletion(EMAIL)[AccountDeletions.STATUS.raw] == AccountDeletions.PENDING
+
+    submitted = []
+    monkeypatch.setattr(account_deletion_queue, "submit", lambda email, attempt=1: submitted.append(email))
+    sweep()
+    assert EMAIL in submitted
@@ -0,0 +1,86 @@
+import gzip
+import json
+import pytest
+from flask import Flask, jsonify
+from app import compression
+from app.compression import init_compression
+
+
+# A tiny app so the compression layer can be exercised without Minerva
+@pytest.fixture
+def compression_client():
+    app = Flask(__name__)
+    init_compression(app)
+
+    tree = [{"name": f"Task {i}", "description": "Repeated text", "completed": False, "tasks": []} for i in range(200)]
+
+    @app.route("/big")
+    def big():
+        return jsonify({"tasks": tree})
+
+    @app.route("/small")
+    def small():
+        return jsonify({"ok": True})
+
+    app.config["TESTING"] = True
+    with app.test_client() as client:
+        yield client
+
+
+# Test that large JSON responses are gzipped when the client asks for it
+def test_large_response_is_gzipped(compression_client, monkeypatch):
+    monkeypatch.setattr(compression, "brotli", None)
+    response = compression_client.get("/big", headers={"Accept-Encoding": "gzip"})
+
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["Vary"]
+    body = json.loads(gzip.decompress(response.get_data()))
+    assert len(body["tasks"]) == 200
+
+
+# Test that small responses and clients without Accept-Encoding are left alone
+def test_small_or_unnegotiated_response_is_not_compressed(compression_client):
+    response = compression_client.get("/small", headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in response.headers
+
+    response = compression_client.get("/big")
+    assert "Content-Encoding" not in response.headers
+    assert len(response.json["tasks"]) == 200
+
+
+# Test that unknown codings, decompression bombs and truncated bodies are
+# rejected
+def test_rejected_request_bodies():
+    with pytest.raises(compression.UnsupportedEncodingException):
+        compression.decompress(b"{}", "zstd")
+
+    with pytest.raises(compression.DecompressedBodyTooLargeException):
+        compression.decompress(gzip.compress(b"0" * 2048), "gzip", max_size=1024)
+
+    with pytest.raises(compression.MalformedCompressedBodyException):
+        compression.decompress(gzip.compress(b"0" * 2048)[:-12], "gzip")
+
+
+# Test that a brotli body is inflated a limited amount at a time
+def test_brotli_request_body():
+    brotli = pytest.importorskip("brotli")
+    if not compression.BROTLI_BOUNDED:
+        pytest.skip("brotli 1.2 or later is needed to inflate request bodies")
+    assert compression.decompress(brotli.compress(b"0" * 2048), "br") == b"0" * 2048
+
+    with pytest.raises(compression.DecompressedBodyTooLargeException):
+        compression.decompress(brotli.compress(b"0" * 10**6), "br", max_size=1024)
+
+    # The output limit is a hint, so the size is checked on what comes back
+    with pytest.raises(compression.DecompressedBodyTooLargeException):
+        compression.decompress(brotli.compress(b"0" * 2048), "br", max_size=10)
+
+    with pytest.raises(compression.MalformedCompressedBodyException):
+        compression.decompress(brotli.compress(b"0" * 2048 + bytes(range(256)))[:-4], "br")
+
+
+# Test that without a bounded brotli decompressor br bodies are refused
+def test_unbounded_brotli_is_refused(monkeypatch):
+    monkeypatch.setattr(compression, "BROTLI_BOUNDED", False)
+    with pytest.raises(compression.UnsupportedEncodingException):
+        compression.decompress(b"\x0b\x01\x80{}\x03", "br")
@@ -0,0 +1,67 @@
+from psycopg2.errors import QueryCanceled, LockNotAvailable
+from app import postgresql_utils
+from app.postgresql_utils import MinervaCursor, minerva_deadline, DeadlineExceededException
+from app.config import PROJECTS_REQUEST_TIMEOUT_SECONDS
+from app.deadlines import endpoint_timeout
+import pytest
+import time
+
+
+def run_with_deadline(seconds: float, query: str):
+    token = minerva_deadline.set(time.monotonic() + seconds)
+    try:
+        with MinervaCursor() as cur:
+            cur.execute(query)
+    finally:
+        minerva_deadline.reset(token)
+
+
+# Test that a query running past the deadline is cancelled by the server
+def test_statement_cancelled_at_deadline():
+    started = time.monotonic()
+    with pytest.raises(QueryCanceled):
+        run_with_deadline(0.2, "SELECT pg_sleep(5);")
+    assert time.monotonic() - started < 2
+
+    with MinervaCursor() as cur:
+        cur.execute("SHOW statement_timeout;")
+        assert cur.fetchone()["statement_timeout"] != "200ms", "Timeouts do not outlive their transaction"
+
+
+# Test that no query is sent once the deadline has passed
+def test_deadline_already_passed():
+    with pytest.raises(DeadlineExceededException):
+        run_with_deadline(-1, "SELECT 1;")
+
+
+# Test that waiting on a lock gives up after the lock timeout
+def test_lock_timeout(monkeypatch):
+    monkeypatch.setattr(postgresql_utils, "MINERVA_LOCK_TIMEOUT_MS", 100)
+
+    with MinervaCursor() as holder:
+        holder.execute("LOCK TABLE projects.saved_projects IN ACCESS EXCLUSIVE MODE;")
+        with pytest.raises(LockNotAvailable):
+            with MinervaCursor() as cur:
+                cur.execute("SELECT count(*) FROM projects.saved_projects;")
+
+
+# Test that blueprints set the deadline and clients can only shorten it
+def test_endpoint_timeout(client):
+    app = client.application
+    with app.test_request_context("/projects/get_projects"):
+        assert endpoint_timeout() == PROJECTS_REQUEST_TIMEOUT_SECONDS
+
+    with app.test_request_context("/projects/get_projects", headers={"Request-Timeout": "0.5"}):
+        assert endpoint_timeout() == 0.5
+
+    with app.test_request_context("/projects/get_projects", headers={"Request-Timeout": "3600"}):
+        assert endpoint_timeout() == PROJECTS_REQUEST_TIMEOUT_SECONDS
+
+    with app.test_request_context("/projects/stream"):
+        assert endpoint_timeout() is None, "Streams are not bounded by a deadline"
+
+
+# Test that a request out of time gets a 504
+def test_route_timeout(client, setup_test_data, auth_headers):
+    response = client.get("/projects/get_projects", headers={**auth_headers, "Request-Timeout": "0.000001"})
+    assert response.status_code == 504
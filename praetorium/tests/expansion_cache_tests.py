@@ -0,0 +1,62 @@
+from app.ai.expansion_cache import CachingProvider, ExpansionCache, expansion_key, normalize_text
+from app.ai.providers import StubDecompositionProvider
+
+
+# A stub provider that counts how often it is actually called
+class CountingProvider(StubDecompositionProvider):
+    def __init__(self):
+        super().__init__(latency_ms=0)
+        self.calls = 0
+
+    def expand_task(self, task, context):
+        self.calls += 1
+        yield from super().expand_task(task, context)
+
+
+# Test that trivially different phrasings share a key
+def test_normalized_keys():
+    assert normalize_text("  Set up CI!! ") == normalize_text("set UP ci")
+    assert expansion_key({"name": "Set up CI"}, ["Backend"]) == expansion_key({"name": "set up ci."}, ["backend"])
+    assert expansion_key({"name": "Set up CI"}, ["Backend"]) != expansion_key({"name": "Set up CI"}, ["Frontend"])
+
+
+# Test that a repeated expansion is served from the cache
+def test_caching_provider_hits():
+    provider = CountingProvider()
+    cache = ExpansionCache(max_entries=10, ttl_seconds=60, similarity_threshold=0, persist=False)
+    cached = CachingProvider(provider, cache)
+
+    first = list(cached.expand_task({"name": "Implement authentication"}, ["App"]))
+    second = list(cached.expand_task({"name": "implement Authentication"}, ["app"]))
+
+    assert first == second
+    assert provider.calls == 1
+    report = cache.report()
+    assert report["hits"] == 1
+    assert report["misses"] == 1
+    assert report["hit_rate"] == 0.5
+
+
+# Test LRU eviction and TTL expiry
+def test_eviction_and_expiry():
+    cache = ExpansionCache(max_entries=2, ttl_seconds=60, similarity_threshold=0, persist=False)
+    for name in ("a", "b", "c"):
+        cache.put({"name": name}, [], [{"name": f"{name} child"}])
+
+    assert cache.get({"name": "a"}, []) is None
+    assert cache.get({"name": "c"}, []) == [{"name": "c child"}]
+    assert cache.report()["evictions"] == 1
+
+    expired = ExpansionCache(max_entries=2, ttl_seconds=0, similarity_threshold=0, persist=False)
+    expired.put({"name": "a"}, [], [{"name": "a child"}])
+    assert expired.get({"name": "a"}, []) is None
+
+
+# Test that the similarity lookup matches reworded tasks above the threshold
+def test_similarity_lookup():
+    cache = ExpansionCache(max_entries=10, ttl_seconds=60, similarity_threshold=0.6, persist=False)
+    cache.put({"name": "Implement user authentication flow"}, [], [{"name": "Login"}])
+
+    assert cache.get({"name": "Implement the user authentication flow"}, []) == [{"name": "Login"}]
+    assert cache.get({"name": "Design the landing page"}, []) is None
+    assert cache.report()["similar_hits"] == 1
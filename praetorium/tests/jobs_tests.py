@@ -0,0 +1,165 @@
+import threading
+import pytest
+from app.ai.providers import StubDecompositionProvider, get_provider, UnknownProviderException
+from app.jobs import JobQueue, JobQueueFullException
+from app.db_table_specs.minerva_jobs_specs import DecompositionJobs
+from app.db_table_specs.minerva_projects_specs import SavedProjects
+from app.ai.decomposition import run_decomposition
+from app.postgresql_utils import MinervaCursor
+from app.project_storage import project_storage, project_writes
+
+
+# Test that failing jobs are retried and then handed to on_failure
+def test_job_queue_retries_then_fails():
+    attempts = []
+    failures = []
+
+    def handler(job_id, attempt):
+        attempts.append((job_id, attempt))
+        raise RuntimeError("provider unavailable")
+
+    jobs = JobQueue(
+        "test", handler, workers=1, max_attempts=3, backoff_seconds=0.001, on_failure=lambda j, e: failures.append(j)
+    )
+    jobs.submit(7)
+    jobs.join()
+
+    assert attempts == [(7, 1), (7, 2), (7, 3)]
+    assert failures == [7]
+
+
+# Test that no more than `workers` jobs run at the same time
+def test_job_queue_concurrency_limit():
+    running = []
+    peak = []
+    lock = threading.Lock()
+    release = threading.Event()
+
+    def handler(job_id, attempt):
+        with lock:
+            running.append(job_id)
+            peak.append(len(running))
+        release.wait(timeout=2)
+        with lock:
+            running.remove(job_id)
+
+    jobs = JobQueue("test", handler, workers=2, max_attempts=1, backoff_seconds=0)
+    for job_id in range(6):
+        jobs.submit(job_id)
+    release.set()
+    jobs.join()
+
+    assert max(peak) <= 2
+
+
+# Test that a full backlog is reported instead of blocking
+def test_job_queue_full():
+    release = threading.Event()
+    jobs = JobQueue(
+        "test",
+        lambda job_id, attempt: release.wait(timeout=2),
+        workers=1,
+        max_attempts=1,
+        backoff_seconds=0,
+        max_size=1,
+    )
+
+    with pytest.raises(JobQueueFullException):
+        for job_id in range(5):
+            jobs.submit(job_id)
+    release.set()
+
+
+# Test that a job the queue already has is not queued again
+def test_job_queue_ignores_duplicates():
+    runs = []
+    release = threading.Event()
+
+    def handler(job_id, attempt):
+        release.wait(timeout=2)
+        runs.append(job_id)
+
+    jobs = JobQueue("test", handler, workers=1, max_attempts=1, backoff_seconds=0)
+    for job_id in (1, 2, 1, 2):
+        jobs.submit(job_id)
+    release.set()
+    jobs.join()
+
+    assert runs == [1, 2]
+    jobs.submit(1)
+    jobs.join()
+    assert runs == [1, 2, 1], "A finished job can be submitted again"
+
+
+# Test that a sweep picks up queued jobs and running jobs gone stale
+def test_resumable_jobs(setup_user):
+    fresh = DecompositionJobs.insert_record("testuser@example.com", 1)
+    stale = DecompositionJobs.insert_record("testuser@example.com", 2)
+    queued = DecompositionJobs.insert_record("testuser@example.com", 3)
+    with MinervaCursor() as cur:
+        cur.execute(
+            "UPDATE projects.decomposition_jobs SET status = 'running' WHERE job_id IN (%s, %s);", (fresh, stale)
+        )
+        cur.execute(
+            "UPDATE projects.decomposition_jobs SET updated_at = updated_at - interval '1 hour' WHERE job_id = %s;",
+            (stale,),
+        )
+
+    try:
+        resumable = DecompositionJobs.select_resumable()
+        assert stale in resumable and queued in resumable
+        assert fresh not in resumable
+        assert DecompositionJobs.claim(fresh) is None, "A running job is left to its worker"
+        assert DecompositionJobs.claim(stale)[DecompositionJobs.ATTEMPTS.raw] == 1
+    finally:
+        with MinervaCursor() as cur:
+            cur.execute("DELETE FROM projects.decomposition_jobs WHERE job_id IN (%s, %s, %s);", (fresh, stale, queued))
+
+
+# Test that a coalesced edit waiting for the project is written before, not on top of, the new task tree
+def test_decomposition_flushes_pending_edits(setup_project, monkeypatch):
+    email = "testuser@example.com"
+    project_id = setup_project
+    monkeypatch.setattr(project_writes, "window_seconds", 60)
+    monkeypatch.setattr("app.ai.decomposition.get_provider", lambda: StubDecompositionProvider(latency_ms=0))
+    project_writes.submit((email, project_id), project_description="Edited before decomposing.")
+    job_id = DecompositionJobs.insert_record(email, project_id)
+
+    try:
+        run_decomposition(job_id, 1)
+        assert (email, project_id) not in project_writes.pending
+
+        project = project_storage.select_many([project_id], email)[project_id]
+        assert project[SavedProjects.PROJECT_DESCRIPTION.raw] == "Edited before decomposing."
+        tasks = SavedProjects.load_tasks(project)
+        assert tasks == DecompositionJobs.select_one(job_id, email)[DecompositionJobs.RESULT.raw]
+        assert tasks[0]["tasks"][0]["tasks"], "The AI tree must not be overwritten"
+    finally:
+        with MinervaCursor() as cur:
+            cur.execute("DELETE FROM projects.decomposition_jobs WHERE job_id = %s;", (job_id,))
+
+
+# Test that the stub provider is deterministic and expands every leaf
+def test_stub_provider():
+    provider = StubDecompositionProvider(latency_ms=0)
+
+    plan = provider.decompose("Gamers app", "A gaming platform.", [])
+    assert [task["name"] for task in plan] == [
+        "Plan Gamers app",
+        "Build Gamers app",
+        "Test Gamers app",
+        "Launch Gamers app",
+    ]
+
+    tasks = [{"name": "UI Design", "completed": False, "tasks": [{"name": "Wireframes", "tasks": []}]}]
+    expanded = provider.decompose("Gamers app", "A gaming platform.", tasks)
+    assert expanded == provider.decompose("Gamers app", "A gaming platform.", tasks)
+    assert [task["name"] for task in expanded[0]["tasks"][0]["tasks"]] == [
+        "Scope Wireframes",
+        "Implement Wireframes",
+        "Verify Wireframes",
+    ]
+    assert tasks[0]["tasks"][0]["tasks"] == [], "The input tree must not be modified"
+
+    with pytest.raises(UnknownProviderException):
+        get_provider("does-not-exist")
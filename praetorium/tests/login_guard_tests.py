@@ -0,0 +1,75 @@
+from app.config import LOGIN_FAILURES_BEFORE_BACKOFF, LOGIN_BACKOFF_BASE_SECONDS
+from app.login_guard import LoginGuard, login_guard, verify_password
+import bcrypt
+import pytest
+
+
+@pytest.fixture
+def guard():
+    yield login_guard
+    login_guard.accounts.clear()
+
+
+# Test that an account backs off after repeated failures, doubling each time
+def test_backoff():
+    guard = LoginGuard()
+    for _ in range(LOGIN_FAILURES_BEFORE_BACKOFF - 1):
+        guard.failed("someone@example.com")
+    assert guard.retry_after("someone@example.com") == 0
+
+    guard.failed("someone@example.com")
+    assert 0 < guard.retry_after("Someone@Example.com ") <= LOGIN_BACKOFF_BASE_SECONDS, "Emails are normalized"
+    assert guard.retry_after("other@example.com") == 0, "Accounts are independent"
+    assert LoginGuard.backoff(LOGIN_FAILURES_BEFORE_BACKOFF + 2) == LOGIN_BACKOFF_BASE_SECONDS * 4
+
+    guard.succeeded("someone@example.com")
+    assert guard.retry_after("someone@example.com") == 0
+
+
+# Test that failures are stored compactly and old ones are forgotten
+def test_compact_storage():
+    guard = LoginGuard(max_accounts=2)
+    for email in ("first@example.com", "second@example.com", "third@example.com"):
+        for _ in range(LOGIN_FAILURES_BEFORE_BACKOFF):
+            guard.failed(email)
+
+    assert list(guard.accounts) == [LoginGuard.key("second@example.com"), LoginGuard.key("third@example.com")]
+    assert all(len(key) == 8 and isinstance(packed, int) for key, packed in guard.accounts.items())
+    assert guard.retry_after("first@example.com") == 0, "Evicted accounts start over"
+
+    # Pretend the last failure was two hours ago
+    key = LoginGuard.key("second@example.com")
+    guard.accounts[key] -= (2 * 60 * 60 * 1000) << 8
+    assert guard.retry_after("second@example.com") == 0
+    assert key not in guard.accounts
+
+
+# Test that a missing user still costs a bcrypt check
+def test_verify_password_without_user(monkeypatch):
+    checks = []
+    checkpw = bcrypt.checkpw
+    monkeypatch.setattr(bcrypt, "checkpw", lambda password, hashed: checks.append(hashed) or checkpw(password, hashed))
+
+    assert not verify_password("TestPassword123!", None)
+    assert len(checks) == 1
+
+    hashed = bcrypt.hashpw(b"TestPassword123!", bcrypt.gensalt()).decode("utf-8")
+    assert verify_password("TestPassword123!", hashed)
+    assert not verify_password("wrong", hashed)
+
+
+# Test that the login route backs off after repeated failures. The route's
+# own rate limit allows only a few logins, so one account is tried.
+def test_login_backoff(client, setup_user, guard):
+    for _ in range(LOGIN_FAILURES_BEFORE_BACKOFF):
+        response = client.post("/auth/login", json={"email": "testuser@example.com", "password": "wrong"})
+        assert response.status_code == 401
+
+    response = client.post("/auth/login", json={"email": "testuser@example.com", "password": "TestPassword123!"})
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+
+    guard.accounts.clear()
+    response = client.post("/auth/login", json={"email": "testuser@example.com", "password": "TestPassword123!"})
+    assert response.status_code == 200
+    assert client.post("/auth/login", json={"email": "testuser@example.com"}).status_code == 400
@@ -1,5 +1,5 @@
 import pytest
-from app.db_table_specs.minerva_projects_specs import SavedProjects
+from app.db_table_specs.minerva_projects_specs import SavedProjects, ProjectStats
 from app.postgresql_utils import MinervaCursor
 import json
 
@@ -82,6 +82,7 @@ def test_update_record_success(setup_user, setup_project):
     assert project is not None, "No project found with the given project_id"
     assert project["project_name"] == "Updated Project Name", "Project name not updated correctly"
     assert project["project_description"] == "Updated Project Description", "Project description not updated correctly"
+    assert project["updated_at"] > project["created_at"], "updated_at was not bumped"
 
 
 def test_update_record_no_fields_to_update(setup_project):
@@ -194,3 +195,88 @@ def test_edit_tasks(setup_project):
         updated_tasks[0]["task_description"] == "Updated description for workout logging"
     ), "Task description not updated correctly"
     assert updated_tasks[0]["task_priority"] == "Critical", "Task priority not updated correctly"
+
+
+# Test the select_many method
+def test_select_many(setup_project):
+    project_id = setup_project
+
+    projects = SavedProjects.select_many(project_ids=[project_id, project_id + 1000], email="testuser@example.com")
+
+    assert list(projects) == [project_id, project_id + 1000], "Results are not keyed by the requested ids"
+    assert projects[project_id]["project_name"] == "Test Project"
+    assert projects[project_id + 1000] is None, "Missing project should map to None"
+
+
+def test_select_many_other_users_project(setup_project):
+    project_id = setup_project
+
+    projects = SavedProjects.select_many(project_ids=[project_id], email="someoneelse@example.com")
+
+    assert projects == {project_id: None}, "Projects owned by another user must not be returned"
+
+
+# Test the append_subtask method
+def test_append_subtask(setup_project):
+    project_id = setup_project
+
+    new_task = {"name": "Write the migration", "description": "", "completed": False, "tasks": []}
+    index = SavedProjects.append_subtask(project_id, "testuser@example.com", [0, 0], new_task)
+
+    with MinervaCursor() as cur:
+        cur.execute("SELECT tasks FROM projects.saved_projects WHERE project_id = %s;", (project_id,))
+        tasks = cur.fetchone()["tasks"]
+
+    assert index == 0
+    assert tasks[0]["tasks"][0]["tasks"] == [new_task], "Subtask not appended to the right parent"
+
+    with pytest.raises(Exception):
+        SavedProjects.append_subtask(project_id, "testuser@example.com", [9], new_task)
+
+
+# Test the search_tasks method
+def test_search_tasks(setup_project):
+    project_id = setup_project
+
+    results = SavedProjects.search_tasks(email="testuser@example.com", query="database schema")
+
+    assert [(result["project_id"], result["path"]) for result in results] == [(project_id, [0, 0])]
+    assert results[0]["name"] == "Design the database schema to store workout data"
+
+    results = SavedProjects.search_tasks(email="testuser@example.com", priority="High", completed=False)
+    assert len(results) == 2, "Both tasks are high priority and incomplete"
+
+    assert SavedProjects.search_tasks(email="someoneelse@example.com", query="database") == []
+
+
+# Test that writes keep the project stats rollup up to date
+def test_project_stats(setup_project):
+    project_id = setup_project
+    tasks = [
+        {
+            "name": "Ship it",
+            "task_priority": "High",
+            "completed": False,
+            "task_due_date": "2000-01-01",
+            "tasks": [
+                {"name": "Write docs", "task_priority": "Low", "completed": True, "tasks": []},
+                {"name": "Release", "completed": False, "task_due_date": "2999-01-01T09:00:00", "tasks": []},
+            ],
+        }
+    ]
+    SavedProjects.update_record(project_id, None, None, json.dumps(tasks), email="testuser@example.com")
+
+    stats = ProjectStats.select_one(project_id, "testuser@example.com")
+    assert stats["total_tasks"] == 3
+    assert stats["completed_tasks"] == 1
+    assert stats["completion_percentage"] == 33.3
+    assert stats["max_depth"] == 2
+    assert stats["tasks_by_priority"] == {"High": 1, "Low": 1, "none": 1}
+    assert stats["incomplete_due_dates"] == {"2000-01-01": 1, "2999-01-01": 1}
+    assert stats["overdue_tasks"] == 1
+
+    assert [row["project_id"] for row in ProjectStats.select_all("testuser@example.com")] == [project_id]
+
+    SavedProjects.delete_record(project_id, "testuser@example.com")
+    with pytest.raises(Exception):
+        ProjectStats.select_one(project_id, "testuser@example.com")
@@ -0,0 +1,47 @@
+import json
+import pytest
+from app.project_events import ProjectChangeListener
+
+
+# A listener whose thread never starts, so fan-out can be tested without Minerva
+@pytest.fixture
+def listener(monkeypatch):
+    listener = ProjectChangeListener("test_channel")
+    monkeypatch.setattr(listener, "_ensure_started", lambda: None)
+    return listener
+
+
+# Test that a notification only reaches the owner's matching subscriptions
+def test_dispatch_fans_out_by_user_and_project(listener):
+    everything = listener.subscribe("a@example.com")
+    one_project = listener.subscribe("a@example.com", project_id=2)
+    other_user = listener.subscribe("b@example.com")
+
+    listener.dispatch(json.dumps({"email": "a@example.com", "project_id": 1, "operation": "update"}))
+
+    assert everything.get(timeout=0) == {"project_id": 1, "operation": "update"}
+    assert one_project.get(timeout=0) is None
+    assert other_user.get(timeout=0) is None
+
+
+# Test that a slow subscriber gets a single resync marker instead of a backlog
+def test_overflow_becomes_resync(listener):
+    subscription = listener.subscribe("a@example.com", max_size=2)
+
+    for project_id in range(5):
+        listener.dispatch(json.dumps({"email": "a@example.com", "project_id": project_id, "operation": "update"}))
+
+    events = [subscription.get(timeout=0) for _ in range(2)]
+    assert events == [{"operation": "resync"}, None]
+
+
+# Test that unsubscribing removes the subscription
+def test_unsubscribe(listener):
+    subscription = listener.subscribe("a@example.com")
+    assert listener.subscriber_count() == 1
+
+    listener.unsubscribe(subscription)
+    assert listener.subscriber_count() == 0
+
+    listener.dispatch(json.dumps({"email": "a@example.com", "project_id": 1, "operation": "delete"}))
+    assert subscription.get(timeout=0) is None
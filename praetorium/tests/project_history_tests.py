@@ -0,0 +1,168 @@
+from app.db_table_specs.minerva_projects_specs import SavedProjects, ProjectHistory
+from app.json_diff import diff, apply_diff
+from app.postgresql_utils import MinervaCursor
+from app.project_storage import MinervaProjectStorage
+from app.config import HISTORY_KEYFRAME_INTERVAL
+import json
+import pytest
+
+EMAIL = "testuser@example.com"
+
+TREE = [
+    {"name": "Build", "completed": False, "tasks": [{"name": "Scope", "completed": False, "tasks": []}]},
+    {"name": "Launch", "completed": False, "tasks": []},
+]
+
+
+@pytest.fixture
+def project(setup_user):
+    storage = MinervaProjectStorage()
+    project_id = storage.insert(EMAIL, "History Project", "A description", None)
+    # Stored as a tree rather than a string, so subtasks can be appended
+    storage.update(project_id, tasks=json.dumps(TREE), email=EMAIL)
+    yield project_id
+    with MinervaCursor() as cur:
+        cur.execute("DELETE FROM projects.saved_projects WHERE email = %s;", (EMAIL,))
+
+
+def versions(project_id):
+    with MinervaCursor() as cur:
+        cur.execute(
+            "SELECT version, keyframe, content FROM projects.project_versions WHERE project_id = %s AND email = %s "
+            "ORDER BY version;",
+            (project_id, EMAIL),
+        )
+        return cur.fetchall()
+
+
+# Test that diffs are small and round trip
+def test_diff_round_trip():
+    edited = json.loads(json.dumps(TREE))
+    edited[0]["tasks"][0]["completed"] = True
+    edited[0]["tasks"].append({"name": "Implement", "tasks": []})
+    del edited[1]["completed"]
+
+    operations = diff(TREE, edited)
+    assert operations == [
+        ["r", [0, "tasks", 0, "completed"], True],
+        ["s", [0, "tasks"], 1, 0, [{"name": "Implement", "tasks": []}]],
+        ["d", [1, "completed"]],
+    ]
+    assert apply_diff(TREE, operations) == edited
+    assert TREE[0]["tasks"][0]["completed"] is False, "The original is not modified"
+
+    inserted = [TREE[0], {"name": "Review"}, TREE[1]]
+    assert diff(TREE, inserted) == [["s", [], 1, 0, [{"name": "Review"}]]]
+    assert apply_diff(TREE, diff(TREE, inserted)) == inserted
+    assert diff(TREE, TREE) == []
+    assert apply_diff(TREE, diff(TREE, {"replaced": True})) == {"replaced": True}
+
+
+# Test that a change of type is a change, though == would call it equal
+def test_diff_types():
+    assert diff({"completed": 1}, {"completed": True}) == [["r", ["completed"], True]]
+    assert diff([0, "Build"], [False, "Build"]) == [["r", [0], False]]
+    assert diff([1, 2], [1, 2.0]) == [["r", [1], 2.0]]
+    assert diff([{"priority": 1}, "Launch"], [{"priority": 1}, "Launch"]) == []
+
+
+# Test that writes record diffs that rebuild every version
+def test_record_versions(project):
+    storage = MinervaProjectStorage()
+    storage.update(project, project_name="History Renamed", email=EMAIL)
+    storage.append_subtask(project, EMAIL, [1], {"name": "Announce", "tasks": []})
+    storage.update(project, project_name="History Renamed", email=EMAIL)
+
+    rows = versions(project)
+    assert [row["keyframe"] for row in rows] == [True, False, False, False], "Unchanged writes record nothing"
+    assert rows[2]["content"] == [["r", ["project_name"], "History Renamed"]]
+    assert rows[3]["content"] == [["r", ["tasks", 1, "tasks"], [{"name": "Announce", "tasks": []}]]]
+
+    assert ProjectHistory.select_version(project, EMAIL, 1)["operation"] == "insert"
+    assert ProjectHistory.select_version(project, EMAIL, 1)["project"]["tasks"] == []
+    second = ProjectHistory.select_version(project, EMAIL, 2)
+    assert second["project"] == {
+        "project_name": "History Project",
+        "project_description": "A description",
+        "tasks": TREE,
+    }
+
+    latest = ProjectHistory.select_version(project, EMAIL, 4)["project"]
+    assert latest["project_name"] == "History Renamed"
+    assert latest["tasks"] == SavedProjects.load_tasks(storage.select_many([project], EMAIL)[project])
+
+
+# Test that keyframes bound the rows read and retention drops whole runs
+def test_keyframes_and_retention(project, monkeypatch):
+    storage = MinervaProjectStorage()
+    for index in range(HISTORY_KEYFRAME_INTERVAL):
+        storage.update(project, project_name=f"History {index}", email=EMAIL)
+
+    rows = versions(project)
+    assert [row["version"] for row in rows if row["keyframe"]] == [1, HISTORY_KEYFRAME_INTERVAL + 1]
+    assert ProjectHistory.select_version(project, EMAIL, HISTORY_KEYFRAME_INTERVAL)["project"]["project_name"] == (
+        f"History {HISTORY_KEYFRAME_INTERVAL - 3}"
+    )
+
+    # Keeping only the last version drops every version before its keyframe
+    monkeypatch.setattr(ProjectHistory, "retention_params", classmethod(lambda cls: (1, 0)))
+    with MinervaCursor() as cur:
+        cur.execute("SELECT pg_advisory_xact_lock(%s);", (ProjectHistory.COMPACT_LOCK_ID,))
+        assert ProjectHistory.compact_all() == 0, "Only one process compacts at a time"
+    assert len(versions(project)) == HISTORY_KEYFRAME_INTERVAL + 2
+
+    ProjectHistory.compact_all()
+    kept = [row["version"] for row in versions(project)]
+    assert kept == [HISTORY_KEYFRAME_INTERVAL + 1, HISTORY_KEYFRAME_INTERVAL + 2]
+
+
+# Test that compaction keeps one version per day and can still rebuild them
+def test_compact(project):
+    storage = MinervaProjectStorage()
+    for index in range(4):
+        storage.update(project, project_name=f"History {index}", email=EMAIL)
+    with MinervaCursor() as cur:
+        cur.execute(
+            "UPDATE projects.project_versions SET created_at = created_at - interval '30 days' "
+            "WHERE project_id = %s AND email = %s AND version < 6;",
+            (project, EMAIL),
+        )
+
+    assert ProjectHistory.compact(project, EMAIL) == 3
+    assert [row["version"] for row in versions(project)] == [1, 5, 6]
+    assert ProjectHistory.select_version(project, EMAIL, 5)["project"]["project_name"] == "History 2"
+    assert ProjectHistory.select_version(project, EMAIL, 6)["project"]["tasks"] == TREE
+
+
+# Test the history routes and restoring a version
+def test_history_routes(client, project, auth_headers):
+    MinervaProjectStorage().update(project, project_name="History Renamed", tasks=json.dumps(TREE[:1]), email=EMAIL)
+
+    response = client.get(f"/projects/history/{project}", headers=auth_headers)
+    assert response.status_code == 200
+    assert [version["version"] for version in response.json["versions"]] == [1, 2, 3]
+
+    response = client.get(f"/projects/history/{project}/2", headers=auth_headers)
+    assert response.status_code == 200
+    assert response.json["version"]["project"]["tasks"] == TREE
+
+    response = client.post(
+        "/projects/restore_version", json={"project_id": project, "version": 2}, headers=auth_headers
+    )
+    assert response.status_code == 200
+    restored = MinervaProjectStorage().select_many([project], EMAIL)[project]
+    assert restored[SavedProjects.PROJECT_NAME.raw] == "History Project"
+    assert SavedProjects.load_tasks(restored) == TREE
+    assert len(versions(project)) == 4, "The restore is a version of its own"
+
+    MinervaProjectStorage().update(project, project_description="", email=EMAIL)
+    MinervaProjectStorage().update(project, project_description="Described again", email=EMAIL)
+    response = client.post(
+        "/projects/restore_version", json={"project_id": project, "version": 5}, headers=auth_headers
+    )
+    assert response.status_code == 200
+    restored = MinervaProjectStorage().select_many([project], EMAIL)[project]
+    assert restored[SavedProjects.PROJECT_DESCRIPTION.raw] == "", "Empty fields are restored too"
+
+    assert client.get(f"/projects/history/{project}/99", headers=auth_headers).status_code == 404
+    assert client.get("/projects/history/999999", headers=auth_headers).status_code == 404
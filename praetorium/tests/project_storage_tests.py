@@ -0,0 +1,243 @@
+from app.db_table_specs.minerva_auth_specs import EmailDoesNotExistException
+from app.db_table_specs.minerva_projects_specs import (
+    SavedProjects,
+    SavedProjectSelectException,
+    SavedProjectUpdateException,
+    TaskSubtrees,
+)
+from app.project_storage import (
+    DedupProjectStorage,
+    MinervaProjectStorage,
+    SQLiteProjectStorage,
+    UnknownStorageException,
+    get_project_storage,
+)
+from app.postgresql_utils import MinervaCursor
+from app.routes import project_routes
+import json
+import pytest
+
+EMAIL = "testuser@example.com"
+
+TREE = [
+    {"name": "Build", "completed": False, "tasks": [{"name": "Scope", "completed": False, "tasks": []}]},
+    {"name": "Launch", "completed": False, "tasks": []},
+]
+
+
+# Routes over tables only Minerva has
+MINERVA_ONLY_PATHS = [
+    "/projects/changes",
+    "/projects/search?q=x",
+    "/projects/stats",
+    "/projects/stats/1",
+    "/projects/history/1",
+    "/projects/history/1/1",
+    "/projects/templates",
+]
+
+
+def registered_only(email: str) -> None:
+    if email != EMAIL:
+        raise EmailDoesNotExistException(f"{email} is not registered!")
+
+
+# Every test below runs against each backend. The SQLite runs need no
+# external services.
+@pytest.fixture(params=["minerva", "dedup", "sqlite"])
+def storage(request, tmp_path):
+    if request.param == "sqlite":
+        yield SQLiteProjectStorage(str(tmp_path / "projects.db"), require_user=registered_only)
+        return
+
+    request.getfixturevalue("setup_user")
+    yield DedupProjectStorage() if request.param == "dedup" else MinervaProjectStorage()
+    with MinervaCursor() as cur:
+        cur.execute("DELETE FROM projects.saved_projects WHERE email = %s;", (EMAIL,))
+
+
+def test_insert_and_select(storage):
+    first = storage.insert(EMAIL, "Storage Project", "A description", json.dumps(TREE))
+    second = storage.insert(EMAIL, "Storage Project 2", "Another description", None)
+    assert second == first + 1, "Each user's project ids count up"
+
+    projects = {project[SavedProjects.PROJECT_ID.raw]: project for project in storage.select_all(EMAIL)}
+    assert SavedProjects.load_tasks(projects[first]) == TREE
+    assert projects[first][SavedProjects.PROJECT_NAME.raw] == "Storage Project"
+    assert projects[first][SavedProjects.STATUS.raw] == "active"
+    assert SavedProjects.load_tasks(projects[second]) == []
+
+    with pytest.raises(SavedProjectSelectException):
+        storage.select_one(10**6)
+
+
+def test_unregistered_user(storage):
+    with pytest.raises(EmailDoesNotExistException):
+        storage.insert("nobody@example.com", "Storage Project", "A description", None)
+
+
+def test_select_many(storage):
+    project_id = storage.insert(EMAIL, "Storage Project", "A description", json.dumps(TREE))
+
+    projects = storage.select_many([project_id, project_id + 100], EMAIL)
+    assert list(projects) == [project_id, project_id + 100]
+    assert projects[project_id][SavedProjects.PROJECT_NAME.raw] == "Storage Project"
+    assert projects[project_id + 100] is None
+    assert storage.select_many([project_id], "someone@example.com") == {project_id: None}
+    assert storage.select_many([], EMAIL) == {}
+
+
+def test_update(storage):
+    project_id = storage.insert(EMAIL, "Storage Project", "A description", json.dumps(TREE))
+    created = storage.select_many([project_id], EMAIL)[project_id][SavedProjects.UPDATED_AT.raw]
+
+    storage.update(project_id, project_name="Storage Renamed", tasks=json.dumps(TREE[:1]), email=EMAIL)
+
+    project = storage.select_many([project_id], EMAIL)[project_id]
+    assert project[SavedProjects.PROJECT_NAME.raw] == "Storage Renamed"
+    assert project[SavedProjects.PROJECT_DESCRIPTION.raw] == "A description"
+    assert SavedProjects.load_tasks(project) == TREE[:1]
+    assert project[SavedProjects.UPDATED_AT.raw] >= created
+
+    with pytest.raises(SavedProjectUpdateException):
+        storage.update(project_id, email=EMAIL)
+
+
+def test_append_subtask(storage):
+    project_id = storage.insert(EMAIL, "Storage Project", "A description", None)
+    storage.update(project_id, tasks=json.dumps(TREE), email=EMAIL)
+
+    assert storage.append_subtask(project_id, EMAIL, [0], {"name": "Implement", "tasks": []}) == 1
+    assert storage.append_subtask(project_id, EMAIL, [0, 1], {"name": "Write code", "tasks": []}) == 0
+    assert storage.append_subtask(project_id, EMAIL, [1], {"name": "Announce", "tasks": []}) == 0
+
+    tasks = SavedProjects.load_tasks(storage.select_many([project_id], EMAIL)[project_id])
+    assert [task["name"] for task in tasks[0]["tasks"]] == ["Scope", "Implement"]
+    assert tasks[0]["tasks"][1]["tasks"][0]["name"] == "Write code"
+    assert tasks[1]["tasks"][0]["name"] == "Announce"
+
+    with pytest.raises(SavedProjectUpdateException):
+        storage.append_subtask(project_id, EMAIL, [5], {"name": "Missing parent"})
+
+
+def test_delete(storage):
+    project_id = storage.insert(EMAIL, "Storage Project", "A description", None)
+
+    storage.delete(project_id, EMAIL)
+
+    assert project_id not in [project[SavedProjects.PROJECT_ID.raw] for project in storage.select_all(EMAIL)]
+    assert storage.select_many([project_id], EMAIL) == {project_id: None}
+    with pytest.raises(ValueError):
+        storage.delete(project_id + 100, EMAIL)
+
+
+def stored_rows(task_roots):
+    with MinervaCursor() as cur:
+        _, hashes = TaskSubtrees.load(cur, [task_roots])
+    return hashes
+
+
+def task_roots(project_id):
+    with MinervaCursor() as cur:
+        cur.execute(
+            "SELECT task_roots FROM projects.saved_projects WHERE project_id = %s AND email = %s;", (project_id, EMAIL)
+        )
+        return cur.fetchone()["task_roots"]
+
+
+# Test that a subtree shared by two projects is stored once
+def test_dedup_shared_subtrees(setup_user):
+    storage = DedupProjectStorage()
+    shared = TREE[0]
+    first = storage.insert(EMAIL, "Dedup Project", "A description", json.dumps([shared, shared]))
+    second = storage.insert(EMAIL, "Dedup Project 2", "A description", json.dumps([shared, TREE[1]]))
+
+    try:
+        assert task_roots(first)[0] == task_roots(first)[1] == task_roots(second)[0]
+        assert len(stored_rows(task_roots(first))) == 2, "Build and Scope"
+
+        projects = storage.select_many([first, second], EMAIL)
+        assert SavedProjects.load_tasks(projects[first]) == [shared, shared]
+        assert SavedProjects.load_tasks(projects[second]) == [shared, TREE[1]]
+
+        # Only the appended task and its ancestor get new rows
+        before = stored_rows(task_roots(second))
+        storage.append_subtask(second, EMAIL, [0, 0], {"name": "Estimate", "tasks": []})
+        after = stored_rows(task_roots(second))
+        assert len(after - before) == 3, "Estimate, Scope and Build"
+
+        tasks = SavedProjects.load_tasks(storage.select_many([first], EMAIL)[first])
+        assert tasks == [shared, shared], "Other projects sharing the subtree are unchanged"
+    finally:
+        with MinervaCursor() as cur:
+            cur.execute("DELETE FROM projects.saved_projects WHERE email = %s;", (EMAIL,))
+
+
+# Test that garbage collection keeps referenced subtrees and recent ones
+def test_dedup_collect_garbage(setup_user):
+    storage = DedupProjectStorage()
+    project_id = storage.insert(EMAIL, "Dedup Project", "A description", json.dumps(TREE))
+    replaced = stored_rows(task_roots(project_id))
+    storage.update(project_id, tasks=json.dumps(TREE[1:]), email=EMAIL)
+    kept = stored_rows(task_roots(project_id))
+
+    try:
+        with MinervaCursor() as cur:
+            cur.execute("SELECT pg_advisory_xact_lock(%s);", (TaskSubtrees.GC_LOCK_ID,))
+            assert TaskSubtrees.collect_garbage(grace_seconds=0) == 0, "Only one process collects at a time"
+
+        TaskSubtrees.collect_garbage()
+        with MinervaCursor() as cur:
+            cur.execute("SELECT count(*) FROM projects.task_subtrees WHERE subtree_hash = ANY(%s);", (list(replaced),))
+            assert cur.fetchone()["count"] == len(replaced), "Unreferenced rows are kept for the grace period"
+
+        TaskSubtrees.collect_garbage(grace_seconds=0)
+        with MinervaCursor() as cur:
+            cur.execute(
+                "SELECT subtree_hash FROM projects.task_subtrees WHERE subtree_hash = ANY(%s);", (list(replaced),)
+            )
+            assert {row["subtree_hash"] for row in cur.fetchall()} == kept
+        assert SavedProjects.load_tasks(storage.select_many([project_id], EMAIL)[project_id]) == TREE[1:]
+    finally:
+        with MinervaCursor() as cur:
+            cur.execute("DELETE FROM projects.saved_projects WHERE email = %s;", (EMAIL,))
+
+
+# Test that features built on Minerva tables are refused rather than answered
+# from the wrong database
+def test_minerva_only_routes(client, auth_headers, tmp_path, monkeypatch):
+    storage = SQLiteProjectStorage(str(tmp_path / "projects.db"), require_user=registered_only)
+    monkeypatch.setattr(project_routes, "project_storage", storage)
+
+    for path in MINERVA_ONLY_PATHS:
+        response = client.get(path, headers=auth_headers)
+        assert response.status_code == 501, path
+    response = client.post("/projects/restore_version", json={"project_id": 1, "version": 1}, headers=auth_headers)
+    assert response.status_code == 501
+    assert client.get("/projects/get_projects", headers=auth_headers).status_code == 200
+
+
+# Test that an unknown storage URL is reported as such
+def test_unknown_storage():
+    with pytest.raises(UnknownStorageException):
+        get_project_storage("mongodb://localhost/projects")
+
+
+# Test that the change feed assembles trees stored as subtrees, and that
+# routes reading the tasks column refuse them
+def test_dedup_routes(client, auth_headers, monkeypatch):
+    storage = DedupProjectStorage()
+    monkeypatch.setattr(project_routes, "project_storage", storage)
+    project_id = storage.insert(EMAIL, "Dedup Project", "A description", json.dumps(TREE))
+
+    try:
+        response = client.get("/projects/changes", headers=auth_headers)
+        assert response.status_code == 200
+        projects = {project["projectId"]: project for project in response.json["projects"]}
+        assert projects[project_id]["tasks"] == TREE
+
+        assert client.get("/projects/stats", headers=auth_headers).status_code == 501
+        assert client.get("/projects/search?q=Build", headers=auth_headers).status_code == 501
+    finally:
+        with MinervaCursor() as cur:
+            cur.execute("DELETE FROM projects.saved_projects WHERE email = %s;", (EMAIL,))
@@ -0,0 +1,122 @@
+from app.db_table_specs.minerva_projects_specs import (
+    SavedProjects,
+    ProjectStats,
+    ProjectHistory,
+    ProjectTemplates,
+    ProjectTemplateNotFoundException,
+)
+from app.postgresql_utils import MinervaCursor
+from app.project_storage import DedupProjectStorage
+import json
+import pytest
+
+EMAIL = "testuser@example.com"
+
+TREE = [
+    {"name": "Build", "completed": False, "tasks": [{"name": "Scope", "completed": True, "tasks": []}]},
+    {"name": "Launch", "completed": False, "tasks": []},
+]
+
+
+@pytest.fixture
+def cleanup(setup_user):
+    yield
+    with MinervaCursor() as cur:
+        cur.execute("DELETE FROM projects.saved_projects WHERE email = %s;", (EMAIL,))
+        cur.execute("DELETE FROM projects.project_templates WHERE owner_email = %s;", (EMAIL,))
+
+
+# Test creating several projects from a template through the routes
+def test_instantiate_template(client, cleanup, auth_headers):
+    response = client.post(
+        "/projects/templates",
+        json={"template_name": "Launch Plan", "template_description": "A template", "tasks": TREE},
+        headers=auth_headers,
+    )
+    assert response.status_code == 201
+    template_id = response.json["templateId"]
+
+    response = client.get("/projects/templates", headers=auth_headers)
+    assert template_id in [template["templateId"] for template in response.json["templates"]]
+    assert "tasks" not in response.json["templates"][0]
+
+    response = client.post(
+        "/projects/instantiate_template", json={"template_id": template_id, "count": 3}, headers=auth_headers
+    )
+    assert response.status_code == 201
+    project_ids = response.json["projectIds"]
+    assert len(project_ids) == 3
+
+    projects = SavedProjects.select_many(project_ids, EMAIL)
+    assert [projects[project_id][SavedProjects.PROJECT_NAME.raw] for project_id in project_ids] == [
+        "Launch Plan (1)",
+        "Launch Plan (2)",
+        "Launch Plan (3)",
+    ]
+    stored = SavedProjects.load_tasks(projects[project_ids[0]])
+    assert [task["name"] for task in stored] == ["Build", "Launch"]
+
+    # The bookkeeping of an ordinary insert is done for each project
+    stats = ProjectStats.select_one(project_ids[1], EMAIL)
+    assert stats[ProjectStats.TOTAL_TASKS.raw] == 3
+    assert stats[ProjectStats.COMPLETED_TASKS.raw] == 1
+    first = ProjectHistory.select_version(project_ids[2], EMAIL, 1)
+    assert first["operation"] == "insert"
+    assert first["project"][SavedProjects.TASKS.raw] == stored
+
+    response = client.post(
+        "/projects/instantiate_template",
+        json={"template_id": template_id, "project_name": "My Launch"},
+        headers=auth_headers,
+    )
+    assert response.json["projectIds"] == [project_ids[-1] + 1]
+    project = SavedProjects.select_many(response.json["projectIds"], EMAIL)[project_ids[-1] + 1]
+    assert project[SavedProjects.PROJECT_NAME.raw] == "My Launch"
+
+    response = client.delete(f"/projects/templates/{template_id}", headers=auth_headers)
+    assert response.status_code == 200
+    response = client.post("/projects/instantiate_template", json={"template_id": template_id}, headers=auth_headers)
+    assert response.status_code == 404
+
+
+# Test that only admins share templates, and private ones stay private
+def test_template_visibility(client, cleanup, auth_headers):
+    response = client.post(
+        "/projects/templates", json={"template_name": "Shared", "tasks": TREE, "shared": True}, headers=auth_headers
+    )
+    assert response.status_code == 403
+
+    template_id = ProjectTemplates.insert_record(EMAIL, "Private", "", json.dumps(TREE))
+    with MinervaCursor() as cur:
+        cur.execute("INSERT INTO auth.users (email, password_hash) VALUES (%s, 'x');", ("someone@example.com",))
+    try:
+        with pytest.raises(ProjectTemplateNotFoundException):
+            ProjectTemplates.instantiate(template_id, "someone@example.com")
+    finally:
+        with MinervaCursor() as cur:
+            cur.execute("DELETE FROM auth.users WHERE email = %s;", ("someone@example.com",))
+
+    response = client.post(
+        "/projects/instantiate_template", json={"template_id": template_id, "count": 0}, headers=auth_headers
+    )
+    assert response.status_code == 400
+
+
+# Test that with shared subtrees new projects copy only the root hashes
+def test_instantiate_shared_subtrees(cleanup):
+    template_id = ProjectTemplates.insert_record(EMAIL, "Shared Subtrees", "", json.dumps(TREE), share_subtrees=True)
+    project_ids = ProjectTemplates.instantiate(template_id, EMAIL, 2, share_subtrees=True)
+
+    with MinervaCursor() as cur:
+        cur.execute(
+            "SELECT tasks, task_roots FROM projects.saved_projects WHERE email = %s AND project_id = ANY(%s);",
+            (EMAIL, project_ids),
+        )
+        rows = cur.fetchall()
+    assert all(row["tasks"] is None and len(row["task_roots"]) == 2 for row in rows)
+
+    storage = DedupProjectStorage()
+    storage.append_subtask(project_ids[0], EMAIL, [1], {"name": "Announce", "tasks": []})
+    projects = storage.select_many(project_ids, EMAIL)
+    assert SavedProjects.load_tasks(projects[project_ids[0]])[1]["tasks"][0]["name"] == "Announce"
+    assert SavedProjects.load_tasks(projects[project_ids[1]]) == TREE, "Edits do not reach other copies"
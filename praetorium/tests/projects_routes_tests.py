@@ -1,4 +1,13 @@
+import json
 from app.postgresql_utils import MinervaCursor
+from app.db_table_specs.minerva_projects_specs import ProjectStats
+from app.config import TASK_TREE_MAX_NODES
+from app.routes import project_routes
+from app.project_storage import project_writes
+from app.routes.project_routes import encode_sync_token, decode_sync_token
+from datetime import datetime
+import pytest
+import threading
 
 
 # Test the insert_project route
@@ -36,8 +45,10 @@ def test_insert_project(client, setup_test_data, auth_headers):
 
 
 # Test the update_project route
-def test_update_project(client, setup_test_data, auth_headers):
+def test_update_project(client, setup_test_data, auth_headers, monkeypatch):
     _, project_id = setup_test_data
+    # Without coalescing the update is written before the response
+    monkeypatch.setattr(project_writes, "window_seconds", 0)
 
     updated_project = {
         "project_id": project_id,
@@ -73,3 +84,143 @@ def test_update_project(client, setup_test_data, auth_headers):
     assert (
         project["tasks"][0]["task_description"] == "Updated task description."
     ), "Task description not updated correctly."
+
+
+# Test the get_many route
+def test_get_many(client, setup_test_data, auth_headers):
+    _, project_id = setup_test_data
+
+    response = client.get(f"/projects/get_many?ids={project_id},{project_id + 1000}", headers=auth_headers)
+    assert response.status_code == 200
+
+    projects = response.json["projects"]
+    assert projects[str(project_id)]["projectName"] == "Initial Project"
+    assert projects[str(project_id + 1000)] is None
+
+
+def test_get_many_invalid_ids(client, auth_headers):
+    response = client.get("/projects/get_many?ids=1,abc", headers=auth_headers)
+    assert response.status_code == 400
+
+
+# Test that sync tokens round-trip and malformed ones are rejected
+def test_sync_token_round_trip():
+    watermark = (datetime(2025, 1, 15, 12, 30, 5, 123456), 7)
+    assert decode_sync_token(encode_sync_token(watermark)) == watermark
+
+    with pytest.raises(ValueError):
+        decode_sync_token("not-a-token")
+
+
+# Test the changes route returns updates and tombstones after a watermark
+def test_get_changes(client, setup_test_data, auth_headers):
+    _, project_id = setup_test_data
+
+    # Push the stored timestamp behind the watermark lag, then do a full sync
+    with MinervaCursor() as cur:
+        cur.execute(
+            "UPDATE projects.saved_projects SET updated_at = updated_at - interval '1 minute' WHERE project_id = %s;",
+            (project_id,),
+        )
+    response = client.get("/projects/changes", headers=auth_headers)
+    assert response.status_code == 200
+    token = response.json["nextToken"]
+
+    client.delete(f"/projects/delete_project?project_id={project_id}", headers=auth_headers)
+
+    response = client.get(f"/projects/changes?since={token}", headers=auth_headers)
+    assert response.status_code == 200
+    assert [tombstone["projectId"] for tombstone in response.json["deleted"]] == [project_id]
+
+
+# Test the search route
+def test_search_tasks(client, setup_test_data, auth_headers):
+    _, project_id = setup_test_data
+
+    response = client.get("/projects/search?q=initial&priority=High", headers=auth_headers)
+    assert response.status_code == 200
+    assert [(result["projectId"], result["path"]) for result in response.json["results"]] == [(project_id, [0])]
+
+    response = client.get("/projects/search", headers=auth_headers)
+    assert response.status_code == 400
+
+    for limit in ("-1", "0"):
+        response = client.get(f"/projects/search?q=initial&limit={limit}", headers=auth_headers)
+        assert response.status_code == 400
+
+
+# Test the stats routes
+def test_get_stats(client, setup_test_data, auth_headers):
+    _, project_id = setup_test_data
+    ProjectStats.backfill()
+
+    response = client.get(f"/projects/stats/{project_id}", headers=auth_headers)
+    assert response.status_code == 200
+    assert response.json["stats"]["totalTasks"] == 1
+    assert response.json["stats"]["tasksByPriority"] == {"High": 1}
+
+    response = client.get("/projects/stats", headers=auth_headers)
+    assert response.status_code == 200
+    assert response.json["totals"]["totalTasks"] >= 1
+
+    response = client.get("/projects/stats/999999", headers=auth_headers)
+    assert response.status_code == 404
+
+
+# Test that a tree with a task added but not yet named is saved, as Aquila
+# does when a task is added
+def test_update_project_unnamed_task(client, setup_test_data, auth_headers):
+    email, project_id = setup_test_data
+    tasks = [{"name": "Named", "tasks": [{"name": None, "tasks": []}]}, {"name": "", "tasks": []}]
+
+    response = client.put(
+        "/projects/update_project", json={"project_id": project_id, "tasks": tasks}, headers=auth_headers
+    )
+    assert response.status_code in (200, 202)
+    project_writes.flush((email, project_id))
+
+    with MinervaCursor() as cur:
+        cur.execute("SELECT tasks FROM projects.saved_projects WHERE project_id = %s;", (project_id,))
+        stored = cur.fetchone()["tasks"]
+    stored = json.loads(stored) if isinstance(stored, str) else stored
+    assert stored[0]["tasks"][0]["name"] is None
+    assert stored[1]["name"] == ""
+
+
+# Test that invalid or oversized task trees are refused
+def test_update_project_invalid_tasks(client, setup_test_data, auth_headers):
+    _, project_id = setup_test_data
+
+    response = client.put(
+        "/projects/update_project",
+        json={"project_id": project_id, "tasks": [{"name": ["not", "a", "name"]}]},
+        headers=auth_headers,
+    )
+    assert response.status_code == 400
+    assert "name must be a string" in response.json["error"]
+
+    # Refused while parsing, before the tree is validated
+    response = client.put(
+        "/projects/update_project",
+        json={"project_id": project_id, "tasks": [{"name": "x"}] * (TASK_TREE_MAX_NODES + 1)},
+        headers=auth_headers,
+    )
+    assert response.status_code == 413
+
+
+# Test that a worker holds only so many streams open, freeing a slot when one closes
+def test_stream_limit(client, auth_headers, monkeypatch):
+    slots = threading.BoundedSemaphore(1)
+    monkeypatch.setattr(project_routes, "stream_slots", slots)
+
+    slots.acquire()
+    response = client.get("/projects/stream", headers=auth_headers)
+    assert response.status_code == 503
+    assert "Retry-After" in response.headers
+    slots.release()
+
+    stream = client.get("/projects/stream", headers=auth_headers, buffered=False)
+    assert stream.status_code == 200
+    assert not slots.acquire(blocking=False), "The open stream holds the slot"
+    stream.close()
+    assert slots.acquire(blocking=False), "Closing the stream frees its slot"
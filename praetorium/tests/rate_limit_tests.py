@@ -0,0 +1,99 @@
+import os
+import threading
+import pytest
+from flask import Flask, jsonify
+from flask_jwt_extended import JWTManager
+from app.rate_limit import (
+    Rate,
+    RateLimiter,
+    MemoryTokenBucketStore,
+    RedisTokenBucketStore,
+    ConcurrencyQuota,
+    rate_limit,
+)
+
+
+# A tiny app so the limiter can be exercised without Minerva
+@pytest.fixture
+def limited_client():
+    app = Flask(__name__)
+    app.config["JWT_SECRET_KEY"] = "test"
+    JWTManager(app)
+    RateLimiter(MemoryTokenBucketStore(), default="100/minute").init_app(app)
+
+    @app.route("/strict", methods=["POST"])
+    @rate_limit("2/minute")
+    def strict():
+        return jsonify({"ok": True})
+
+    @app.route("/open")
+    def open_route():
+        return jsonify({"ok": True})
+
+    app.config["TESTING"] = True
+    with app.test_client() as client:
+        yield client
+
+
+# Test parsing budgets
+def test_rate_parse():
+    rate = Rate.parse("10/minute")
+    assert (rate.limit, rate.period) == (10, 60)
+
+    with pytest.raises(ValueError):
+        Rate.parse("10 per minute")
+
+
+# Test that a bucket empties, reports when it refills, and refills
+def test_memory_store():
+    store = MemoryTokenBucketStore()
+    rate = Rate(2, 1)
+
+    assert store.take("key", rate)[0]
+    assert store.take("key", rate)[0]
+    allowed, retry_after = store.take("key", rate)
+    assert not allowed
+    assert 0 < retry_after <= 0.5
+
+    assert store.take("other", rate)[0], "Buckets are independent"
+
+    store.buckets["key"] = (0, store.buckets["key"][1] - 1)
+    assert store.take("key", rate)[0], "A second at 2/second refills the bucket"
+
+
+# Test that a route's own budget is enforced with Retry-After
+def test_route_budget(limited_client):
+    assert limited_client.post("/strict").status_code == 200
+    assert limited_client.post("/strict").status_code == 200
+
+    response = limited_client.post("/strict")
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+
+    assert limited_client.get("/open").status_code == 200, "Other routes keep their own budget"
+
+
+# Test the per-user concurrency quota
+def test_concurrency_quota():
+    quota = ConcurrencyQuota(2)
+    assert quota.acquire("user")
+    assert quota.acquire("user")
+    assert not quota.acquire("user")
+    assert quota.acquire("other")
+
+    quota.release("user")
+    assert quota.acquire("user")
+
+
+# Test the Redis store against a real server, when one is configured
+@pytest.mark.skipif(not os.getenv("TEST_REDIS_URL"), reason="TEST_REDIS_URL is not set")
+def test_redis_store():
+    pytest.importorskip("redis")
+    store = RedisTokenBucketStore(os.environ["TEST_REDIS_URL"])
+    rate = Rate(2, 60)
+    key = f"test:{threading.get_ident()}"
+
+    assert store.take(key, rate)[0]
+    assert store.take(key, rate)[0]
+    allowed, retry_after = store.take(key, rate)
+    assert not allowed and retry_after > 0
@@ -0,0 +1,98 @@
+import os
+import time
+import pytest
+from app import postgresql_utils
+from app.postgresql_utils import MinervaCursor, ReplicaRouter, minerva_last_write
+
+# A second Postgres instance standing in for a replica, e.g.
+# postgresql://postgres@/minerva?host=/tmp/pgreplica
+REPLICA_DSN = os.getenv("MINERVA_TEST_REPLICA_DSN")
+
+
+@pytest.fixture
+def cleanup():
+    yield
+    with MinervaCursor() as cur:
+        cur.execute("DELETE FROM projects.saved_projects WHERE project_name = 'Pinned Project';")
+
+
+def server_directory(read_only: bool) -> str:
+    with MinervaCursor(read_only=read_only) as cur:
+        cur.execute("SELECT current_setting('data_directory') AS directory;")
+        return cur.fetchone()["directory"]
+
+
+# Test that clients are pinned after writes and replicas are rotated
+def test_replica_router():
+    router = ReplicaRouter(["replica-1", "replica-2"], pin_seconds=60, retry_seconds=60)
+
+    assert {router.replicas()[0] for _ in range(4)} == {"replica-1", "replica-2"}
+
+    token = minerva_last_write.set(None)
+    try:
+        router.record_write()
+        assert router.replicas(minerva_last_write.get()) == [], "Reads after a write stay on the primary"
+    finally:
+        minerva_last_write.reset(token)
+    assert router.replicas(time.time() - 120) != [], "The pin lapses after its window"
+    assert router.replicas(time.time() + 3600) != [], "A time in the future cannot pin for longer"
+
+    router.mark_down("replica-1")
+    assert router.replicas() == ["replica-2"]
+    router.mark_down("replica-2")
+    assert router.replicas() == []
+
+    assert ReplicaRouter([]).replicas() == [], "Without replicas everything goes to the primary"
+
+
+# Test that an unreachable replica fails over to the primary
+def test_replica_failover(monkeypatch):
+    router = ReplicaRouter(["postgresql://postgres@127.0.0.1:1/minerva?connect_timeout=1"], retry_seconds=60)
+    monkeypatch.setattr(postgresql_utils, "replica_router", router)
+
+    assert server_directory(read_only=True) == server_directory(read_only=False)
+    assert router.replicas() == [], "The failed replica is skipped until its retry delay passes"
+
+
+# Test routing against a second local Postgres instance
+@pytest.mark.skipif(not REPLICA_DSN, reason="MINERVA_TEST_REPLICA_DSN is not set")
+def test_read_only_cursors_use_the_replica(monkeypatch):
+    router = ReplicaRouter([REPLICA_DSN], pin_seconds=60)
+    monkeypatch.setattr(postgresql_utils, "replica_router", router)
+    primary = server_directory(read_only=False)
+
+    assert server_directory(read_only=True) != primary
+
+    token = minerva_last_write.set(None)
+    try:
+        with MinervaCursor() as cur:
+            cur.execute("SELECT 1;")
+        assert server_directory(read_only=True) == primary, "Reads right after a write go to the primary"
+    finally:
+        minerva_last_write.reset(token)
+
+    assert server_directory(read_only=True) != primary, "Other clients still read from the replica"
+
+
+# Test that the app hands the time of a write back to the client, and that a
+# client presenting it is pinned whichever process serves it
+def test_last_write_travels_with_the_client(client, auth_headers, monkeypatch, cleanup):
+    router = ReplicaRouter(["replica-1"], pin_seconds=60)
+    monkeypatch.setattr(postgresql_utils, "replica_router", router)
+    pinned = []
+    monkeypatch.setattr(router, "replicas", lambda last_write=None: pinned.append(router.is_pinned(last_write)) or [])
+
+    project = {"project_name": "Pinned Project", "project_description": "Written to the primary"}
+    response = client.post("/projects/create_project", json=project, headers=auth_headers)
+    assert response.status_code == 201
+    last_write = response.headers["X-Last-Write"]
+    assert abs(float(last_write) - time.time()) < 60
+
+    client.delete_cookie("last_write")
+    pinned.clear()
+    client.get("/projects/get_projects", headers={**auth_headers, "X-Last-Write": last_write})
+    assert pinned and all(pinned), "Reads after the write stay on the primary"
+
+    pinned.clear()
+    client.get("/projects/get_projects", headers=auth_headers)
+    assert pinned and not any(pinned)
@@ -0,0 +1,68 @@
+import gzip
+import json
+import pytest
+from flask import Flask, jsonify, request
+from app.request_body import json_body, parse_json, RequestBodyTooLargeException, MalformedRequestBodyException
+
+
+# A tiny app so body limits can be exercised without Minerva
+@pytest.fixture
+def body_client():
+    app = Flask(__name__)
+
+    @app.route("/echo", methods=["POST"])
+    @json_body(1024, max_objects=10)
+    def echo():
+        return jsonify(request.get_json())
+
+    app.config["TESTING"] = True
+    with app.test_client() as client:
+        yield client
+
+
+# Test that bodies within the limits reach the view, compressed or not
+def test_body_within_limits(body_client):
+    payload = {"tasks": [{"name": "A"}, {"name": "B"}]}
+
+    response = body_client.post("/echo", json=payload)
+    assert response.status_code == 200
+    assert response.json == payload
+
+    response = body_client.post(
+        "/echo",
+        data=gzip.compress(json.dumps(payload).encode("utf-8")),
+        headers={"Content-Encoding": "gzip", "Content-Type": "application/json"},
+    )
+    assert response.status_code == 200
+    assert response.json == payload
+
+
+# Test that oversized, malformed and non-JSON bodies are refused
+def test_rejected_bodies(body_client):
+    assert body_client.post("/echo", json={"name": "x" * 2048}).status_code == 413
+    assert body_client.post("/echo", json={"tasks": [{}] * 20}).status_code == 413
+    assert body_client.post("/echo", data=b"{", content_type="application/json").status_code == 400
+    assert body_client.post("/echo", json=[1, 2]).status_code == 400
+    assert body_client.post("/echo", data=b"{}", content_type="text/plain").status_code == 415
+
+    # A small body that inflates past the limit
+    response = body_client.post(
+        "/echo",
+        data=gzip.compress(json.dumps({"name": "x" * 4096}).encode("utf-8")),
+        headers={"Content-Encoding": "gzip", "Content-Type": "application/json"},
+    )
+    assert response.status_code == 413
+
+
+# Test that parsing stops at the object budget and on absurd nesting
+def test_parse_json_limits():
+    assert parse_json(b'{"tasks": [{}, {}]}', max_objects=3) == {"tasks": [{}, {}]}
+
+    with pytest.raises(RequestBodyTooLargeException):
+        parse_json(b'{"tasks": [{}, {}, {}]}', max_objects=3)
+
+    with pytest.raises(RequestBodyTooLargeException):
+        parse_json(b"[" * 100000 + b"]" * 100000)
+
+    with pytest.raises(MalformedRequestBodyException):
+        parse_json(b"not json")
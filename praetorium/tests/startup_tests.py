@@ -0,0 +1,143 @@
+from app import lifecycle
+from app.postgresql_utils import PRIMARY, ConnectionPools, MinervaCursor
+from app.lifecycle import (
+    warmup,
+    after_fork,
+    check_server,
+    default_workers,
+    drain,
+    start_sweeps,
+    ServerConfigurationException,
+)
+import json
+import pytest
+import os
+import subprocess
+import sys
+import threading
+
+# The most a fresh interpreter may spend importing the app and running
+# create_app. Most of it is Flask itself.
+STARTUP_BUDGET_SECONDS = float(os.getenv("STARTUP_BUDGET_SECONDS", 1.5))
+
+COLD_START = """
+import json, sys, time
+started = time.perf_counter()
+from app import create_app
+create_app()
+elapsed = time.perf_counter() - started
+from app.postgresql_utils import minerva_pools
+print(json.dumps({"seconds": elapsed, "pools": list(minerva_pools.pools), "modules": sorted(sys.modules)}))
+"""
+
+
+# Test that a cold start stays within budget and does not touch Minerva
+def test_cold_start():
+    env = {**os.environ, "WARMUP_ON_START": "false", "RATE_LIMIT_STORAGE_URL": "memory://"}
+    output = subprocess.run(
+        [sys.executable, "-c", COLD_START],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    profile = json.loads(output.strip().splitlines()[-1])
+
+    assert profile["seconds"] < STARTUP_BUDGET_SECONDS
+    assert profile["pools"] == [], "Pools are only opened by the first request or warmup"
+    assert "redis" not in profile["modules"], "Optional backends are only imported when configured"
+
+
+# Test that warmup opens the primary pool
+def test_warmup(client, monkeypatch):
+    pools = ConnectionPools()
+    monkeypatch.setattr(lifecycle, "minerva_pools", pools)
+
+    warmup(client.application)
+
+    assert PRIMARY in pools.pools
+    connection, pooled = pools.getconn(PRIMARY)
+    assert pooled and pools.idle_seconds(connection) < 60, "The warmed connection is handed out first"
+    pools.putconn(PRIMARY, connection)
+    pools.pools[PRIMARY].closeall()
+
+
+# Test that a forked worker forgets inherited pools without closing them
+def test_after_fork(monkeypatch):
+    pools = ConnectionPools()
+    monkeypatch.setattr(lifecycle, "minerva_pools", pools)
+    connection, _ = pools.getconn(PRIMARY, **MinervaCursor.primary_connect_kwargs())
+    pools.putconn(PRIMARY, connection)
+
+    after_fork()
+
+    assert pools.pools == {}
+    assert not connection.closed, "The parent's connection is left open"
+    pools.abandoned[0].closeall()
+
+
+# Test that a worker's sweeps compact project history as well as resuming jobs
+def test_start_sweeps_compacts_history(monkeypatch):
+    compacted = threading.Event()
+    monkeypatch.setattr(lifecycle, "sweep", lambda: None)
+    monkeypatch.setattr(lifecycle, "collect_subtrees", lambda: None)
+    monkeypatch.setattr(lifecycle.ProjectHistory, "compact_all", classmethod(lambda cls: compacted.set() or 0))
+
+    start_sweeps(interval_seconds=3600)
+
+    assert compacted.wait(timeout=2), "History is compacted on the first sweep"
+
+
+# Test that several workers write updates through rather than coalescing them
+def test_after_fork_disables_coalescing(monkeypatch):
+    monkeypatch.setattr(lifecycle, "minerva_pools", ConnectionPools())
+    monkeypatch.setattr(lifecycle.project_writes, "window_seconds", 0.05)
+
+    after_fork(workers=1)
+    assert lifecycle.project_writes.enabled
+
+    after_fork(workers=3)
+    assert not lifecycle.project_writes.enabled
+
+
+# Test that the server refuses to start when workers would not share rate
+# limits, or streams could take every thread
+def test_check_server(monkeypatch):
+    monkeypatch.setattr(lifecycle, "RATE_LIMIT_STORAGE_URL", "memory://")
+    check_server(workers=1, threads=4)
+    with pytest.raises(ServerConfigurationException):
+        check_server(workers=3, threads=4)
+
+    monkeypatch.setattr(lifecycle, "RATE_LIMIT_STORAGE_URL", "redis://localhost:6379/0")
+    check_server(workers=3, threads=4)
+    with pytest.raises(ServerConfigurationException):
+        check_server(workers=3, threads=lifecycle.SSE_MAX_STREAMS_PER_WORKER)
+
+
+# Test that the default worker count only goes above one when rate limits are shared
+def test_default_workers(monkeypatch):
+    monkeypatch.setattr(lifecycle, "RATE_LIMIT_STORAGE_URL", "memory://")
+    assert default_workers() == 1
+    check_server(workers=default_workers(), threads=4)
+
+    monkeypatch.setattr(lifecycle, "RATE_LIMIT_ENABLED", False)
+    assert default_workers() > 1
+
+    monkeypatch.setattr(lifecycle, "RATE_LIMIT_ENABLED", True)
+    monkeypatch.setattr(lifecycle, "RATE_LIMIT_STORAGE_URL", "redis://localhost:6379/0")
+    assert default_workers() > 1
+    check_server(workers=default_workers(), threads=4)
+
+
+# Test that an exiting worker closes its connections
+def test_drain(monkeypatch):
+    pools = ConnectionPools()
+    monkeypatch.setattr(lifecycle, "minerva_pools", pools)
+    connection, _ = pools.getconn(PRIMARY, **MinervaCursor.primary_connect_kwargs())
+    pools.putconn(PRIMARY, connection)
+
+    drain()
+
+    assert pools.pools == {}
+    assert connection.closed
@@ -0,0 +1,83 @@
+import json
+import pytest
+from app.task_schema import TaskTreeValidator, InvalidTaskTreeException, TaskTreeTooLargeException
+
+
+# Test that trees are rewritten in canonical form
+def test_normalize_canonical_form():
+    tasks = [
+        {
+            "task_id": 1,
+            "name": "  Launch  ",
+            "task_description": "Ship it",
+            "task_priority": "High",
+            "task_start_date": "",
+            "task_due_date": "2025-03-01",
+            "unknown": "dropped",
+            "tasks": [{"name": "Announce", "completed": True}],
+        }
+    ]
+
+    assert TaskTreeValidator().normalize(tasks) == [
+        {
+            "task_id": 1,
+            "name": "Launch",
+            "task_description": "Ship it",
+            "completed": False,
+            "task_priority": "High",
+            "task_due_date": "2025-03-01",
+            "tasks": [{"name": "Announce", "completed": True, "tasks": []}],
+        }
+    ]
+    assert "unknown" in tasks[0], "The input tree must not be modified"
+
+
+# Test that tasks added but not yet named are kept
+def test_normalize_unnamed_tasks():
+    tasks = [{"name": None}, {"name": "  "}, {"description": "No name"}]
+
+    assert TaskTreeValidator().normalize(tasks) == [
+        {"name": None, "completed": False, "tasks": []},
+        {"name": "", "completed": False, "tasks": []},
+        {"name": None, "description": "No name", "completed": False, "tasks": []},
+    ]
+
+
+# Test that malformed nodes are rejected with their path
+@pytest.mark.parametrize(
+    "tasks, message",
+    [
+        ({"name": "Not a list"}, "tasks must be a list"),
+        (["a string"], "tasks[0] must be an object"),
+        ([{"name": 5}], "tasks[0].name must be a string"),
+        ([{"name": "Done?", "completed": "yes"}], "tasks[0].completed must be true or false"),
+        (
+            [{"name": "Parent", "tasks": [{"name": "Child", "task_due_date": "soon"}]}],
+            "tasks[0].tasks[0].task_due_date",
+        ),
+        ([{"name": "Parent", "tasks": {"name": "Child"}}], "tasks[0].tasks must be a list"),
+    ],
+)
+def test_normalize_invalid(tasks, message):
+    with pytest.raises(InvalidTaskTreeException, match=message.replace("[", r"\[").replace("]", r"\]")):
+        TaskTreeValidator().normalize(tasks)
+
+
+# Test the depth, node count and byte limits
+def test_limits():
+    deep = []
+    level = deep
+    for depth in range(50):
+        level.append({"name": f"Level {depth}", "tasks": []})
+        level = level[0]["tasks"]
+
+    with pytest.raises(TaskTreeTooLargeException):
+        TaskTreeValidator(max_depth=10).normalize(deep)
+    assert len(json.loads(TaskTreeValidator(max_depth=50).dumps(deep))) == 1
+
+    wide = [{"name": f"Task {index}"} for index in range(20)]
+    with pytest.raises(TaskTreeTooLargeException):
+        TaskTreeValidator(max_nodes=10).normalize(wide)
+
+    with pytest.raises(TaskTreeTooLargeException):
+        TaskTreeValidator(max_bytes=100).dumps(wide)
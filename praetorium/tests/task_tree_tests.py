@@ -0,0 +1,36 @@
+from app.ai.providers import StubDecompositionProvider
+from app.task_tree import find_task, ancestor_names, children_json_path
+
+TREE = [
+    {
+        "name": "Implement Authentication",
+        "tasks": [
+            {"name": "Login Screen", "tasks": []},
+            {"name": "Signup Flow", "tasks": [{"name": "Email verification", "tasks": []}]},
+        ],
+    }
+]
+
+
+# Test following paths down the tree
+def test_find_task():
+    assert find_task(TREE, [0])["name"] == "Implement Authentication"
+    assert find_task(TREE, [0, 1, 0])["name"] == "Email verification"
+    assert find_task(TREE, [0, 5]) is None
+    assert find_task(TREE, [1]) is None
+    assert find_task(TREE, [0, -1]) is None
+
+
+# Test the ancestor context and the Postgres path of a task's children
+def test_ancestors_and_json_path():
+    assert ancestor_names(TREE, [0, 1, 0]) == ["Implement Authentication", "Signup Flow"]
+    assert ancestor_names(TREE, [0]) == []
+    assert children_json_path([0, 1]) == ["0", "tasks", "1", "tasks"]
+
+
+# Test that the stub provider streams subtasks one node at a time
+def test_stub_provider_streams_subtasks():
+    stream = StubDecompositionProvider(latency_ms=0).expand_task(TREE[0]["tasks"][0], ["Implement Authentication"])
+
+    assert next(stream)["name"] == "Scope Login Screen"
+    assert [node["name"] for node in stream] == ["Implement Login Screen", "Verify Login Screen"]
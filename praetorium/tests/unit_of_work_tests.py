@@ -0,0 +1,89 @@
+from app import postgresql_utils
+from app.postgresql_utils import MinervaCursor, UnitOfWork
+import pytest
+
+EMAIL = "testuser@example.com"
+
+
+@pytest.fixture(autouse=True)
+def cleanup():
+    yield
+    with MinervaCursor() as cur:
+        cur.execute("DELETE FROM projects.saved_projects WHERE project_name LIKE 'Unit Project%';")
+
+
+def insert_project(name: str) -> None:
+    with MinervaCursor() as cur:
+        cur.execute(
+            "INSERT INTO projects.saved_projects (email, project_name, project_description, tasks) "
+            "VALUES (%s, %s, '', '[]');",
+            (EMAIL, name),
+        )
+
+
+def project_names() -> set:
+    with MinervaCursor() as cur:
+        cur.execute("SELECT project_name FROM projects.saved_projects WHERE email = %s;", (EMAIL,))
+        return {row["project_name"] for row in cur.fetchall()}
+
+
+def backend_pid(read_only: bool = False) -> int:
+    with MinervaCursor(read_only=read_only) as cur:
+        cur.execute("SELECT pg_backend_pid() AS pid;")
+        return cur.fetchone()["pid"]
+
+
+# Test that cursors in a unit share a connection and commit together
+def test_unit_of_work_commits_once(setup_user):
+    with UnitOfWork():
+        assert backend_pid() == backend_pid(read_only=True)
+        insert_project("Unit Project 1")
+        insert_project("Unit Project 2")
+        assert {"Unit Project 1", "Unit Project 2"} <= project_names(), "The unit sees its own writes"
+
+    assert {"Unit Project 1", "Unit Project 2"} <= project_names()
+
+
+# Test that a failed block only rolls back its own savepoint
+def test_failed_block_rolls_back_to_savepoint(setup_user):
+    with UnitOfWork():
+        insert_project("Unit Project Kept")
+        with pytest.raises(Exception):
+            with MinervaCursor() as cur:
+                cur.execute(
+                    "INSERT INTO projects.saved_projects (email, project_name, project_description, tasks) "
+                    "VALUES (%s, %s, '', '[]');",
+                    (EMAIL, "Unit Project Lost"),
+                )
+                cur.execute("SELECT 1 / 0;")
+        insert_project("Unit Project After")
+
+    names = project_names()
+    assert {"Unit Project Kept", "Unit Project After"} <= names
+    assert "Unit Project Lost" not in names
+
+
+# Test that an error escaping the unit rolls back all of its work
+def test_unit_of_work_rolls_back(setup_user):
+    with pytest.raises(RuntimeError):
+        with UnitOfWork():
+            insert_project("Unit Project Rolled Back")
+            raise RuntimeError("Abandon the unit")
+
+    assert "Unit Project Rolled Back" not in project_names()
+
+
+# Test that a request checks out a single connection
+def test_request_uses_one_connection(client, setup_test_data, auth_headers, monkeypatch):
+    checkouts = []
+    getconn = postgresql_utils.minerva_pools.getconn
+
+    def counting_getconn(name, **kwargs):
+        checkouts.append(name)
+        return getconn(name, **kwargs)
+
+    monkeypatch.setattr(postgresql_utils.minerva_pools, "getconn", counting_getconn)
+
+    response = client.get("/projects/stats", headers=auth_headers)
+    assert response.status_code == 200
+    assert len(checkouts) == 1
@@ -0,0 +1,73 @@
+import pytest
+from app.db_table_specs.minerva_auth_specs import Users, EmailDoesNotExistException
+from app.postgresql_utils import MinervaCursor
+from app.user_cache import UserCache, user_cache
+
+
+# Test hits, negative caching and invalidation through Users
+def test_user_cache(setup_user):
+    cache = UserCache(ttl_seconds=60, negative_ttl_seconds=60)
+    Users.on_change(cache.invalidate)
+
+    profile = cache.get("testuser@example.com")
+    assert profile["email"] == "testuser@example.com"
+    assert "password_hash" not in profile, "Password hashes must not be cached"
+    assert cache.get("testuser@example.com") == profile
+    assert cache.get("nobody@example.com") is None
+    assert cache.get("nobody@example.com") is None
+    assert cache.report()["hits"] == 1
+    assert cache.report()["negative_hits"] == 1
+
+    with pytest.raises(EmailDoesNotExistException):
+        cache.require("nobody@example.com")
+
+    Users.update_plan("testuser@example.com", "pro")
+    assert cache.get("testuser@example.com")["plan"] == "pro", "A plan change must invalidate the cached profile"
+
+    with pytest.raises(EmailDoesNotExistException):
+        Users.update_plan("nobody@example.com", "pro")
+
+    Users.change_listeners.remove(cache.invalidate)
+
+
+# Test that login warms the cache
+def test_login_warms_cache(client, setup_user):
+    user_cache.invalidate("testuser@example.com")
+
+    response = client.post("/auth/login", json={"email": "testuser@example.com", "password": "TestPassword123!"})
+    assert response.status_code == 200
+    assert "testuser@example.com" in user_cache.entries
+
+
+# Test that only admins change plans, and a change is seen at once
+def test_plan_route(client, setup_user, auth_headers):
+    change = {"email": "testuser@example.com", "plan": "team"}
+    response = client.put("/auth/plan", json=change, headers=auth_headers)
+    assert response.status_code == 403
+
+    with MinervaCursor() as cur:
+        cur.execute("UPDATE auth.users SET role = 'admin' WHERE email = %s;", ("testuser@example.com",))
+    user_cache.invalidate("testuser@example.com")
+
+    response = client.put("/auth/plan", json=change, headers=auth_headers)
+    assert response.status_code == 200
+    assert user_cache.require("testuser@example.com")["plan"] == "team"
+
+    response = client.put("/auth/plan", json={"email": "nobody@example.com", "plan": "team"}, headers=auth_headers)
+    assert response.status_code == 404
+    response = client.put("/auth/plan", json={"email": "testuser@example.com"}, headers=auth_headers)
+    assert response.status_code == 400
+
+
+# Test that invalidations are remembered only as far as max_entries, and a load
+# older than a forgotten invalidation is not cached
+def test_bounded_invalidations():
+    cache = UserCache(max_entries=2)
+    for email in ("first@example.com", "second@example.com", "third@example.com"):
+        cache.invalidate(email)
+    assert list(cache.invalidated) == ["second@example.com", "third@example.com"]
+
+    cache._store("first@example.com", None, generation=0)
+    assert "first@example.com" not in cache.entries, "It may have been invalidated after this load"
+    cache._store("first@example.com", None, generation=cache.generation)
+    assert "first@example.com" in cache.entries
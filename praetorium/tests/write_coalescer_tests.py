@@ -0,0 +1,113 @@
+import threading
+import time
+from app.write_coalescer import WriteCoalescer
+
+
+# Test that edits inside one window collapse into a single merged write
+def test_edits_are_coalesced():
+    writes = []
+    coalescer = WriteCoalescer(lambda key, fields: writes.append((key, fields)), window_seconds=60)
+
+    coalescer.submit(("a@example.com", 1), project_name="First", tasks=None)
+    coalescer.submit(("a@example.com", 1), project_name=None, tasks="[1]")
+    coalescer.submit(("a@example.com", 1), project_name="Second", tasks=None)
+    assert writes == []
+
+    # A read flushes the pending edits first
+    coalescer.flush(("a@example.com", 1))
+    assert writes == [(("a@example.com", 1), {"project_name": "Second", "tasks": "[1]"})]
+
+    report = coalescer.report()
+    assert report["submitted"] == 3
+    assert report["flushed"] == 1
+    assert report["saved"] == 2
+    assert report["pending"] == 0
+
+
+# Test that flush_matching only touches the selected keys
+def test_flush_matching():
+    writes = []
+    coalescer = WriteCoalescer(lambda key, fields: writes.append(key), window_seconds=60)
+
+    coalescer.submit(("a@example.com", 1), tasks="[]")
+    coalescer.submit(("b@example.com", 1), tasks="[]")
+    coalescer.flush_matching(lambda key: key[0] == "a@example.com")
+
+    assert writes == [("a@example.com", 1)]
+    assert coalescer.report()["pending"] == 1
+
+
+# Test that the background thread flushes once the window closes
+def test_window_expiry_flushes():
+    flushed = threading.Event()
+    coalescer = WriteCoalescer(lambda key, fields: flushed.set(), window_seconds=0.01)
+
+    coalescer.submit(("a@example.com", 1), tasks="[]")
+
+    assert flushed.wait(timeout=2)
+
+
+# Test that a write arriving during a flush lands after it
+def test_writes_for_one_key_stay_ordered():
+    writes = []
+    started = threading.Event()
+
+    def slow_write(key, fields):
+        started.set()
+        time.sleep(0.05)
+        writes.append(fields["project_name"])
+
+    coalescer = WriteCoalescer(slow_write, window_seconds=60)
+    coalescer.submit(("a@example.com", 1), project_name="old")
+
+    flusher = threading.Thread(target=coalescer.flush, args=(("a@example.com", 1),))
+    flusher.start()
+    started.wait()
+    coalescer.submit(("a@example.com", 1), project_name="new")
+    coalescer.flush(("a@example.com", 1))
+    flusher.join()
+
+    assert writes == ["old", "new"]
+
+
+# Test that a zero window writes synchronously
+def test_disabled_coalescer_writes_immediately():
+    writes = []
+    coalescer = WriteCoalescer(lambda key, fields: writes.append(fields), window_seconds=0)
+
+    coalescer.submit(("a@example.com", 1), project_name="Now")
+
+    assert not coalescer.enabled
+    assert writes == [{"project_name": "Now"}]
+
+
+# Test that a failed write is retried under newer edits, then reported
+def test_failed_writes_are_retried_then_reported():
+    attempts, failures = [], []
+
+    def failing_write(key, fields):
+        attempts.append(dict(fields))
+        raise ValueError("Minerva is down")
+
+    coalescer = WriteCoalescer(
+        failing_write, window_seconds=60, max_attempts=2, on_failure=lambda key, e: failures.append((key, str(e)))
+    )
+    coalescer.submit(("a@example.com", 1), project_name="old", tasks="[]")
+    try:
+        coalescer.flush(("a@example.com", 1))
+    except ValueError:
+        pass
+    assert coalescer.report()["pending"] == 1, "The edits are put back"
+    assert failures == []
+
+    coalescer.submit(("a@example.com", 1), project_name="new")
+    try:
+        coalescer.flush(("a@example.com", 1))
+    except ValueError:
+        pass
+    assert attempts[-1] == {"project_name": "new", "tasks": "[]"}, "Newer edits win over the retried ones"
+    assert failures == [(("a@example.com", 1), "Minerva is down")]
+
+    report = coalescer.report()
+    assert (report["pending"], report["retried"], report["failed"]) == (0, 1, 2)
+    assert coalescer.key_locks == {}, "Idle keys do not keep a lock"